@@ -1,11 +1,19 @@
 from ultralytics import YOLO
 import matplotlib.pyplot as plt
 import matplotlib
+from label_cache import use_label_cache
+from making_pictures.synthetic_stream import use_synthetic_stream
 
 matplotlib.rc('font', family='SimHei')
 plt.rcParams['axes.unicode_minus'] = False
 
+# 训练集里现做的合成缺陷图占比 (making_pictures/synthetic_stream.py，不落盘、每个 epoch 都是新的)；0 表示不用
+synthetic_ratio = 0.0
+
 def main():
+    # 转换脚本写了标签缓存时直接读取，不再逐个扫描 labels/*.txt
+    use_label_cache()
+    use_synthetic_stream(synthetic_ratio)
     model = YOLO('yolov8m.pt') 
     # test yolov8m
     # yolov8m.pt,yolov8l.pt,yolov8x.pt
@@ -0,0 +1,217 @@
+import os
+import json
+from collections import Counter, defaultdict
+from convert_pool import run_tasks
+from image_index import ImageIndex, IMAGE_EXTS
+from image_header import image_size
+from labelme_reader import read_labelme
+
+# 数据集体检：检查转换输出的 data/ 和源标注文件夹
+# 图片尺寸只读文件头 (image_header.py)，不解码像素，几万张图几秒钟就能扫完。
+# 检查项：
+#   - 孤立文件：有标签没图片 (标签会被 YOLO 忽略)、有图片没标签 (会被当成背景图)
+#   - 标签内容：读不出来 (不是 UTF-8 等)、空文件、格式错误、类别 ID 越界、坐标超出 0~1、宽高 <= 0
+#   - 图片：文件头读不出来 (损坏或格式不对)
+#   - 源标注：JSON 里写的宽高 (LabelMe 的 imageWidth/imageHeight、ISAT 的 info.width/height)
+#     和真实图片不一致 —— 转换时按 JSON 的宽高归一化，不一致时框的位置就是错的
+
+# ================= 配置区域 =================
+# 1. 转换输出的数据集 (里面是 images/ 和 labels/)，不检查填 None
+DATA_DIR = r'D:\Documaents\Adobe\data'
+
+# 2. 源标注文件夹 (会递归查找 .json)，不检查填 None
+LABELME_DIR = r'D:\Downloads\Compressed\bamboo_saw\labeled\X-L'
+ISAT_DIR = r'D:\Downloads\Compressed\bamboo_saw\labeled\Final'
+
+# 3. 原图文件夹 (检查源标注时用)
+IMAGES_SOURCE_DIR = r'D:\Downloads\Compressed\bamboo_saw\labeled\images'
+
+# 4. 类别数量 (和 bamboo.yaml 的 nc 一致)
+NUM_CLASSES = 4
+
+# 5. 每类问题最多打印几条 (全部明细写进 REPORT_FILE)
+MAX_PRINT = 10
+REPORT_FILE = 'check_report.txt'
+
+# 6. 并行进程数：1 为串行，0 为使用全部 CPU 核
+NUM_WORKERS = 0
+# ===========================================
+
+SPLITS = ('train', 'val')
+
+PROBLEM_NAMES = {
+    'orphan_label': '有标签没图片',
+    'background': '有图片没标签 (背景图)',
+    'empty_label': '空标签文件',
+    'bad_label_file': '标签文件无法读取 (编码不对或文件损坏)',
+    'bad_line': '标签格式错误',
+    'bad_class': '类别 ID 越界',
+    'out_of_range': '坐标超出 0~1',
+    'bad_box': '宽或高 <= 0',
+    'bad_image': '图片文件头无法读取',
+    'missing_image': '源标注找不到图片',
+    'bad_json': '源标注无法读取',
+    'no_size': '源标注缺少宽高',
+    'size_mismatch': '源标注宽高和图片不一致',
+}
+
+# 子进程里用到的原图索引 (由 init_worker 注入)
+_image_index = None
+
+
+def init_worker(image_index):
+    global _image_index
+    _image_index = image_index
+
+
+def check_label(label_path):
+    problems = []
+    try:
+        with open(label_path, 'r', encoding='utf-8') as f:
+            lines = [line for line in f if line.strip()]
+    except (OSError, UnicodeError) as e:
+        # 不是 UTF-8 文本 (比如误存成了 GBK、混进了二进制文件) 或者读不了，记一条，不让整个检查中断
+        return [('bad_label_file', f"{label_path} {e}")]
+    if not lines:
+        return [('empty_label', label_path)]
+    for n, line in enumerate(lines, 1):
+        parts = line.split()
+        try:
+            c = int(parts[0])
+            values = [float(v) for v in parts[1:]]
+        except ValueError:
+            problems.append(('bad_line', f"{label_path}:{n}"))
+            continue
+        # 检测框是 5 列；分割多边形是 1 + 偶数列 (至少 3 个点)
+        if len(values) != 4 and (len(values) < 6 or len(values) % 2):
+            problems.append(('bad_line', f"{label_path}:{n}"))
+            continue
+        if not 0 <= c < NUM_CLASSES:
+            problems.append(('bad_class', f"{label_path}:{n} 类别 {c}"))
+        if any(v < 0 or v > 1 for v in values):
+            problems.append(('out_of_range', f"{label_path}:{n} {line.strip()}"))
+        if len(values) == 4 and (values[2] <= 0 or values[3] <= 0):
+            problems.append(('bad_box', f"{label_path}:{n} {line.strip()}"))
+    return problems
+
+
+def check_output(image_path, label_path):
+    problems = []
+    if image_size(image_path) is None:
+        problems.append(('bad_image', image_path))
+    if label_path:
+        problems += check_label(label_path)
+    return problems
+
+
+def find_source_image(json_path, name_in_json, prefer_name):
+    """和转换脚本一样的查找顺序：ISAT 先按 info.name，LabelMe 先按 JSON 文件名"""
+    stem = os.path.splitext(os.path.basename(json_path))[0]
+    name = os.path.basename(name_in_json.replace('\\', '/')) if name_in_json else None
+    if prefer_name and name:
+        return _image_index.get(name) or _image_index.find(stem, IMAGE_EXTS)
+    found = _image_index.find(stem, IMAGE_EXTS)
+    if not found and name:
+        found = _image_index.get(name)
+    return found
+
+
+def check_source(json_path, kind):
+    try:
+        if kind == 'labelme':
+            data = read_labelme(json_path, keys=('imageWidth', 'imageHeight', 'imagePath'))
+            w, h, name = data.get('imageWidth'), data.get('imageHeight'), data.get('imagePath')
+        else:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                info = json.load(f).get('info', {})
+            w, h, name = info.get('width'), info.get('height'), info.get('name')
+    except Exception as e:
+        return [('bad_json', f"{json_path} ({e})")]
+
+    image_path = find_source_image(json_path, name, prefer_name=(kind == 'isat'))
+    if not image_path:
+        return [('missing_image', json_path)]
+    if w is None or h is None:
+        return [('no_size', json_path)]
+    real = image_size(image_path)
+    if real is None:
+        return [('bad_image', image_path)]
+    if tuple(real) != (w, h):
+        return [('size_mismatch', f"{json_path}: JSON {w}x{h}，图片 {real[0]}x{real[1]} ({image_path})")]
+    return []
+
+
+def check_one(task):
+    kind = task[0]
+    if kind == 'output':
+        problems = check_output(task[1], task[2])
+    else:
+        problems = check_source(task[1], kind)
+    return {'status': 'problem' if problems else 'ok', 'problems': problems}
+
+
+def list_files(directory, exts):
+    if not os.path.isdir(directory):
+        return {}
+    with os.scandir(directory) as it:
+        return {os.path.splitext(e.name)[0]: e.path for e in it if e.is_file() and e.name.lower().endswith(exts)}
+
+
+def collect_tasks(found):
+    """找孤立文件只需要比对文件名，直接在主进程做；需要读文件的检查交给进程池"""
+    tasks = []
+    if DATA_DIR:
+        for split in SPLITS:
+            images = list_files(os.path.join(DATA_DIR, 'images', split), tuple(IMAGE_EXTS))
+            labels = list_files(os.path.join(DATA_DIR, 'labels', split), ('.txt',))
+            for stem, path in sorted(labels.items()):
+                if stem not in images:
+                    found['orphan_label'].append(path)
+            for stem, path in sorted(images.items()):
+                if stem not in labels:
+                    found['background'].append(path)
+                tasks.append(('output', path, labels.get(stem)))
+    for kind, root_dir in [('labelme', LABELME_DIR), ('isat', ISAT_DIR)]:
+        if not root_dir:
+            continue
+        for root, dirs, files in os.walk(root_dir):
+            tasks += [(kind, os.path.join(root, f)) for f in sorted(files) if f.endswith('.json')]
+    return tasks
+
+
+def main():
+    found = defaultdict(list)
+    tasks = collect_tasks(found)
+    print(f"共 {len(tasks)} 个文件待检查...")
+
+    image_index = None
+    if LABELME_DIR or ISAT_DIR:
+        image_index = ImageIndex.load_or_build(IMAGES_SOURCE_DIR)
+
+    def on_result(task, result, stats):
+        for kind, msg in result['problems']:
+            found[kind].append(msg)
+
+    stats = run_tasks(check_one, tasks, NUM_WORKERS, on_result=on_result,
+                      initializer=init_worker, initargs=(image_index,))
+
+    counts = Counter({kind: len(msgs) for kind, msgs in found.items()})
+    print(f"\n检查完毕：{stats['ok']} 个文件没有问题，{stats['problem']} 个文件有问题")
+    for kind, name in PROBLEM_NAMES.items():
+        if not counts[kind]:
+            continue
+        print(f"[{name}] {counts[kind]} 个")
+        for msg in found[kind][:MAX_PRINT]:
+            print(f"    {msg}")
+        if counts[kind] > MAX_PRINT:
+            print(f"    ... 其余见 {REPORT_FILE}")
+
+    with open(REPORT_FILE, 'w', encoding='utf-8') as f:
+        for kind, name in PROBLEM_NAMES.items():
+            for msg in found[kind]:
+                f.write(f"{name}\t{msg}\n")
+    print(f"明细已写入: {REPORT_FILE}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+# 多进程转换引擎：json2yolo / json2yolo_isat / xmltoyolo 共用
+# 每个任务的处理函数必须定义在模块顶层 (Windows 下子进程是重新 import 脚本的)，
+# 并返回一个 dict，其中 'status' 字段用于统计，'msg' 字段 (可选) 由主进程按顺序打印
+
+
+def resolve_workers(num_workers):
+    """num_workers <= 0 或 None 表示使用全部 CPU 核"""
+    if not num_workers or num_workers < 0:
+        return os.cpu_count() or 1
+    return num_workers
+
+
+def iter_results(func, tasks, num_workers=1, chunksize=None, initializer=None, initargs=(), desc=None):
+    """按 tasks 的原始顺序逐个产出 func(task) 的结果"""
+    tasks = list(tasks)
+    num_workers = min(resolve_workers(num_workers), max(1, len(tasks)))
+
+    if num_workers == 1:
+        # 串行路径：在当前进程里完成初始化，保证和并行路径走同一套代码
+        if initializer is not None:
+            initializer(*initargs)
+        for task in tqdm(tasks, total=len(tasks), desc=desc):
+            yield func(task)
+        return
+
+    # 分片大小：每个进程大约分到 8 片，既能均衡负载又不会频繁通信
+    if chunksize is None:
+        chunksize = max(1, len(tasks) // (num_workers * 8))
+
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=initializer, initargs=initargs) as executor:
+        # executor.map 本身就是按提交顺序返回的，结果边算边流回主进程
+        for result in tqdm(executor.map(func, tasks, chunksize=chunksize), total=len(tasks), desc=desc):
+            yield result
+
+
+def run_tasks(func, tasks, num_workers=1, on_result=None, **kwargs):
+    """
+    跑完全部任务并汇总计数器
+    on_result(task, result, stats): 每拿到一个结果就在主进程里回调一次 (用来打印警告、收集记录等)
+    返回 Counter，例如 {'ok': 120, 'missing': 3}
+    """
+    tasks = list(tasks)
+    stats = Counter()
+    for task, result in zip(tasks, iter_results(func, tasks, num_workers, **kwargs)):
+        stats[result['status']] += 1
+        if on_result is not None:
+            on_result(task, result, stats)
+        elif result.get('msg'):
+            print(result['msg'])
+    return stats
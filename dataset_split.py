@@ -0,0 +1,126 @@
+import os
+import json
+import hashlib
+from collections import Counter, defaultdict
+
+# 稳定的 train/val 划分
+# 每张图按自己的“身份” (图片文件名) 算一个哈希，落在 [0, 1) 里，小于比例就进 train。
+# 和 random.shuffle 按位置切分不同，新增图片不会让已有图片换边，下游的缓存也就不会全部失效。
+# 可选按类别分层：每张图归到它目标数最多的类别，不同类别可以有各自的目标比例。
+# 可选按近似重复分组 (dedup.py 生成)：同一组的图片都用组代表的文件名、按总体比例算哈希，整组落在同一边。
+
+
+def hash_fraction(key, salt=''):
+    """把字符串稳定地映射到 [0, 1)，与进程、机器、Python 版本都无关"""
+    digest = hashlib.sha1((salt + key).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') / 2.0 ** 64
+
+
+def primary_class(class_ids):
+    """分层用的类别：目标数最多的类别，数量相同时取 ID 小的；没有目标返回 None"""
+    if not class_ids:
+        return None
+    counts = Counter(class_ids)
+    return min(counts, key=lambda c: (-counts[c], c))
+
+
+def target_ratio(split_ratio, stratum=None, class_ratios=None):
+    if class_ratios and stratum in class_ratios:
+        return class_ratios[stratum]
+    return split_ratio
+
+
+def assign_split(key, split_ratio, stratum=None, class_ratios=None, salt='', group=None):
+    """
+    key 一般用图片文件名；class_ratios 是 {类别ID: 该类的 train 比例}
+    group 是近似重复组的组代表 (不在组里为 None)：组内成员的主要类别可能不同，各按各的类别比例会让一组跨到两边，
+    所以整组只用组代表算一次哈希、用总体比例，每个成员得到的都一样
+    """
+    if group is not None:
+        key, stratum = group, None
+    ratio = target_ratio(split_ratio, stratum, class_ratios)
+    return 'train' if hash_fraction(key, salt) < ratio else 'val'
+
+
+def load_dedup_groups(path):
+    """
+    读取 dedup.py 写的分组文件，返回 {图片文件名: 组代表的文件名} (只包含有重复的图片)
+    组代表是组内文件名最小的一张，只用来给整组算划分的哈希 (和有没有标注无关，所以划分稳定)；
+    去重时保留哪一张见 pick_representatives
+    path 为空或文件不存在时返回空 dict
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        groups = json.load(f)['groups']
+    return {name: group[0] for group in groups for name in group}
+
+
+
+def pick_representatives(dedup_groups, labeled):
+    """
+    drop_duplicates 用：每组保留哪一张
+    dedup_groups 是 load_dedup_groups 的结果，labeled 是转换后确实有标签的图片文件名
+    每组保留有标签的成员里文件名最小的一张，返回 {组员: 保留的那张}；整组都没有标签的组不在结果里 (一张都不去掉)
+    """
+    members = defaultdict(list)
+    for name, group in dedup_groups.items():
+        members[group].append(name)
+    keep = {}
+    for names in members.values():
+        rep = min((name for name in names if name in labeled), default=None)
+        if rep is not None:
+            keep.update(dict.fromkeys(names, rep))
+    return keep
+
+class SplitReport:
+    """
+    统计实际划分结果和目标比例的偏差
+    近似重复组里的图片整组按总体比例划分 (见 assign_split)，不计入各类别，单独算一行，目标是总体比例
+    """
+
+    def __init__(self, split_ratio, class_ratios=None, class_names=None):
+        self.split_ratio = split_ratio
+        self.class_ratios = class_ratios or {}
+        self.class_names = class_names or {}
+        self.counts = defaultdict(Counter)
+        self.grouped = Counter()
+
+    def add(self, split, stratum=None, grouped=False):
+        if grouped:
+            self.grouped[split] += 1
+        else:
+            self.counts[stratum][split] += 1
+
+    def rows(self):
+        """[(名称, Counter, 目标 train 比例), ...]，第一行是全部"""
+        total = Counter(self.grouped)
+        for c in self.counts.values():
+            total.update(c)
+        n = total['train'] + total['val']
+        if not n:
+            return []
+        rows = []
+        expected = 0.0
+        for stratum in sorted(self.counts, key=lambda s: (s is None, s)):
+            name = '无目标' if stratum is None else self.class_names.get(stratum, str(stratum))
+            c = self.counts[stratum]
+            target = target_ratio(self.split_ratio, stratum, self.class_ratios)
+            expected += target * (c['train'] + c['val'])
+            rows.append((name, c, target))
+        if self.grouped:
+            expected += self.split_ratio * (self.grouped['train'] + self.grouped['val'])
+            rows.append(('近似重复组', self.grouped, self.split_ratio))
+        # 整体的目标是各行目标按图片数加权
+        rows.insert(0, ('全部', total, expected / n))
+        return rows
+
+    def print(self):
+        rows = self.rows()
+        if not rows:
+            return
+        print("划分偏差 (实际 train 比例 vs 目标):")
+        for name, c, target in rows:
+            m = c['train'] + c['val']
+            realized = c['train'] / m
+            print(f"  {name:<8} 共 {m:>6} 张  train {realized:6.1%}  目标 {target:6.1%}  偏差 {(realized - target) * 100:+.1f} 个百分点")
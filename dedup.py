@@ -0,0 +1,215 @@
+import os
+import json
+import hashlib
+import cv2
+import numpy as np
+from convert_pool import run_tasks
+from image_index import ImageIndex, IMAGE_EXTS, DEFAULT_CACHE_DIR
+from image_header import image_size
+
+# 近似重复图片检测 (在转换/划分之前运行)
+# bamboo_saw 里有大量连拍的几乎一样的图片，如果它们分别落在 train 和 val 两边，val 的 mAP 就会虚高。
+# 1. 每张图算一个 64 位感知哈希 (pHash：缩到 32x32 灰度做 DCT，取低频 8x8 和中位数比较)，
+#    存成 uint64 数组并缓存，图片没变就不重算
+# 2. 汉明距离 <= HAMMING_THRESHOLD 视为近似重复。把 64 位切成 HAMMING_THRESHOLD + 1 段，
+#    两个哈希距离不超过阈值时至少有一段完全相同 (抽屉原理)，所以只需要比较同一个桶里的候选对，
+#    再用向量化的 popcount 精确验证，十万张图也只要几秒
+# 3. 并查集把近似重复连成组，写出分组文件；转换脚本读它，同组的图片整组落在 train 或 val 一边，
+#    也可以每组只保留一张 (drop_duplicates，保留组里有标注的成员中文件名最小的一张)
+
+# ================= 配置区域 =================
+# 1. 原图文件夹
+IMAGES_SOURCE_DIR = r'D:\Downloads\Compressed\bamboo_saw\labeled\images'
+
+# 2. 汉明距离阈值 (64 位里最多几位不同算作近似重复)，一般 4~10；越大合并得越狠
+HAMMING_THRESHOLD = 6
+
+# 3. 分组文件输出路径 (转换脚本里 dedup_groups_file 填同一个路径)
+GROUPS_FILE = r'D:\Documaents\Adobe\dedup_groups.json'
+
+# 4. 并行进程数：1 为串行，0 为使用全部 CPU 核
+NUM_WORKERS = 0
+# ===========================================
+
+HASH_SIZE = 32  # DCT 输入边长
+LOW_FREQ = 8    # 取左上角 8x8 低频 -> 64 位
+
+
+def _reduced_gray_flag(path):
+    """大图直接按 1/2、1/4、1/8 解码灰度图，解码后不小于 DCT 需要的尺寸就行"""
+    size = image_size(path)
+    if size is None:
+        return cv2.IMREAD_GRAYSCALE
+    scale = min(size) / (HASH_SIZE * 4)
+    for factor, flag in [(8, cv2.IMREAD_REDUCED_GRAYSCALE_8), (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                         (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)]:
+        if scale >= factor:
+            return flag
+    return cv2.IMREAD_GRAYSCALE
+
+
+def phash(path):
+    """64 位感知哈希 (int)，图片无法解码时返回 None"""
+    img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), _reduced_gray_flag(path))
+    if img is None:
+        return None
+    img = cv2.resize(img, (HASH_SIZE, HASH_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(img)[:LOW_FREQ, :LOW_FREQ].ravel()
+    bits = low > np.median(low[1:])  # 不算直流分量，整体亮度变化不影响哈希
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hash_one(task):
+    path = task
+    h = phash(path)
+    if h is None:
+        return {'status': 'bad_image', 'msg': f"[跳过] 图片无法解码: {path}"}
+    return {'status': 'ok', 'hash': h}
+
+
+def popcount64(x):
+    """uint64 数组逐元素数 1 的个数"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x)
+    # numpy < 2 没有 bitwise_count：按字节拆开数，再还原成输入的形状 (_bucket_pairs 传进来的是二维的)
+    x = np.ascontiguousarray(x, dtype=np.uint64)
+    return np.unpackbits(x.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1).reshape(x.shape)
+
+
+def _cache_path(directory):
+    digest = hashlib.sha1(os.path.abspath(directory).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(DEFAULT_CACHE_DIR, f'phash_{digest}.npz')
+
+
+def compute_hashes(directory, names):
+    """返回 (有效的文件名列表, uint64 哈希数组)；大小和修改时间没变的图片直接用缓存"""
+    cache_file = _cache_path(directory)
+    cached = {}
+    if os.path.exists(cache_file):
+        with np.load(cache_file) as c:
+            for name, size, mtime, h in zip(c['names'].tolist(), c['size'].tolist(),
+                                            c['mtime_ns'].tolist(), c['hashes'].tolist()):
+                cached[name] = (size, mtime, h)
+
+    stats = {name: os.stat(os.path.join(directory, name)) for name in names}
+    hashes = {}
+    todo = []
+    for name in names:
+        st = stats[name]
+        hit = cached.get(name)
+        if hit and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+            hashes[name] = hit[2]
+        else:
+            todo.append(name)
+    print(f"共 {len(names)} 张图片，缓存命中 {len(hashes)} 张，需要计算 {len(todo)} 张")
+
+    def on_result(task, result, counter):
+        if result['status'] == 'ok':
+            hashes[os.path.basename(task)] = result['hash']
+        elif result.get('msg'):
+            print(result['msg'])
+
+    run_tasks(hash_one, [os.path.join(directory, n) for n in todo], NUM_WORKERS, on_result=on_result)
+
+    valid = [n for n in names if n in hashes]
+    arr = np.array([hashes[n] for n in valid], dtype=np.uint64)
+    os.makedirs(DEFAULT_CACHE_DIR, exist_ok=True)
+    tmp_file = cache_file + '.tmp.npz'
+    np.savez(tmp_file, names=np.asarray(valid, dtype=str), hashes=arr,
+             size=np.array([stats[n].st_size for n in valid], dtype=np.int64),
+             mtime_ns=np.array([stats[n].st_mtime_ns for n in valid], dtype=np.int64))
+    os.replace(tmp_file, cache_file)
+    return valid, arr
+
+
+def _bucket_pairs(members, hashes, threshold, block_elems=1 << 22):
+    """桶内两两比较 (向量化的异或 + popcount)；大桶按行分块，内存不超过 block_elems 个元素"""
+    m = len(members)
+    h = hashes[members]
+    rows = max(1, block_elems // m)
+    out = []
+    for r0 in range(0, m - 1, rows):
+        r1 = min(m - 1, r0 + rows)
+        dist = popcount64(h[r0:r1, None] ^ h[None, :])
+        # 只要上三角 (j > i)
+        dist[np.arange(r1 - r0)[:, None] >= np.arange(m)[None, :] - r0] = 64
+        ii, jj = np.nonzero(dist <= threshold)
+        if len(ii):
+            a, b = members[ii + r0], members[jj]
+            out.append(np.stack([np.minimum(a, b), np.maximum(a, b)], axis=1))
+    return out
+
+
+def near_duplicate_pairs(hashes, threshold):
+    """返回 (i, j) 数组，满足 i < j 且汉明距离 <= threshold"""
+    n = len(hashes)
+    bands = threshold + 1
+    edges = np.linspace(0, 64, bands + 1).astype(np.uint64)
+    found = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        # 取出这一段的比特作为桶号
+        key = (hashes >> lo) & np.uint64((1 << int(hi - lo)) - 1)
+        order = np.argsort(key, kind='stable')
+        sorted_key = key[order]
+        starts = np.flatnonzero(np.r_[True, sorted_key[1:] != sorted_key[:-1]])
+        ends = np.r_[starts[1:], n]
+        for s, e in zip(starts.tolist(), ends.tolist()):
+            if e - s < 2:
+                continue
+            found += _bucket_pairs(order[s:e], hashes, threshold)
+    if not found:
+        return np.zeros((0, 2), dtype=np.int64)
+    # 同一对可能在多个段里都命中，去重
+    return np.unique(np.concatenate(found), axis=0)
+
+
+def union_groups(n, pairs):
+    """并查集，把两两相连的图片合并成组，只返回成员数 >= 2 的组 (组内按下标排序)"""
+    parent = list(range(n))
+
+    def find(x):
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    for a, b in pairs.tolist():
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+    groups = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+def main():
+    index = ImageIndex.load_or_build(IMAGES_SOURCE_DIR)
+    names = [n for n in index.names if os.path.splitext(n)[1].lower() in IMAGE_EXTS]
+    names, hashes = compute_hashes(IMAGES_SOURCE_DIR, names)
+
+    pairs = near_duplicate_pairs(hashes, HAMMING_THRESHOLD)
+    groups = union_groups(len(names), pairs)
+    # 组内按文件名排序，第一张作为组代表 (划分用它的文件名算哈希)；去重时保留的是组里有标签的成员中文件名最小的一张
+    groups = sorted(sorted(names[i] for i in g) for g in groups)
+
+    os.makedirs(os.path.dirname(os.path.abspath(GROUPS_FILE)), exist_ok=True)
+    tmp_file = GROUPS_FILE + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump({'directory': os.path.abspath(IMAGES_SOURCE_DIR), 'threshold': HAMMING_THRESHOLD,
+                   'groups': groups}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_file, GROUPS_FILE)
+
+    in_groups = sum(len(g) for g in groups)
+    print(f"\n近似重复 (汉明距离 <= {HAMMING_THRESHOLD}): {len(pairs)} 对，合并为 {len(groups)} 组，涉及 {in_groups} 张图片")
+    print(f"开启 drop_duplicates 时会去掉 {in_groups - len(groups)} 张")
+    for g in sorted(groups, key=len, reverse=True)[:5]:
+        print(f"  {len(g)} 张: {', '.join(g[:4])}{' ...' if len(g) > 4 else ''}")
+    print(f"分组已保存: {GROUPS_FILE}")
+    print("在 json2yolo / json2yolo_isat / xmltoyolo 里把 dedup_groups_file 设为上面的路径后重新转换")
+
+
+if __name__ == '__main__':
+    main()
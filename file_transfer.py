@@ -0,0 +1,149 @@
+import os
+import time
+import queue
+import shutil
+import threading
+from collections import Counter
+from materialize import materialize
+
+# 并发文件传输：网络共享盘、U 盘上串行 copy2 只能跑到设备带宽的一小部分，
+# 这里用几个线程同时复制 (文件 IO 会释放 GIL)，队列有上限，提交太快时 submit 会等一等，内存不会涨。
+# 调用方 submit 之后马上返回继续干自己的事 (解析标注、推理…)，复制在后台进行，最后 close() 等全部完成。
+# 所有数据集脚本共用：转换脚本、sort_images_by_json、sampling_image、auto_sort。
+
+# 网络盘 / FAT 文件系统的修改时间精度只有 2 秒，判断“已经是同一个文件”时放宽到这个范围
+MTIME_TOLERANCE_NS = 2_000_000_000
+
+
+def is_identical(src, dst):
+    """dst 已经是 src 的一份相同拷贝 (同一个硬链接，或者大小相同、修改时间一致)"""
+    try:
+        s, d = os.stat(src), os.stat(dst)
+    except OSError:
+        return False
+    if os.path.samestat(s, d):
+        return True
+    return s.st_size == d.st_size and abs(s.st_mtime_ns - d.st_mtime_ns) <= MTIME_TOLERANCE_NS
+
+
+class TransferEngine:
+    """
+    用法：
+        with TransferEngine(link_mode='copy', num_threads=8) as engine:
+            for src, dst in ...:
+                engine.submit(src, dst)            # 复制 (或按 link_mode 建链接)
+                engine.submit(src, dst, move=True) # 移动
+        # 退出 with 时等全部传输完成并打印汇总
+    """
+
+    def __init__(self, link_mode='copy', num_threads=8, queue_size=256, retries=3, retry_delay=0.5,
+                 skip_identical=True, progress_every=10.0, verbose=True):
+        self.link_mode = link_mode
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.skip_identical = skip_identical
+        self.progress_every = progress_every
+        self.verbose = verbose
+
+        self.stats = Counter()
+        self.bytes = 0
+        self.errors = []
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._start = time.perf_counter()
+        self._last_report = self._start
+        self._closed = False
+        self._threads = [threading.Thread(target=self._run, daemon=True) for _ in range(max(1, num_threads))]
+        for t in self._threads:
+            t.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def submit(self, src, dst, move=False):
+        """排队一个传输任务；队列满时阻塞，直到有线程空出来"""
+        if self._closed:
+            raise RuntimeError('TransferEngine 已经关闭')
+        self._queue.put((src, dst, move))
+
+    def _transfer(self, src, dst, move):
+        """返回 (结果, 字节数)"""
+        if move:
+            size = os.path.getsize(src)
+            shutil.move(src, dst)
+            return 'moved', size
+        if self.skip_identical and is_identical(src, dst):
+            return 'skipped', 0
+        used = materialize(src, dst, self.link_mode)
+        return ('copied', os.path.getsize(dst)) if used == 'copy' else ('linked', 0)
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            src, dst, move = task
+            result, size = 'failed', 0
+            try:
+                for attempt in range(self.retries + 1):
+                    try:
+                        result, size = self._transfer(src, dst, move)
+                        break
+                    except OSError as e:
+                        # 源文件不存在重试也没用；其他错误 (网络盘抖动、文件被占用) 等一会儿再试
+                        if attempt == self.retries or isinstance(e, FileNotFoundError):
+                            self._fail(src, dst, e)
+                            break
+                        with self._lock:
+                            self.stats['retried'] += 1
+                        time.sleep(self.retry_delay * 2 ** attempt)
+            except Exception as e:
+                # 参数错误 (link_mode 不对、路径类型不对) 之类重试也没用；记下来，线程继续处理后面的任务，
+                # 否则线程全死掉之后队列满了 submit/close 会一直卡住
+                self._fail(src, dst, e)
+            finally:
+                with self._lock:
+                    self.stats[result] += 1
+                    self.bytes += size
+                    now = time.perf_counter()
+                    if self.verbose and now - self._last_report >= self.progress_every:
+                        self._last_report = now
+                        print(f"[传输] {self.summary()}")
+
+    def _fail(self, src, dst, e):
+        with self._lock:
+            self.errors.append((src, dst, e))
+        if self.verbose:
+            print(f"[传输失败] {src} -> {dst}: {e}")
+
+    def throughput(self):
+        """平均传输速度 (字节/秒)"""
+        return self.bytes / max(time.perf_counter() - self._start, 1e-9)
+
+    def summary(self):
+        s = self.stats
+        done = s['copied'] + s['moved'] + s['linked']
+        parts = [f"完成 {done} 个", f"{self.bytes / 1e6:.1f} MB", f"{self.throughput() / 1e6:.1f} MB/s"]
+        if s['skipped']:
+            parts.append(f"已存在跳过 {s['skipped']} 个")
+        if s['retried']:
+            parts.append(f"重试 {s['retried']} 次")
+        if s['failed']:
+            parts.append(f"失败 {s['failed']} 个")
+        return '，'.join(parts)
+
+    def close(self):
+        """等队列里的传输全部完成，返回统计 Counter"""
+        if self._closed:
+            return self.stats
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+        if self.verbose and self.stats:
+            print(f"文件传输: {self.summary()}")
+        return self.stats
@@ -1,8 +1,22 @@
 import os
-import shutil
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+import torch
 from ultralytics import YOLO
 from tqdm import tqdm
 
+# 让子文件夹里的脚本也能 import 仓库根目录的公共模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from file_transfer import TransferEngine
+from image_header import image_size
+from letterbox_cache import reduced_flag
+from manifest import file_hash
+from prediction_cache import PredictionCache
+
 # ================= 配置 =================
 # 1. 刚才训练好的模型路径
 model_path = 'runs/classify/my_feature_cls/weights/best.pt'
@@ -17,58 +31,219 @@ output_dir = 'sorted_results'
 # 只有当模型非常确信(比如>0.8)时才自动归类，
 # 如果不确信(比如0.4)，最好放到一个 'unsure' 文件夹人工检查
 conf_threshold = 0.7 
+
+# 5. 移动还是复制 (True 移动，False 复制，原图留在 source_dir)
+move_files = True
+
+# 6. 后台搬文件的线程数 (推理不用等文件搬完就能处理下一张)
+transfer_threads = 4
+
+# 7. 流水线：解码线程读图 -> 凑满 batch_size 张一起推理 -> 搬文件线程按结果归类，三段同时进行
+batch_size = 32
+decode_threads = 4
+imgsz = 224          # 和训练时的 imgsz 一致
+torch_threads = 0    # PyTorch 的 CPU 线程数，0 表示用默认值 (一般是物理核数)
+
+# 8. 推理结果缓存 (prediction_cache.py)：按图片内容和模型文件的 hash 记下 top-k 概率，
+#    重跑 (被打断、或者只改了 conf_threshold) 时推理过的图片直接用缓存重新归类，只有新图/改过的图才过模型。
+#    移动模式下 output_dir 里上次已经归好类的图片也会按新阈值重新归类
+top_k = 5
+# 阈值附近 (conf_threshold ± near_margin) 的图片写进报告，方便调阈值、挑图人工复核
+near_margin = 0.1
+near_report_file = 'near_threshold.txt'
+# 只用缓存出报告 (不加载模型、不推理、不搬文件)
+report_only = False
 # =======================================
 
+IMAGE_EXTS = ('.jpg', '.png', '.jpeg', '.bmp')
+
+
+def decode(path):
+    """读图 (支持中文路径)；分类预处理按短边缩放到 imgsz，大 JPEG 直接按 1/2、1/4、1/8 解码"""
+    size = image_size(path)
+    flag = cv2.IMREAD_COLOR
+    if size is not None:
+        short = min(size)
+        flag = reduced_flag(short, short, imgsz)
+    return cv2.imdecode(np.fromfile(path, dtype=np.uint8), flag)
+
+
+def decode_batches(paths, prefetch=2):
+    """按批次产出 (路径列表, 图片列表)；始终提前排好 prefetch 个批次，推理这一批时后面的已经在解码"""
+    starts = iter(range(0, len(paths), batch_size))
+    pending = deque()
+    with ThreadPoolExecutor(decode_threads) as pool:
+        def submit_next():
+            start = next(starts, None)
+            if start is not None:
+                chunk = paths[start:start + batch_size]
+                pending.append((chunk, [pool.submit(decode, p) for p in chunk]))
+
+        for _ in range(prefetch):
+            submit_next()
+        while pending:
+            chunk, futures = pending.popleft()
+            submit_next()
+            yield chunk, [f.result() for f in futures]
+
+
+def collect_images(folders):
+    """返回 [(路径, 所在的输出子文件夹名；在 source_dir 里为 None)]"""
+    found = [(source_dir, None)] + [(os.path.join(output_dir, f), f) for f in folders]
+    images = []
+    for directory, folder in found:
+        if not os.path.isdir(directory):
+            continue
+        with os.scandir(directory) as it:
+            images += sorted((e.path, folder) for e in it if e.is_file() and e.name.lower().endswith(IMAGE_EXTS))
+    return images
+
+
+def image_hashes(cache, paths):
+    """每张图的内容 sha1；路径、大小、修改时间都没变的直接用缓存，其余多线程读文件计算"""
+    sha1s, todo = {}, []
+    for path in paths:
+        st = os.stat(path)
+        sha1 = cache.file_sha1(path, st)
+        if sha1:
+            sha1s[path] = sha1
+        else:
+            todo.append((path, st))
+    with ThreadPoolExecutor(decode_threads) as pool:
+        for (path, st), sha1 in zip(todo, pool.map(file_hash, [p for p, _ in todo])):
+            cache.put_file_sha1(path, st, sha1)
+            sha1s[path] = sha1
+    cache.commit()
+    return sha1s
+
+
+def target_folder(class_names, top_cls, top_conf):
+    """概率最高的类别够确信就归到它的文件夹，否则放进 unsure 人工检查"""
+    return class_names[top_cls[0]] if top_conf[0] >= conf_threshold else 'unsure'
+
+
+def write_near_report(class_names, preds):
+    near = [(abs(conf[0] - conf_threshold), path, cls, conf) for path, (cls, conf) in preds.items()
+            if abs(conf[0] - conf_threshold) <= near_margin]
+    near.sort()
+    with open(near_report_file, 'w', encoding='utf-8') as f:
+        # 每行: 归到的文件夹/文件名  top-k 类别:概率
+        for _, path, cls, conf in near:
+            top = '  '.join(f"{class_names[c]}:{p:.3f}" for c, p in zip(cls, conf))
+            f.write(f"{target_folder(class_names, cls, conf)}/{os.path.basename(path)}\t{top}\n")
+    print(f"阈值 {conf_threshold} ± {near_margin} 以内的图片 {len(near)} 张，已写入: {near_report_file}")
+    for _, path, cls, conf in near[:10]:
+        print(f"  {conf[0]:.3f} {class_names[cls[0]]:>10}  {os.path.basename(path)}")
+
+
 def main():
-    # 加载模型
-    model = YOLO(model_path)
-    
-    # 获取类别名称字典 {0: 'feature_A', 1: 'feature_B', ...}
-    class_names = model.names
+    cache = PredictionCache()
+    model_sha1 = file_hash(model_path)
+    class_names = cache.model_names(model_sha1) if report_only else None
+    model = None
+    if class_names is None:
+        if torch_threads:
+            torch.set_num_threads(torch_threads)
+        # 加载模型，获取类别名称字典 {0: 'feature_A', 1: 'feature_B', ...}
+        model = YOLO(model_path)
+        class_names = model.names
+        cache.put_model_names(model_sha1, class_names)
 
     # 预先创建输出文件夹
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    for name in class_names.values():
+    folders = list(class_names.values()) + ['unsure']
+    for name in folders:
         os.makedirs(os.path.join(output_dir, name), exist_ok=True)
-    os.makedirs(os.path.join(output_dir, 'unsure'), exist_ok=True)
-
-    # 获取所有图片
-    # 支持 jpg, png, bmp, jpeg
-    imgs = [f for f in os.listdir(source_dir) if f.lower().endswith(('.jpg', '.png', '.jpeg', '.bmp'))]
-    
-    print(f"准备处理 {len(imgs)} 张图片...")
-
-    # 批量推理 (stream=True 可以防止内存溢出)
-    # 这里的 batch=16 可以加快速度
-    results = model.predict(source=source_dir, stream=True, conf=0.5)
-
-    for result in results:
-        # 获取当前处理的图片路径
-        img_path = result.path
-        file_name = os.path.basename(img_path)
-        
-        # 获取预测概率最高的类别索引
-        probs = result.probs
-        top1_index = probs.top1
-        top1_conf = probs.top1conf.item() # 最高置信度
-        
-        # 获取类别名
-        class_name = class_names[top1_index]
-
-        # 决定目标文件夹
-        if top1_conf >= conf_threshold:
-            target_folder = os.path.join(output_dir, class_name)
-            print(f"[{class_name}] {top1_conf:.2f} -> {file_name}")
+
+    # 待分类的图片；移动模式下上次归好类的也一起 (阈值变了要换文件夹)
+    images = collect_images(folders if move_files else [])
+    location = dict(images)
+    # 复制模式下 output_dir 里已有的副本 {文件名: 文件夹}，归类变了要删掉旧副本
+    existing = {} if move_files else {os.path.basename(p): f for p, f in collect_images(folders) if f}
+
+    # 先查缓存：内容和模型都没变的图片不用再推理
+    sha1s = image_hashes(cache, [p for p, _ in images])
+    preds, todo = {}, []
+    for path, _ in images:
+        hit = cache.get(sha1s[path], model_sha1)
+        if hit:
+            preds[path] = hit
         else:
-            target_folder = os.path.join(output_dir, 'unsure')
-            print(f"[不确定] {top1_conf:.2f} -> {file_name}")
+            todo.append(path)
+    print(f"共 {len(images)} 张图片，缓存命中 {len(preds)} 张，需要推理 {len(todo)} 张")
+
+    if report_only:
+        if todo:
+            print(f"[提示] {len(todo)} 张还没有推理过，不在报告里")
+        write_near_report(class_names, preds)
+        cache.close()
+        return
+
+    counts = Counter()
+    moved = 0
+    bad = []
+    infer_time = 0.0
+    start = time.perf_counter()
+
+    def place(path, target):
+        nonlocal moved
+        counts[target] += 1
+        name = os.path.basename(path)
+        if location[path] == target:
+            return  # 已经在该在的文件夹
+        previous = existing.get(name)
+        if previous != target:
+            moved += 1
+            if previous:
+                os.remove(os.path.join(output_dir, previous, name))
+        # 移动文件 (如果你只想复制，把 move_files 改成 False)；目标里已有相同文件时引擎会跳过
+        dst = os.path.join(output_dir, target, name)
+        # 移动/copy2 不改大小和修改时间，新路径直接记上同一个 sha1，下次不用重新读文件
+        cache.put_file_sha1(dst, os.stat(path), sha1s[path])
+        engine.submit(path, dst, move=move_files)
+
+    with TransferEngine('copy', num_threads=transfer_threads) as engine:
+        # 1. 缓存命中的直接按当前阈值归类
+        for path, (top_cls, top_conf) in preds.items():
+            place(path, target_folder(class_names, top_cls, top_conf))
+
+        # 2. 其余的走流水线：解码线程读图 -> 整批推理 -> 写缓存、交给搬文件线程
+        if todo:
+            print(f"推理中 (batch={batch_size}，解码线程 {decode_threads}，PyTorch 线程 {torch.get_num_threads()})...")
+        with tqdm(total=len(todo), unit='张', disable=not todo) as bar:
+            for chunk, imgs in decode_batches(todo):
+                batch = [(p, im) for p, im in zip(chunk, imgs) if im is not None]
+                bad += [p for p, im in zip(chunk, imgs) if im is None]
+                if batch:
+                    # 一次传一整批 ndarray (BGR，和 ultralytics 自己读图一致)
+                    t = time.perf_counter()
+                    results = model.predict(source=[im for _, im in batch], imgsz=imgsz, verbose=False)
+                    infer_time += time.perf_counter() - t
 
-        # 移动文件 (如果你只想复制，把 move 改成 copy)
-        target_path = os.path.join(target_folder, file_name)
-        shutil.move(img_path, target_path)
+                    for (img_path, _), result in zip(batch, results):
+                        probs = result.probs
+                        k = min(top_k, len(class_names))
+                        conf, cls = probs.data.float().topk(k)
+                        top_cls, top_conf = cls.tolist(), conf.tolist()
+                        cache.put(sha1s[img_path], model_sha1, top_cls, top_conf)
+                        preds[img_path] = (top_cls, top_conf)
+                        place(img_path, target_folder(class_names, top_cls, top_conf))
+                    cache.commit()  # 每批写一次，中途打断也不丢已经推理过的
+                bar.update(len(chunk))
+    elapsed = time.perf_counter() - start
+    cache.close()
 
-    print("分类完成！请检查 sorted_results 文件夹。")
+    inferred = len(todo) - len(bad)
+    print(f"\n分类完成！共 {sum(counts.values())} 张 (缓存 {len(images) - len(todo)} 张，推理 {inferred} 张)，"
+          f"换文件夹 {moved} 张，耗时 {elapsed:.1f} 秒")
+    if inferred:
+        print(f"推理 {inferred / max(infer_time, 1e-9):.1f} 张/秒，含解码和搬文件整体 {inferred / max(elapsed, 1e-9):.1f} 张/秒")
+    for folder, n in sorted(counts.items(), key=lambda kv: -kv[1]):
+        print(f"  {'不确定' if folder == 'unsure' else folder}: {n} 张")
+    if bad:
+        print(f"无法读取的图片 {len(bad)} 张 (留在原处): {', '.join(os.path.basename(p) for p in bad[:5])}"
+              f"{' ...' if len(bad) > 5 else ''}")
+    write_near_report(class_names, preds)
+    print(f"请检查 {output_dir} 文件夹。")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
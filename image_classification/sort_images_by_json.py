@@ -1,7 +1,12 @@
 import os
-import shutil
+import sys
 from tqdm import tqdm
 
+# 让子文件夹里的脚本也能 import 仓库根目录的公共模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from image_index import ImageIndex
+from file_transfer import TransferEngine
+
 # ================= 配置区域 =================
 # 1. 那个混乱的、存放所有原图的文件夹路径
 source_images_dir = r'D:\\Downloads\\Compressed\\bamboo_saw\\labeled\\images' 
@@ -18,6 +23,13 @@ json_folders = {
 
 # 3. 整理后的图片想放在哪里 (会自动创建)
 target_dataset_dir = r'D:\\Downloads\\Compressed\\bamboo_saw\\labeled\\Final'
+
+# 4. 图片落地方式：'copy' 复制 / 'hardlink' 硬链接 / 'reflink' 写时复制 / 'symlink' 软链接
+# (不支持时自动回退为复制，比如跨盘的硬链接)
+link_mode = 'copy'
+
+# 5. 并发传输线程数 (图片在网络盘/移动硬盘上时调大能明显加快；目标里已有相同文件的直接跳过)
+transfer_threads = 8
 # ===========================================
 
 def main():
@@ -30,6 +42,13 @@ def main():
 
     print("开始根据JSON整理图片...")
 
+    # 一次性扫描图片仓库建立索引，四个类别共用
+    image_index = ImageIndex.load_or_build(source_images_dir)
+    print(f"图片仓库索引: {len(image_index)} 个文件")
+
+    # 复制交给后台线程，这里只管查找和排队
+    engine = TransferEngine(link_mode, num_threads=transfer_threads)
+
     # 遍历你在配置里写的每一个类别
     for class_name, json_dir in json_folders.items():
         print(f"\n正在处理类别: {class_name} ...")
@@ -51,28 +70,24 @@ def main():
             # 假设 json 文件名是 "123.json"，那图片名应该是 "123"
             file_base_name = os.path.splitext(json_file)[0]
             
-            # 去图片仓库里找对应的图
-            found_img = None
-            for ext in valid_exts:
-                # 尝试 123.jpg, 123.png 等
-                possible_path = os.path.join(source_images_dir, file_base_name + ext)
-                if os.path.exists(possible_path):
-                    found_img = possible_path
-                    break
+            # 去图片仓库里找对应的图 (按 123.jpg, 123.png 等顺序查索引)
+            found_img = image_index.find(file_base_name, valid_exts)
             
             if found_img:
                 # 复制图片到新家
                 # 目标路径D:\Downloads\\Compressed\\bamboo_saw\\labeled\\霉变
                 target_path = os.path.join(target_dir, os.path.basename(found_img))
-                shutil.copy2(found_img, target_path) # copy2 保留文件修改时间
+                engine.submit(found_img, target_path) # 复制时用 copy2，保留文件修改时间
                 moved_count += 1
             else:
                 # 如果只有 JSON 但找不到图 (可能名字对不上)
                 missing_count += 1
                 print(f"找不到对应的图片: {file_base_name}，检查文件夹...?(在 {source_images_dir})")
 
+    transfer_stats = engine.close()
+
     print(f"\n整理完成！")
-    print(f"成功归类图片: {moved_count} 张")
+    print(f"成功归类图片: {moved_count - transfer_stats['failed']} 张")
     print(f"未找到原图: {missing_count} 张")
     print(f"数据集已准备好: {target_dataset_dir}")
     print("所有图片位于Final文件夹中")
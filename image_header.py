@@ -0,0 +1,84 @@
+import struct
+
+# 只读文件头拿图片宽高 (JPEG / PNG / BMP)，不解码像素
+# 一张几 MB 的 JPEG 通常只需要读开头几十 KB，比 cv2.imread 快几个数量级。
+
+# JPEG 里表示帧头 (SOFn) 的标记，C4 / C8 / CC 不是
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _exif_orientation(data):
+    """从 APP1 (Exif) 段里取 Orientation 标签，没有返回 1"""
+    if not data.startswith(b'Exif\0\0') or len(data) < 14:
+        return 1
+    tiff = data[6:]
+    endian = {b'II': '<', b'MM': '>'}.get(tiff[:2])
+    if endian is None:
+        return 1
+    try:
+        ifd = struct.unpack(endian + 'I', tiff[4:8])[0]
+        count = struct.unpack(endian + 'H', tiff[ifd:ifd + 2])[0]
+        for i in range(count):
+            entry = tiff[ifd + 2 + i * 12: ifd + 14 + i * 12]
+            tag, typ, n = struct.unpack(endian + 'HHI', entry[:8])
+            if tag == 0x0112:
+                return struct.unpack(endian + 'H', entry[8:10])[0]
+    except struct.error:
+        pass
+    return 1
+
+
+def _jpeg_size(f):
+    orientation = 1
+    f.seek(2)
+    while True:
+        b = f.read(1)
+        while b and b != b'\xff':
+            b = f.read(1)
+        while b == b'\xff':
+            b = f.read(1)  # 标记前可以有任意个填充的 0xFF
+        if not b:
+            return None
+        marker = b[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            continue  # 没有长度字段的标记
+        seg_len = f.read(2)
+        if len(seg_len) < 2:
+            return None
+        length = struct.unpack('>H', seg_len)[0]
+        if marker in _SOF_MARKERS:
+            seg = f.read(5)
+            if len(seg) < 5:
+                return None
+            h, w = struct.unpack('>HH', seg[1:5])
+            return w, h, orientation
+        if marker == 0xE1 and orientation == 1:
+            orientation = _exif_orientation(f.read(length - 2))
+        else:
+            f.seek(length - 2, 1)
+
+
+def image_size(path, exif_transpose=True):
+    """
+    返回 (宽, 高)；读不出来 (文件损坏/不支持的格式) 返回 None
+    exif_transpose=True 时按 EXIF 方向换算成显示方向 (LabelMe/ISAT 记录的都是旋转后的尺寸)
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(26)
+            if head[:2] == b'\xff\xd8':
+                result = _jpeg_size(f)
+                if result is None:
+                    return None
+                w, h, orientation = result
+                if exif_transpose and orientation in (5, 6, 7, 8):
+                    w, h = h, w
+                return w, h
+            if head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+                return struct.unpack('>II', head[16:24])
+            if head[:2] == b'BM':
+                w, h = struct.unpack('<ii', head[18:26])
+                return w, abs(h)  # 高度为负表示自上而下存储
+    except (OSError, struct.error):
+        pass
+    return None
@@ -0,0 +1,77 @@
+import os
+import json
+import hashlib
+
+# 图片/标注查找索引：一次 os.scandir 扫描整个文件夹，之后按文件名 O(1) 查找，
+# 代替每个标注都去 os.path.exists 试探好几个后缀。
+# 索引会缓存到磁盘，文件夹的修改时间 (mtime) 变了就自动重建。
+
+IMAGE_EXTS = ['.jpg', '.jpeg', '.png', '.bmp']
+
+# 缓存目录 (默认放在仓库下的 .cache，不会往图片文件夹里写东西)
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+
+
+def _key(stem, ext):
+    # 后缀统一小写 (.JPG / .jpg 视为同一个)；normcase 在 Windows 上还会忽略文件名大小写
+    return os.path.normcase(stem) + ext.lower()
+
+
+class ImageIndex:
+    def __init__(self, directory, names):
+        self.directory = directory
+        self.names = names
+        self._lookup = {}
+        for name in names:
+            stem, ext = os.path.splitext(name)
+            # 同名不同大小写后缀时保留先扫到的那个
+            self._lookup.setdefault(_key(stem, ext), name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def get(self, file_name):
+        """按完整文件名查找 (后缀不区分大小写)，找不到返回 None"""
+        stem, ext = os.path.splitext(file_name)
+        name = self._lookup.get(_key(stem, ext))
+        return os.path.join(self.directory, name) if name else None
+
+    def find(self, stem, exts=IMAGE_EXTS):
+        """按文件名主干 + 候选后缀依次查找，返回第一个命中的路径"""
+        for ext in exts:
+            name = self._lookup.get(_key(stem, ext))
+            if name:
+                return os.path.join(self.directory, name)
+        return None
+
+    @staticmethod
+    def scan(directory):
+        """一次 scandir 扫描，只收集普通文件名"""
+        with os.scandir(directory) as it:
+            return sorted(entry.name for entry in it if entry.is_file())
+
+    @classmethod
+    def load_or_build(cls, directory, cache_dir=DEFAULT_CACHE_DIR):
+        """优先读磁盘缓存，文件夹 mtime 不一致时重新扫描并写回缓存"""
+        directory = os.path.abspath(directory)
+        mtime_ns = os.stat(directory).st_mtime_ns
+        digest = hashlib.sha1(directory.encode('utf-8')).hexdigest()[:16]
+        cache_path = os.path.join(cache_dir, f'image_index_{digest}.json') if cache_dir else None
+
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    cached = json.load(f)
+                if cached['directory'] == directory and cached['mtime_ns'] == mtime_ns:
+                    return cls(directory, cached['names'])
+            except (OSError, ValueError, KeyError):
+                pass  # 缓存坏了就当没有
+
+        names = cls.scan(directory)
+        if cache_path:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = cache_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'directory': directory, 'mtime_ns': mtime_ns, 'names': names}, f, ensure_ascii=False)
+            os.replace(tmp_path, cache_path)
+        return cls(directory, names)
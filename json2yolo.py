@@ -1,9 +1,16 @@
-import json
 import os
-import shutil
 import random
-from tqdm import tqdm
-import numpy as np
+from collections import Counter
+from convert_pool import run_tasks
+from pack_shards import pack_records
+from label_cache import write_label_cache
+from file_transfer import TransferEngine
+from image_index import ImageIndex
+from labelme_reader import read_labelme
+from yolo_labels import make_label_text
+from dataset_split import assign_split, primary_class, load_dedup_groups, pick_representatives, SplitReport
+from manifest import (manifest_path, load_manifest, save_manifest, fingerprint, is_unchanged,
+                      record_image, sync_image, rel_output, remove_stale_outputs, print_diff_summary)
 
 # ================= 配置区域 =================
 # 1. 你的 JSON 根目录 (里面包含 霉变/ 严重开裂/ 等子文件夹)
@@ -27,43 +34,215 @@ class_map = {
 
 # 数据集划分比例
 split_ratio = 0.8
-# ===========================================
 
-def convert_to_yolo_bbox(points, img_w, img_h):
-    # LabelMe 的 points 可能是 [[x1,y1], [x2,y2]] (矩形) 或 [[x1,y1], [x2,y2], ...] (多边形)
-    # 我们统一取所有点的最小/最大值来生成外接矩形
-    points = np.array(points)
-    x_min = np.min(points[:, 0])
-    x_max = np.max(points[:, 0])
-    y_min = np.min(points[:, 1])
-    y_max = np.max(points[:, 1])
-
-    # 限制坐标在图片范围内
-    x_min = max(0, x_min)
-    y_min = max(0, y_min)
-    x_max = min(img_w, x_max)
-    y_max = min(img_h, y_max)
-
-    # 计算中心点和宽高
-    dw = 1. / img_w
-    dh = 1. / img_h
-    w = x_max - x_min
-    h = y_max - y_min
-    x = (x_min + x_max) / 2.0
-    y = (y_min + y_max) / 2.0
-
-    # 归一化
-    x = x * dw
-    w = w * dw
-    y = y * dh
-    h = h * dh
-    return (x, y, w, h)
+# 划分方式：'hash' 按图片文件名的稳定哈希划分 (新增图片不会让已有图片换边)
+#          'random' 按 random_seed 打乱后按位置切分 (旧方式，新增文件会让大量图片换边)
+split_mode = 'hash'
+
+# 按类别分层的 train 比例 (可选，仅 'hash' 模式)，例如 {'虫眼': 0.7}
+# 每张图归到它目标数最多的类别；没列出的类别用 split_ratio
+class_split_ratio = {}
+
+# 随机种子 ('random' 模式用；设为整数则每次划分结果一致，None 表示每次随机)
+random_seed = None
+
+# 并行进程数：1 为串行，0 为使用全部 CPU 核
+num_workers = 1
+
+# 图片落地方式：'copy' 复制 / 'hardlink' 硬链接 / 'reflink' 写时复制 / 'symlink' 软链接
+# (不支持时自动回退为复制；硬链接下不要直接修改 data/ 里的图片，会连原图一起改)
+link_mode = 'copy'
+
+# 图片传输线程数：子进程只转换标签，图片交给主进程的线程池在后台并发复制 (见 file_transfer.py)，
+# 网络盘/机械硬盘上比逐张串行复制快得多；0 表示在子进程里逐张直接复制
+transfer_threads = 8
+
+# 增量重建：只转换/复制有变化的 JSON 和图片，源文件删掉的输出也会被清理
+# (设为 False 则全部重新生成)
+incremental = True
+
+# 标签格式：'bbox' 检测框 / 'seg' YOLO-seg 多边形 (直接用标注里的点，训练分割不用再转一遍)
+label_format = 'bbox'
+
+# 输出方式：'dir' 目录结构 (images/ + labels/) / 'packed' 打包分片 (data/packed/<split>/，见 pack_shards.py)
+# 打包模式每次都会按清单整体重写分片
+output_format = 'dir'
+
+# 近似重复分组文件 (dedup.py 生成，可选，None 表示不用)：
+# 'hash' 模式下同一组的图片整组落在 train 或 val 一边
+dedup_groups_file = None
+
+# 每组近似重复只保留一张 (组里有标签的成员中文件名最小的一张)，其余不转换；整组都没有标签时一张都不去掉
+drop_duplicates = False
+# ===========================================
 
 def make_dirs():
     for split in ['train', 'val']:
         os.makedirs(os.path.join(output_dir, 'images', split), exist_ok=True)
         os.makedirs(os.path.join(output_dir, 'labels', split), exist_ok=True)
 
+def is_redundant(image_name):
+    """在近似重复组里、又不是去重时保留的那张 (组里有标签的成员中文件名最小的一张) 的图片"""
+    return _representatives.get(image_name, image_name) != image_name
+
+def hash_split(image_name, stratum):
+    """按图片文件名的哈希决定 train/val (stratum 为分层用的类别 ID)；近似重复组整组按组代表、总体比例划分"""
+    class_ratios = {class_map[name]: ratio for name, ratio in class_split_ratio.items()}
+    return assign_split(image_name, split_ratio, stratum, class_ratios, group=_dedup_groups.get(image_name))
+
+def config_matches(old):
+    """标签格式、输出方式没换，哈希模式下划分也没变 (改了比例后旧记录的划分可能已经不对了)，旧记录才能直接沿用"""
+    if 'dropped' in old:
+        return drop_duplicates and is_redundant(old['dropped'])
+    if 'image' in old and drop_duplicates and is_redundant(os.path.basename(old['image'])):
+        return False
+    if old.get('format', 'bbox') != label_format or old.get('layout', 'dir') != output_format:
+        return False
+    if 'image' in old and 'size' not in old:
+        return False  # 旧版清单没记检测框和尺寸，重新转换一次补上
+    if split_mode != 'hash' or 'image' not in old:
+        return True
+    return hash_split(os.path.basename(old['image']), old.get('stratum')) == old['split']
+
+# 子进程里用到的图片索引、近似重复分组和去重时每组保留的代表 (由 init_worker 注入)
+_image_index = None
+_dedup_groups = {}
+_representatives = {}
+
+def init_worker(image_index, dedup_groups, representatives=None):
+    global _image_index, _dedup_groups, _representatives
+    _image_index = image_index
+    _dedup_groups = dedup_groups
+    _representatives = representatives or {}
+
+VALID_EXTS = ['.jpg', '.jpeg', '.png', '.bmp']
+
+def find_image(json_path, data):
+    """在原图索引里找 JSON 对应的图片：先按 JSON 文件名，找不到再按 imagePath 的文件名；都找不到返回 None"""
+    file_base_name = os.path.splitext(os.path.basename(json_path))[0]
+    image_found_path = _image_index.find(file_base_name, VALID_EXTS)
+    if not image_found_path:
+        # 尝试使用 json 里的 imagePath 字段
+        json_img_path = data.get('imagePath')
+        if json_img_path:
+            # 仅仅取文件名 (imagePath 可能是 Windows 路径，统一按反斜杠切)
+            image_found_path = _image_index.get(os.path.basename(json_img_path.replace('\\', '/')))
+    return image_found_path
+
+def collect_objects(data):
+    """返回 (类别 ID 列表, 点列表)，只收白名单里、带点的 shape"""
+    class_ids = []
+    polygons = []
+
+    # 修改：使用 .get('shapes', [])
+    # 意思是：尝试获取 shapes，如果没有，就当作是一个空列表 [] 处理，这样就不会报错了
+    for shape in data.get('shapes', []):
+        label_name = shape.get('label') # 为了保险，这里也可以加个 .get
+        # 检查这个标签是否在我们的白名单里；没有点的 shape 也跳过
+        # (不在名单里的标签，比如 'end', 'outter' 等，直接跳过)
+        if label_name in class_map and shape.get('points'):
+            class_ids.append(class_map[label_name])
+            polygons.append(shape['points'])
+    return class_ids, polygons
+
+def scan_labeled(json_path):
+    """
+    去重前的预扫描：这个 JSON 对应近似重复组里的图片、而且转换后会有标签时返回 {'status': 'labeled', 'image': 图片文件名}
+    按 JSON 文件名就能找到、又不在任何组里的图片不用读 JSON
+    """
+    stem = os.path.splitext(os.path.basename(json_path))[0]
+    found = _image_index.find(stem, VALID_EXTS)
+    if found and os.path.basename(found) not in _dedup_groups:
+        return {'status': 'skip'}
+    try:
+        data = read_labelme(json_path)
+    except Exception:
+        return {'status': 'skip'}
+    image_found_path = find_image(json_path, data)
+    if (not image_found_path or os.path.basename(image_found_path) not in _dedup_groups
+            or data.get('imageWidth') is None or data.get('imageHeight') is None or not collect_objects(data)[0]):
+        return {'status': 'skip'}
+    return {'status': 'labeled', 'image': os.path.basename(image_found_path)}
+
+def convert_one(task):
+    """处理单个 JSON：找图 -> 转标签 -> 复制图片，返回结果给主进程统计"""
+    json_path, split, old = task
+
+    # 0. 增量模式：JSON 和原图都没动过、输出也都在、标签格式也没换，直接沿用上次的结果
+    if old and config_matches(old):
+        sources = {'ann': json_path}
+        if 'image' in old:
+            sources['img'] = old['image']
+        if is_unchanged(old, sources, output_dir):
+            return {'status': 'unchanged', 'diff': 'unchanged', 'record': old}
+
+    try:
+        # 只读转换用得到的字段，跳过内嵌的 base64 imageData
+        data = read_labelme(json_path)
+    except Exception as e:
+        return {'status': 'bad_json', 'msg': f"无法读取 JSON: {json_path}, 错误: {e}"}
+
+    # 1. 获取图片尺寸
+    img_w = data.get('imageWidth')
+    img_h = data.get('imageHeight')
+
+    # [新增] 安全检查：如果读不到宽高，直接跳过这张图
+    if img_w is None or img_h is None:
+        return {'status': 'no_size', 'msg': f"[跳过] JSON 缺少宽高信息: {json_path}"}
+
+    # 2. 确定图片文件名 (优先用 JSON 文件名，因为 imagePath 可能是绝对路径会出错)
+    file_base_name = os.path.splitext(os.path.basename(json_path))[0]
+
+    # 3. 在混乱文件夹里找对应的图片 (查索引，不再逐个后缀 os.path.exists)
+    image_found_path = find_image(json_path, data)
+
+    if not image_found_path:
+        return {'status': 'missing', 'msg': f"[警告] 找不到对应的图片: {file_base_name}"}
+
+    # 4. 收集这张图的全部目标，最后一次性批量转换
+    class_ids, polygons = collect_objects(data)
+    has_valid_object = bool(class_ids)
+
+    diff = 'changed' if old else 'added'
+    # 近似重复里的非代表图片：去重模式下直接跳过 (清单里记一笔，之前生成的输出会被清理)
+    if drop_duplicates and is_redundant(os.path.basename(image_found_path)):
+        return {'status': 'duplicate', 'diff': diff,
+                'record': {'dropped': os.path.basename(image_found_path), 'ann': fingerprint(json_path, old and old.get('ann')), 'outputs': []}}
+    # 划分训练/验证集：哈希模式在这里按图片文件名 (+ 主要类别) 决定，和处理顺序、进程数都无关
+    stratum = primary_class(class_ids)
+    if split is None:
+        split = hash_split(os.path.basename(image_found_path), stratum)
+
+    record = {'split': split, 'stratum': stratum, 'format': label_format, 'layout': output_format, 'ann': fingerprint(json_path, old and old['ann']), 'outputs': []}
+
+    # 5. 如果这张图里有有效目标，才保存
+    if not has_valid_object:
+        return {'status': 'empty', 'diff': diff, 'record': record}
+
+    # 所有目标一次 NumPy 运算转换完；检测框另外记进清单，打包分片/标签缓存直接用
+    label_str, boxes = make_label_text(class_ids, polygons, img_w, img_h, label_format)
+    record['cls'] = class_ids
+    record['boxes'] = boxes.tolist()
+    record['size'] = [img_w, img_h]
+
+    # 打包模式不落地单个文件，只记下原图指纹，最后统一打包
+    if output_format == 'packed':
+        record_image(image_found_path, old, record)
+        return {'status': 'ok', 'diff': diff, 'record': record}
+
+    # 复制图片 (或按 link_mode 建链接)；原图内容没变、目标也还在时就不再复制
+    dst_img_path = os.path.join(output_dir, 'images', split, os.path.basename(image_found_path))
+    transfers = [] if transfer_threads else None
+    sync_image(image_found_path, dst_img_path, old, record, output_dir, link_mode, transfers)
+
+    # 保存 TXT
+    dst_txt_path = os.path.join(output_dir, 'labels', split, file_base_name + '.txt')
+    with open(dst_txt_path, 'w', encoding='utf-8') as f:
+        f.write(label_str)
+    record['outputs'].append(rel_output(output_dir, dst_txt_path))
+
+    return {'status': 'ok', 'diff': diff, 'record': record, 'transfers': transfers}
+
 def main():
     make_dirs()
     
@@ -75,101 +254,100 @@ def main():
             if file.endswith('.json'):
                 json_files.append(os.path.join(root, file))
     
-    # 打乱顺序
-    random.shuffle(json_files)
+    # 打乱顺序 (先排序，保证同一个种子在任何机器上得到相同的划分)
+    json_files.sort()
+    if split_mode == 'random':
+        random.Random(random_seed).shuffle(json_files)
+        if dedup_groups_file:
+            print("[警告] split_mode='random' 按打乱后的位置划分，近似重复组不会放在同一边 (分组只用于 drop_duplicates)；需要防止泄漏请改用 'hash'")
     
     print(f"找到 {len(json_files)} 个 JSON 文件，开始转换...")
-    
-    processed_count = 0
-    missing_img_count = 0
-
-    for i, json_path in tqdm(enumerate(json_files), total=len(json_files)):
-        try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        except Exception as e:
-            print(f"无法读取 JSON: {json_path}, 错误: {e}")
-            continue
-
-        # 1. 获取图片尺寸
-        img_w = data.get('imageWidth')
-        img_h = data.get('imageHeight')
-
-        # [新增] 安全检查：如果读不到宽高，直接跳过这张图
-        if img_w is None or img_h is None:
-            print(f"[跳过] JSON 缺少宽高信息: {json_path}")
-            continue
-        
-        # 2. 确定图片文件名 (优先用 JSON 文件名，因为 imagePath 可能是绝对路径会出错)
-        file_base_name = os.path.splitext(os.path.basename(json_path))[0]
-        
-        # 3. 在混乱文件夹里找对应的图片
-        image_found_path = None
-        valid_exts = ['.jpg', '.jpeg', '.png', '.bmp']
-        for ext in valid_exts:
-            temp_path = os.path.join(images_source_dir, file_base_name + ext)
-            if os.path.exists(temp_path):
-                image_found_path = temp_path
-                break
-        
-        if not image_found_path:
-            # 尝试使用 json 里的 imagePath 字段
-            json_img_path = data.get('imagePath')
-            if json_img_path:
-                 # 仅仅取文件名
-                 temp_path = os.path.join(images_source_dir, os.path.basename(json_img_path))
-                 if os.path.exists(temp_path):
-                     image_found_path = temp_path
-
-        if not image_found_path:
-            missing_img_count += 1
-            if missing_img_count < 5:
-                print(f"[警告] 找不到对应的图片: {file_base_name}")
-            continue
-
-        # 4. 划分训练/验证集
-        if i < len(json_files) * split_ratio:
-            split = 'train'
-        else:
-            split = 'val'
-
-        # 5. 转换标签
-        label_str = ""
-        has_valid_object = False
-        
-        # 修改：使用 .get('shapes', []) 
-        # 意思是：尝试获取 shapes，如果没有，就当作是一个空列表 [] 处理，这样就不会报错了
-        for shape in data.get('shapes', []):
-            label_name = shape.get('label') # 为了保险，这里也可以加个 .get
-            # 检查这个标签是否在我们的白名单里
-            if label_name in class_map:
-                class_id = class_map[label_name]
-                points = shape['points']
-                
-                # 转换坐标
-                bbox = convert_to_yolo_bbox(points, img_w, img_h)
-                label_str += f"{class_id} {' '.join(f'{x:.6f}' for x in bbox)}\n"
-                has_valid_object = True
-            else:
-                # 这是一个不在名单里的标签，比如 'end', 'outter' 等，跳过
-                pass
-
-        # 6. 如果这张图里有有效目标，才保存
-        if has_valid_object:
-            # 复制图片
-            dst_img_path = os.path.join(output_dir, 'images', split, os.path.basename(image_found_path))
-            shutil.copy2(image_found_path, dst_img_path)
-            
-            # 保存 TXT
-            dst_txt_path = os.path.join(output_dir, 'labels', split, file_base_name + '.txt')
-            with open(dst_txt_path, 'w', encoding='utf-8') as f:
-                f.write(label_str)
-            
-            processed_count += 1
+
+    # 读取上次的清单 (键是 JSON 相对 json_root_dir 的路径)
+    manifest_file = manifest_path(output_dir, 'json2yolo')
+    old_entries = load_manifest(manifest_file)
+    keys = {p: os.path.relpath(p, json_root_dir).replace(os.sep, '/') for p in json_files}
+
+    # 'random' 模式在主进程按打乱后的位置划分 (串行/并行结果一致)，已有的图片保持上次的划分
+    # 'hash' 模式交给子进程按文件名哈希决定，这里传 None
+    tasks = []
+    for i, json_path in enumerate(json_files):
+        old = old_entries.get(keys[json_path]) if incremental else None
+        split = None
+        if split_mode == 'random':
+            split = 'train' if i < len(json_files) * split_ratio else 'val'
+            if old:
+                split = old.get('split', split)  # 去重跳过的记录没有 split
+        tasks.append((json_path, split, old))
+
+    new_entries = {}
+    diff = Counter()
+    dedup_groups = load_dedup_groups(dedup_groups_file)
+    report = SplitReport(split_ratio, {class_map[k]: v for k, v in class_split_ratio.items()},
+                         {v: k for k, v in class_map.items()})
+
+    # 图片复制在后台线程里进行，主进程继续收子进程的结果
+    # 要不要重新复制已经由 manifest 按内容 hash 判断过了，这里不再按大小/修改时间跳过
+    engine = TransferEngine(link_mode, num_threads=transfer_threads, skip_identical=False) if transfer_threads else None
+
+    def on_result(task, result, stats):
+        for src, dst in result.get('transfers') or ():
+            engine.submit(src, dst)
+        if 'record' in result:
+            record = result['record']
+            new_entries[keys[task[0]]] = record
+            diff[result['diff']] += 1
+            if 'image' in record:
+                # 哈希模式下近似重复组按总体比例划分，单独统计，不算进各类别
+                grouped = split_mode == 'hash' and os.path.basename(record['image']) in dedup_groups
+                report.add(record['split'], record.get('stratum'), grouped)
+        if result['status'] == 'missing':
+            # 仅打印前几个错误，避免刷屏
+            if stats['missing'] < 5:
+                print(result['msg'])
+        elif result.get('msg'):
+            print(result['msg'])
+
+    # 一次性扫描原图文件夹建立索引 (有缓存时几乎不耗时)
+    image_index = ImageIndex.load_or_build(images_source_dir)
+    print(f"原图索引: {len(image_index)} 个文件")
+
+    # 去重模式：先找出近似重复组里转换后确实有标签的图片，每组只保留其中文件名最小的一张，
+    # 组代表没有标注时不会把组里有标注的图片也一起丢掉
+    representatives = {}
+    if drop_duplicates and dedup_groups:
+        labeled = set()
+
+        def on_scan(task, result, stats):
+            if result['status'] == 'labeled':
+                labeled.add(result['image'])
+
+        run_tasks(scan_labeled, json_files, num_workers, on_result=on_scan,
+                  initializer=init_worker, initargs=(image_index, dedup_groups), desc='去重预扫描')
+        representatives = pick_representatives(dedup_groups, labeled)
+
+    stats = run_tasks(convert_one, tasks, num_workers, on_result=on_result,
+                      initializer=init_worker, initargs=(image_index, dedup_groups, representatives))
+    if engine:
+        engine.close()  # 等图片全部落地，再清理旧输出、写标签缓存
+
+    # 清理源文件已消失 (或换了划分) 的旧输出，再写回清单
+    removed_files = remove_stale_outputs(output_dir, old_entries, new_entries)
+    save_manifest(manifest_file, new_entries)
+
+    if output_format == 'packed':
+        pack_records(output_dir, new_entries)
+    else:
+        # 每个 split 的全部标签合并成一个缓存文件，训练/验证启动时不用再逐个扫描
+        write_label_cache(output_dir, new_entries, label_format)
 
     print(f"\n转换完成！")
-    print(f"成功转换: {processed_count} 张 (含标签)")
-    print(f"找不到原图: {missing_img_count} 张")
+    print_diff_summary(diff, old_entries, new_entries, removed_files)
+    print(f"成功转换: {stats['ok']} 张 (含标签)，未变跳过: {stats['unchanged']} 张")
+    print(f"找不到原图: {stats['missing']} 张")
+    if stats['duplicate']:
+        print(f"近似重复去掉: {stats['duplicate']} 张")
+    report.print()
     print(f"数据已保存在: {output_dir}")
     print("请记得更新 bamboo.yaml 中的 path 为上面的输出路径！")
 
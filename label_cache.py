@@ -0,0 +1,208 @@
+import os
+import time
+import hashlib
+import numpy as np
+
+# 合并的标签缓存：转换脚本写完数据集后，把每个 split 的全部标签存成一个 npz
+# data/labels/<split>_<标签目录 hash>_labels.npz
+#   label_dir  这份缓存对应的标签目录 (绝对路径)，文件名里的 hash 也是按它算的：
+#              缓存只属于一个标签目录，不同数据集 (不同输出路径、letterbox 的 data_640/…) 不会读到彼此的缓存
+#   names      图片文件名 (和 images/<split>/ 里的一致)
+#   sizes      (N, 2) 图片宽高
+#   offsets    (N + 1,) 第 i 张图的目标是 cls/boxes[offsets[i]:offsets[i + 1]]
+#   cls        (M,) 类别 ID
+#   boxes      (M, 4) 归一化的 x, y, w, h
+#   sha1       原图内容 hash (来自清单)
+#   file_size / mtime_ns  data/images 里那份图片的大小和修改时间，加载时用来校验缓存有没有过期
+# 训练/验证时 (YoloTest1.py / val.py) 调用 use_label_cache()，直接读这个文件，不再逐个打开几万个 txt 和图片头。
+
+LABEL_CACHE_SUFFIX = '_labels.npz'
+
+
+def _label_dir_key(label_dir):
+    return os.path.normcase(os.path.abspath(label_dir))
+
+
+def label_dir_cache_path(label_dir):
+    """标签目录 labels/<split> 对应的缓存文件 (放在它旁边，文件名带上目录路径的 hash)"""
+    digest = hashlib.sha1(_label_dir_key(label_dir).encode('utf-8')).hexdigest()[:8]
+    label_dir = os.path.normpath(label_dir)
+    return os.path.join(os.path.dirname(label_dir), f'{os.path.basename(label_dir)}_{digest}{LABEL_CACHE_SUFFIX}')
+
+
+def label_cache_path(output_dir, split):
+    return label_dir_cache_path(os.path.join(output_dir, 'labels', split))
+
+
+def _image_size(path):
+    """清单里没有尺寸时 (比如 XML 损坏的背景图) 才读图片"""
+    import cv2
+    img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    return [img.shape[1], img.shape[0]] if img is not None else [0, 0]
+
+
+def write_label_cache(output_dir, records, label_format='bbox', splits=('train', 'val')):
+    """
+    转换脚本用：按清单记录写出每个 split 的标签缓存 (只用于目录结构输出)
+    records: {key: record}，record 里需要有 image / img / split / cls / boxes / size / outputs (第一个输出是图片)
+    """
+    by_split = {split: [] for split in splits}
+    for record in records.values():
+        if 'image' in record and record.get('outputs'):
+            by_split.setdefault(record['split'], []).append(record)
+
+    for split, items in by_split.items():
+        items.sort(key=lambda r: r['outputs'][0])
+        n = len(items)
+        counts = np.fromiter((len(r['cls']) for r in items), dtype=np.int64, count=n)
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        stats = [os.stat(os.path.join(output_dir, r['outputs'][0])) for r in items]
+
+        label_dir = os.path.join(output_dir, 'labels', split)
+        path = label_dir_cache_path(label_dir)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path,
+                 label_dir=np.asarray(_label_dir_key(label_dir)),
+                 names=np.asarray([os.path.basename(r['outputs'][0]) for r in items], dtype=str),
+                 sizes=np.asarray([r.get('size') or _image_size(os.path.join(output_dir, r['outputs'][0]))
+                                   for r in items], dtype=np.int32).reshape(-1, 2),
+                 offsets=offsets,
+                 cls=np.asarray([c for r in items for c in r['cls']], dtype=np.int32),
+                 boxes=np.asarray([b for r in items for b in r['boxes']], dtype=np.float32).reshape(-1, 4),
+                 sha1=np.asarray([r['img']['sha1'] for r in items], dtype=str),
+                 file_size=np.asarray([st.st_size for st in stats], dtype=np.int64),
+                 mtime_ns=np.asarray([st.st_mtime_ns for st in stats], dtype=np.int64),
+                 label_format=np.asarray(label_format))
+        os.replace(tmp_path, path)
+    print(f"标签缓存已写入: {', '.join(f'{s} {len(v)} 张' for s, v in by_split.items())}")
+
+
+def load_label_dir_cache(label_dir):
+    """读取标签目录 label_dir 的缓存，返回 dict (数组)；文件不存在、或者不是这个目录的缓存 (旧版没记目录) 返回 None"""
+    path = label_dir_cache_path(label_dir)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as f:
+        if 'label_dir' not in f.files or str(f['label_dir']) != _label_dir_key(label_dir):
+            return None
+        return {k: f[k] for k in f.files}
+
+
+def load_label_cache(output_dir, split):
+    return load_label_dir_cache(os.path.join(output_dir, 'labels', split))
+
+
+def cache_matches(cache, im_files):
+    """
+    im_files 和缓存里的图片一一对应、大小和修改时间都没变，缓存才可用
+    返回 {图片路径: 缓存下标}，不匹配时返回 None
+    """
+    if cache is None or len(im_files) != len(cache['names']):
+        return None
+    where = {name: i for i, name in enumerate(cache['names'].tolist())}
+    index = {}
+    for im_file in im_files:
+        i = where.get(os.path.basename(im_file))
+        if i is None:
+            return None
+        try:
+            st = os.stat(im_file)
+        except OSError:
+            return None
+        if st.st_size != cache['file_size'][i] or st.st_mtime_ns != cache['mtime_ns'][i]:
+            return None
+        index[im_file] = i
+    return index
+
+
+def to_ultralytics_labels(cache, index):
+    """转成 ultralytics YOLODataset.get_labels 返回的格式"""
+    labels = []
+    for im_file, i in index.items():
+        start, end = cache['offsets'][i], cache['offsets'][i + 1]
+        w, h = cache['sizes'][i].tolist()
+        labels.append({
+            'im_file': im_file,
+            'shape': (h, w),
+            'cls': cache['cls'][start:end].astype(np.float32).reshape(-1, 1),
+            'bboxes': cache['boxes'][start:end],
+            'segments': [],
+            'keypoints': None,
+            'normalized': True,
+            'bbox_format': 'xywh',
+        })
+    return labels
+
+
+def use_label_cache():
+    """
+    让 ultralytics 建数据集时优先读标签缓存 (训练和验证都生效)
+    缓存不存在、图片有变动、或者是分割/关键点任务时，自动回退到 ultralytics 原本的逐个扫描
+    直接替换 YOLODataset.get_labels 而不是另建子类：Windows 下 DataLoader 的 worker 是 spawn 出来的，
+    数据集对象要 pickle 过去，函数里定义的子类 pickle 不了；这样也能和 synthetic_stream 的子类叠加
+    """
+    from ultralytics.data.dataset import YOLODataset
+    from ultralytics.data.utils import img2label_paths
+
+    scan_labels = YOLODataset.get_labels
+    if getattr(scan_labels, 'uses_label_cache', False):
+        return
+
+    def get_labels(self):
+        if not (self.use_segments or self.use_keypoints) and self.im_files:
+            # 按 ultralytics 自己的规则 (images -> labels) 找标签目录，缓存跟着标签目录走
+            label_files = img2label_paths(self.im_files)
+            label_dir = os.path.dirname(label_files[0])
+            t0 = time.perf_counter()
+            # 图片分散在几个目录时 (yaml 里列了多个路径) 一份缓存对不上，直接回退
+            same_dir = all(os.path.dirname(f) == label_dir for f in label_files)
+            cache = load_label_dir_cache(label_dir) if same_dir else None
+            index = cache_matches(cache, self.im_files)
+            if index is not None:
+                self.label_files = label_files
+                print(f"{self.prefix}读取标签缓存 {label_dir_cache_path(label_dir)}: "
+                      f"{len(index)} 张，{(time.perf_counter() - t0) * 1000:.0f} ms")
+                return to_ultralytics_labels(cache, index)
+            if cache is not None:
+                print(f"{self.prefix}标签缓存和图片对不上 (重新转换过数据集?)，回退到逐个扫描")
+        return scan_labels(self)
+
+    get_labels.uses_label_cache = True
+    YOLODataset.get_labels = get_labels
+
+
+# ================= 对比测试 =================
+# 直接运行本文件：比较逐个解析 labels/<split>/*.txt 和读取标签缓存的耗时
+
+DATA_DIR = r'D:\Documaents\Adobe\data'
+BENCH_SPLIT = 'train'
+
+
+def _parse_txt_dir(data_dir, split):
+    label_dir = os.path.join(data_dir, 'labels', split)
+    n = 0
+    for name in os.listdir(label_dir):
+        if name.endswith('.txt'):
+            np.loadtxt(os.path.join(label_dir, name), ndmin=2)
+            n += 1
+    return n
+
+
+def benchmark():
+    t0 = time.perf_counter()
+    n_txt = _parse_txt_dir(DATA_DIR, BENCH_SPLIT)
+    t_txt = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    cache = load_label_cache(DATA_DIR, BENCH_SPLIT)
+    t_cache = time.perf_counter() - t0
+    if cache is None:
+        print(f"没有找到标签缓存: {label_cache_path(DATA_DIR, BENCH_SPLIT)}，请先运行转换脚本")
+        return
+    print(f"逐个解析 txt: {n_txt} 个，{t_txt * 1000:.0f} ms")
+    print(f"读取标签缓存: {len(cache['names'])} 张 / {len(cache['cls'])} 个目标，{t_cache * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    benchmark()
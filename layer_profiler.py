@@ -0,0 +1,272 @@
+import json
+import time
+import statistics
+from collections import defaultdict
+import torch
+import torch.nn as nn
+
+# 逐层推理开销统计 (检测网络在 CPU 上的时间花在哪)
+# print(model.model) 只能看到结构，这里给每个模块挂 forward hook，跑 N 次预热后的推理，统计每一层：
+#   - 耗时：进入/离开模块的时间差 (含子模块)，取 N 次的中位数
+#   - FLOPs：按卷积/池化等叶子层的形状解析计算 (乘加算 2 次)，父模块是子模块之和
+#   - 输出大小：模块输出张量的字节数
+#   - 内存分配：GPU 上是模块执行期间显存峰值比进入时多出的部分；
+#     CPU 上 PyTorch 不报告分配量，用模块内部各叶子层新产生的激活字节数之和代替 (上界)
+# 结果按耗时排序打印成表，并写一份 JSON，方便对比不同版本、决定先瘦身哪些模块。
+#
+# 用法：
+#     with LayerProfiler(model) as prof:
+#         prof.run(x, runs=20, warmup=3)
+#     prof.print_table()
+#     prof.save_json('layer_profile.json')
+
+# ================= 配置区域 =================
+# 分析哪个网络：'exp' = yolo_exp.py 里自己搭的 YOLOv8_Model，'ultralytics' = YOLO(weights).model
+MODEL_SOURCE = 'exp'
+# 是否先融合 Conv+BN (部署时的实际形态)
+FUSE = True
+
+IMG_SIZE = 640
+BATCH_SIZE = 1
+WARMUP = 3
+RUNS = 20
+# PyTorch 的 CPU 线程数，0 表示用默认值
+TORCH_THREADS = 0
+
+# 表格只列到这一层深度 (0 = 整个网络，1 = backbone/neck/head，2 = Conv/C2f/SPPF 这一级…)，None 表示全部
+TABLE_MAX_DEPTH = 2
+TABLE_TOP = 40
+JSON_FILE = 'layer_profile.json'
+# ===========================================
+
+# 逐元素运算的层：每个输出元素算 1 次
+ELEMENTWISE = (nn.SiLU, nn.ReLU, nn.LeakyReLU, nn.Sigmoid, nn.Hardswish, nn.GELU)
+
+
+def tensor_bytes(out):
+    """输出里所有张量的字节数 (支持 tuple/list/dict 嵌套)"""
+    if isinstance(out, torch.Tensor):
+        return out.numel() * out.element_size()
+    if isinstance(out, (list, tuple)):
+        return sum(tensor_bytes(o) for o in out)
+    if isinstance(out, dict):
+        return sum(tensor_bytes(o) for o in out.values())
+    return 0
+
+
+def leaf_flops(m, inputs, out):
+    """叶子层的解析 FLOPs；不认识的层返回 0"""
+    if not isinstance(out, torch.Tensor):
+        return 0
+    n_out = out.numel()
+    if isinstance(m, nn.Conv2d):
+        kh, kw = m.kernel_size
+        macs = n_out * (m.in_channels // m.groups) * kh * kw
+        return 2 * macs + (n_out if m.bias is not None else 0)
+    if isinstance(m, nn.Linear):
+        return 2 * n_out * m.in_features + (n_out if m.bias is not None else 0)
+    if isinstance(m, nn.BatchNorm2d):
+        return 2 * n_out
+    if isinstance(m, (nn.MaxPool2d, nn.AvgPool2d)):
+        k = m.kernel_size if isinstance(m.kernel_size, tuple) else (m.kernel_size, m.kernel_size)
+        return n_out * k[0] * k[1]
+    if isinstance(m, ELEMENTWISE):
+        return n_out
+    return 0
+
+
+class LayerProfiler:
+    def __init__(self, model):
+        self.model = model
+        self.names = {}
+        self.depth = {}
+        self.leaf = {}
+        for name, m in model.named_modules():
+            if m in self.names:  # 共用的模块 (比如 ultralytics 所有 Conv 共用一个 SiLU) 只记第一个名字
+                continue
+            self.names[m] = name or 'model'
+            self.depth[m] = name.count('.') + 1 if name else 0
+            self.leaf[m] = next(m.children(), None) is None
+        self.handles = []
+        self._stack = []
+        self._allocated = 0
+        self._cuda = False
+        self._reset_run()
+        self.times = defaultdict(list)   # 模块 -> 每次推理的耗时 (ms)
+        self.calls = {}
+        self.flops = {}
+        self.out_bytes = {}
+        self.alloc = {}
+        self.total_ms = []
+        self.input_shape = None
+
+    def __enter__(self):
+        self.attach()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.detach()
+
+    def attach(self):
+        for m in self.names:
+            self.handles.append(m.register_forward_pre_hook(self._pre))
+            self.handles.append(m.register_forward_hook(self._post))
+
+    def detach(self):
+        for h in self.handles:
+            h.remove()
+        self.handles = []
+
+    def _reset_run(self):
+        self._run_time = defaultdict(float)
+        self._run_calls = defaultdict(int)
+        self._run_flops = defaultdict(int)
+        self._run_out = defaultdict(int)
+        self._run_alloc = defaultdict(int)
+
+    def _pre(self, m, inputs):
+        if self._cuda:
+            torch.cuda.synchronize()
+            if self._stack:  # 重置峰值前先把到目前为止的峰值记到父模块上
+                self._stack[-1][3] = max(self._stack[-1][3], torch.cuda.max_memory_allocated())
+            base = torch.cuda.memory_allocated()
+            torch.cuda.reset_peak_memory_stats()
+        else:
+            base = self._allocated
+        # [模块, 开始时间, 进入时的分配量, 子模块里见过的峰值, 子模块 FLOPs 之和]
+        self._stack.append([m, time.perf_counter(), base, base, 0])
+
+    def _post(self, m, inputs, out):
+        if self._cuda:
+            torch.cuda.synchronize()
+        t1 = time.perf_counter()
+        _, t0, base, peak, child_flops = self._stack.pop()
+        size = tensor_bytes(out)
+        if self.leaf[m]:
+            flops = leaf_flops(m, inputs, out)
+            if not self._cuda:
+                self._allocated += size
+        else:
+            flops = child_flops
+        if self._cuda:
+            peak = max(peak, torch.cuda.max_memory_allocated())
+            alloc = peak - base
+        else:
+            peak = self._allocated
+            alloc = self._allocated - base
+        if self._stack:
+            parent = self._stack[-1]
+            parent[3] = max(parent[3], peak)
+            parent[4] += flops
+
+        self._run_time[m] += (t1 - t0) * 1000
+        self._run_calls[m] += 1
+        self._run_flops[m] += flops
+        self._run_out[m] += size
+        self._run_alloc[m] = max(self._run_alloc[m], alloc)
+
+    @torch.inference_mode()
+    def run(self, x, runs=RUNS, warmup=WARMUP):
+        """预热 warmup 次 (不计入)，再跑 runs 次统计"""
+        self.input_shape = list(x.shape)
+        self._cuda = x.is_cuda
+        for _ in range(warmup):
+            self.model(x)
+        for _ in range(runs):
+            self._reset_run()
+            self._allocated = 0
+            t0 = time.perf_counter()
+            self.model(x)
+            if self._cuda:
+                torch.cuda.synchronize()
+            self.total_ms.append((time.perf_counter() - t0) * 1000)
+            for m, t in self._run_time.items():
+                self.times[m].append(t)
+            # FLOPs、大小每次都一样，留最后一次的
+            self.calls.update(self._run_calls)
+            self.flops.update(self._run_flops)
+            self.out_bytes.update(self._run_out)
+            self.alloc.update(self._run_alloc)
+        return self
+
+    def results(self):
+        """每个被调用过的模块一条，按耗时从高到低排序"""
+        total = statistics.median(self.total_ms) if self.total_ms else 0.0
+        rows = []
+        for m, times in self.times.items():
+            t = statistics.median(times)
+            rows.append({
+                'name': self.names[m],
+                'type': type(m).__name__,
+                'depth': self.depth[m],
+                'params': sum(p.numel() for p in m.parameters()),
+                'calls': self.calls[m],
+                'time_ms': round(t, 4),
+                'time_pct': round(100 * t / total, 2) if total else 0.0,
+                'flops': self.flops[m],
+                'out_bytes': self.out_bytes[m],
+                'alloc_bytes': self.alloc[m],
+            })
+        rows.sort(key=lambda r: r['time_ms'], reverse=True)
+        return rows
+
+    def print_table(self, max_depth=TABLE_MAX_DEPTH, top=TABLE_TOP):
+        rows = [r for r in self.results() if max_depth is None or r['depth'] <= max_depth]
+        total = statistics.median(self.total_ms)
+        print(f"输入 {self.input_shape}，{len(self.total_ms)} 次推理，整体中位数 {total:.1f} ms")
+        print(f"{'模块':<32} {'类型':<12} {'耗时(ms)':>9} {'占比':>7} {'GFLOPs':>8} {'GFLOP/s':>8} "
+              f"{'输出(MB)':>9} {'分配(MB)':>9} {'参数(M)':>8}")
+        for r in rows[:top]:
+            gflops = r['flops'] / 1e9
+            speed = gflops / (r['time_ms'] / 1000) if r['time_ms'] > 0 else 0.0
+            print(f"{r['name'][:32]:<32} {r['type'][:12]:<12} {r['time_ms']:9.2f} {r['time_pct']:6.1f}% "
+                  f"{gflops:8.3f} {speed:8.1f} {r['out_bytes'] / 1e6:9.2f} {r['alloc_bytes'] / 1e6:9.2f} "
+                  f"{r['params'] / 1e6:8.3f}")
+        if len(rows) > top:
+            print(f"... 另有 {len(rows) - top} 个模块 (完整结果见 JSON)")
+
+    def save_json(self, path=JSON_FILE):
+        data = {
+            'input_shape': self.input_shape,
+            'runs': len(self.total_ms),
+            'device': 'cuda' if self._cuda else 'cpu',
+            'torch_threads': torch.get_num_threads(),
+            'total_ms': round(statistics.median(self.total_ms), 4),
+            'layers': self.results(),
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        print(f"逐层结果已写入 {path}")
+
+
+def load_model():
+    import yolo_exp
+    weights = yolo_exp.find_weights()
+    if MODEL_SOURCE == 'ultralytics':
+        from ultralytics import YOLO
+        if not weights:
+            raise SystemExit(f"没找到 {yolo_exp.WEIGHTS_GLOB}")
+        model = YOLO(weights).model.float().eval()
+        return model.fuse(verbose=False) if FUSE else model
+    if weights:
+        print(f"权重: {weights}")
+        model = yolo_exp.YOLOv8_Model.from_checkpoint(weights)
+    else:
+        print(f"没找到 {yolo_exp.WEIGHTS_GLOB}，用随机初始化的 yolov8{yolo_exp.SCALE}")
+        model = yolo_exp.YOLOv8_Model(yolo_exp.NUM_CLASSES, yolo_exp.SCALE).eval()
+    return model.fuse() if FUSE else model
+
+
+def main():
+    if TORCH_THREADS > 0:
+        torch.set_num_threads(TORCH_THREADS)
+    model = load_model()
+    x = torch.rand(BATCH_SIZE, 3, IMG_SIZE, IMG_SIZE)
+    with LayerProfiler(model) as prof:
+        prof.run(x, runs=RUNS, warmup=WARMUP)
+    prof.print_table()
+    prof.save_json()
+
+
+if __name__ == '__main__':
+    main()
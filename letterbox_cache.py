@@ -0,0 +1,277 @@
+import os
+from collections import Counter
+import cv2
+import numpy as np
+from convert_pool import run_tasks
+from materialize import materialize
+from label_cache import load_label_cache, write_label_cache
+from manifest import (manifest_path, load_manifest, save_manifest, fingerprint, is_unchanged,
+                      rel_output, remove_stale_outputs, print_diff_summary)
+
+# 预先缩放好的训练图片
+# 原图比训练用的 imgsz 大得多，每个 epoch 都要重新解码整张大 JPEG 再缩小。
+# 这里在建数据集时一次性把 data/ 里的每张图 letterbox (等比缩放 + 灰边填充) 到 IMG_SIZE，
+# 标签同步换算，输出一个结构完全相同的 data_640/，训练时把 bamboo.yaml 的 path 指过去即可。
+# 缩放结果都存成 JPEG：a.jpg 还叫 a.jpg，其他格式保留原后缀 (a.png -> a.png.jpg，标签 a.png.txt)。
+#
+# 缩放结果按原图内容 hash 存在 OUT_DIR/.store/ 里，再硬链接进 images/<split>/：
+# 只有内容变了的图片才会重新缩放，换了 split 或者重复的图片只是重新建个链接。
+
+# ================= 配置区域 =================
+# 1. 转换脚本输出的数据集 (里面是 images/ 和 labels/)
+DATA_DIR = r'D:\Documaents\Adobe\data'
+
+# 2. 缩放后的数据集输出路径
+OUT_DIR = r'D:\Documaents\Adobe\data_640'
+
+# 3. 目标边长 (和训练时的 imgsz 一致)
+IMG_SIZE = 640
+
+# 4. 输出格式：'jpg' 只写缩放后的 JPEG
+#              'npy' 另外再写一份未压缩的 uint8 数组 (.npy，和图片同名)，训练时加 cache='disk'，
+#                    ultralytics 会直接 np.load 它，完全跳过 JPEG 解码 (占用磁盘约为 JPEG 的 10 倍)
+CACHE_FORMAT = 'jpg'
+JPEG_QUALITY = 95
+
+# 5. 填充颜色 (和 ultralytics 的 letterbox 一致)
+PAD_VALUE = 114
+
+# 6. 并行进程数：1 为串行，0 为使用全部 CPU 核
+NUM_WORKERS = 0
+# ===========================================
+
+SPLITS = ('train', 'val')
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+STORE_DIR = '.store'
+
+# 子进程里用到的上下文 (由 init_worker 注入)
+_known_geom = {}
+_size_hints = {}
+
+
+def init_worker(known_geom, size_hints):
+    global _known_geom, _size_hints
+    _known_geom = known_geom
+    _size_hints = size_hints
+
+
+def reduced_flag(src_w, src_h, size):
+    """JPEG 可以在解码时直接按 1/2、1/4、1/8 缩小，比解码整张再缩快得多；缩小后仍不小于目标尺寸"""
+    scale = max(src_w, src_h) / size
+    for factor, flag in [(8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                         (2, cv2.IMREAD_REDUCED_COLOR_2)]:
+        if scale >= factor:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def letterbox(img, size, pad_value=PAD_VALUE):
+    """等比缩放到长边为 size，居中填充成 size x size；返回 (图片, [new_w, new_h, left, top])"""
+    h, w = img.shape[:2]
+    r = size / max(h, w)
+    new_w, new_h = max(1, round(w * r)), max(1, round(h * r))
+    if (new_w, new_h) != (w, h):
+        interp = cv2.INTER_AREA if r < 1 else cv2.INTER_LINEAR
+        img = cv2.resize(img, (new_w, new_h), interpolation=interp)
+    left = (size - new_w) // 2
+    top = (size - new_h) // 2
+    img = cv2.copyMakeBorder(img, top, size - new_h - top, left, size - new_w - left,
+                             cv2.BORDER_CONSTANT, value=(pad_value,) * 3)
+    return img, [new_w, new_h, left, top]
+
+
+def rescale_label_lines(lines, geom, size):
+    """
+    把归一化的 YOLO 标签换算到 letterbox 后的图片上 (检测框和分割多边形都支持)
+    返回 (新的文本, 类别列表, 检测框列表)
+    """
+    new_w, new_h, left, top = geom
+    sx, sy = new_w / size, new_h / size
+    ox, oy = left / size, top / size
+    out, cls, boxes = [], [], []
+    for line in lines:
+        parts = line.split()
+        if not parts:
+            continue
+        c = int(parts[0])
+        v = np.asarray(parts[1:], dtype=np.float64)
+        if len(v) == 4:
+            # x, y, w, h
+            v = np.array([v[0] * sx + ox, v[1] * sy + oy, v[2] * sx, v[3] * sy])
+            box = v
+        else:
+            # 分割多边形 x1 y1 x2 y2 ...
+            pts = v.reshape(-1, 2) * (sx, sy) + (ox, oy)
+            v = pts.ravel()
+            (x_min, y_min), (x_max, y_max) = pts.min(0), pts.max(0)
+            box = np.array([(x_min + x_max) / 2, (y_min + y_max) / 2, x_max - x_min, y_max - y_min])
+        out.append(f"{c} {' '.join(f'{a:.6f}' for a in v.tolist())}\n")
+        cls.append(c)
+        boxes.append(box.tolist())
+    return ''.join(out), cls, boxes
+
+
+def store_paths(sha1):
+    base = os.path.join(OUT_DIR, STORE_DIR, sha1[:2], f'{sha1}_{IMG_SIZE}')
+    paths = {'.jpg': base + '.jpg'}
+    if CACHE_FORMAT == 'npy':
+        paths['.npy'] = base + '.npy'
+    return paths
+
+
+def output_stem(name):
+    """
+    输出文件名 (不含后缀)：缩放结果一律存成 .jpg，所以只有 .jpg 原图沿用原来的名字，
+    其他格式把原后缀留在名字里 (a.png -> a.png.jpg)，同一个文件夹里的 a.jpg 和 a.png 不会互相覆盖
+    """
+    stem, ext = os.path.splitext(name)
+    return stem if ext == '.jpg' else name
+
+
+def build_store(src_img, paths, size_hint):
+    """解码 + letterbox，写进 .store (先写临时文件再替换，并行时同一张图也不会写坏)"""
+    flag = reduced_flag(*size_hint, IMG_SIZE) if size_hint is not None else cv2.IMREAD_COLOR
+    img = cv2.imdecode(np.fromfile(src_img, dtype=np.uint8), flag)
+    if img is None:
+        return None
+    img, geom = letterbox(img, IMG_SIZE)
+    os.makedirs(os.path.dirname(paths['.jpg']), exist_ok=True)
+    pid = os.getpid()
+
+    ok, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    tmp = f"{paths['.jpg']}.{pid}.tmp"
+    buf.tofile(tmp)
+    os.replace(tmp, paths['.jpg'])
+    if '.npy' in paths:
+        tmp = f"{paths['.npy']}.{pid}.tmp"
+        with open(tmp, 'wb') as f:
+            np.save(f, np.ascontiguousarray(img))
+        os.replace(tmp, paths['.npy'])
+    return geom
+
+
+def letterbox_one(task):
+    """处理一张图：按内容 hash 找缓存 (没有就缩放) -> 链接进输出目录 -> 换算标签"""
+    key, split, src_img, src_label, old = task
+    sources = {'img': src_img}
+    if src_label:
+        sources['label'] = src_label
+
+    # 原图和标签都没动过、输出也都在、目标尺寸/格式也没换，直接沿用
+    if (old and old.get('imgsz') == IMG_SIZE and old.get('cache_format') == CACHE_FORMAT
+            and bool(old.get('label')) == bool(src_label) and is_unchanged(old, sources, OUT_DIR)):
+        return {'status': 'unchanged', 'diff': 'unchanged', 'record': old}
+
+    img_fp = fingerprint(src_img, old and old.get('img'))
+    sha1 = img_fp['sha1']
+    paths = store_paths(sha1)
+    geom = _known_geom.get(sha1)
+    status = 'linked'
+    if geom is None or not all(os.path.exists(p) for p in paths.values()):
+        geom = build_store(src_img, paths, _size_hints.get((split, os.path.basename(src_img))))
+        if geom is None:
+            return {'status': 'bad_image', 'msg': f"[跳过] 图片无法解码: {src_img}"}
+        status = 'resized'
+
+    record = {'split': split, 'image': src_img, 'img': img_fp, 'imgsz': IMG_SIZE, 'cache_format': CACHE_FORMAT,
+              'geom': geom, 'size': [IMG_SIZE, IMG_SIZE], 'cls': [], 'boxes': [], 'outputs': []}
+    stem = output_stem(os.path.basename(src_img))
+    # 第一个输出是图片 (标签缓存按这个约定找图片)
+    for ext, store_path in paths.items():
+        dst = os.path.join(OUT_DIR, 'images', split, stem + ext)
+        materialize(store_path, dst, 'hardlink')
+        record['outputs'].append(rel_output(OUT_DIR, dst))
+
+    if src_label:
+        record['label'] = fingerprint(src_label, old and old.get('label'))
+        with open(src_label, 'r', encoding='utf-8') as f:
+            text, record['cls'], record['boxes'] = rescale_label_lines(f, geom, IMG_SIZE)
+        dst_label = os.path.join(OUT_DIR, 'labels', split, stem + '.txt')
+        with open(dst_label, 'w', encoding='utf-8') as f:
+            f.write(text)
+        record['outputs'].append(rel_output(OUT_DIR, dst_label))
+
+    return {'status': status, 'diff': 'changed' if old else 'added', 'record': record}
+
+
+def collect_tasks(old_entries):
+    tasks = []
+    for split in SPLITS:
+        img_dir = os.path.join(DATA_DIR, 'images', split)
+        label_dir = os.path.join(DATA_DIR, 'labels', split)
+        if not os.path.isdir(img_dir):
+            continue
+        os.makedirs(os.path.join(OUT_DIR, 'images', split), exist_ok=True)
+        os.makedirs(os.path.join(OUT_DIR, 'labels', split), exist_ok=True)
+        with os.scandir(img_dir) as it:
+            names = sorted(e.name for e in it if e.is_file() and e.name.lower().endswith(IMAGE_EXTS))
+        for name in names:
+            src_label = os.path.join(label_dir, os.path.splitext(name)[0] + '.txt')
+            key = f'{split}/{name}'
+            tasks.append((key, split, os.path.join(img_dir, name),
+                          src_label if os.path.exists(src_label) else None, old_entries.get(key)))
+    return tasks
+
+
+def collect_garbage(entries):
+    """删掉 .store 里已经没有任何图片引用的缩放结果"""
+    keep = set()
+    for record in entries.values():
+        keep.update(os.path.normcase(os.path.abspath(p)) for p in store_paths(record['img']['sha1']).values())
+    store = os.path.join(OUT_DIR, STORE_DIR)
+    removed = 0
+    for root, dirs, files in os.walk(store):
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.normcase(os.path.abspath(path)) not in keep:
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def main():
+    manifest_file = manifest_path(OUT_DIR, 'letterbox')
+    os.makedirs(OUT_DIR, exist_ok=True)
+    old_entries = load_manifest(manifest_file)
+    tasks = collect_tasks(old_entries)
+    print(f"找到 {len(tasks)} 张图片，缩放到 {IMG_SIZE}x{IMG_SIZE} ({CACHE_FORMAT})...")
+
+    # 上次缩放过的图片 (按内容 hash) 的几何参数，命中 .store 时换算标签要用
+    known_geom = {r['img']['sha1']: r['geom'] for r in old_entries.values()
+                  if r.get('imgsz') == IMG_SIZE and 'geom' in r}
+    # 转换脚本写的标签缓存里有原图尺寸，解码前就能选好 JPEG 的缩小倍数
+    size_hints = {}
+    for split in SPLITS:
+        cache = load_label_cache(DATA_DIR, split)
+        if cache is not None:
+            size_hints.update(((split, n), tuple(s)) for n, s in zip(cache['names'].tolist(), cache['sizes'].tolist()))
+
+    new_entries = {}
+    diff = Counter()
+
+    def on_result(task, result, stats):
+        if 'record' in result:
+            new_entries[task[0]] = result['record']
+            diff[result['diff']] += 1
+        if result.get('msg'):
+            print(result['msg'])
+
+    stats = run_tasks(letterbox_one, tasks, NUM_WORKERS, on_result=on_result,
+                      initializer=init_worker, initargs=(known_geom, size_hints))
+
+    removed_files = remove_stale_outputs(OUT_DIR, old_entries, new_entries)
+    save_manifest(manifest_file, new_entries)
+    removed_store = collect_garbage(new_entries)
+    write_label_cache(OUT_DIR, new_entries)
+
+    print(f"\n处理完毕！")
+    print_diff_summary(diff, old_entries, new_entries, removed_files)
+    print(f"  重新缩放: {stats['resized']}  复用缓存: {stats['linked']}  未变: {stats['unchanged']}  "
+          f"无法解码: {stats['bad_image']}  清理缓存: {removed_store} 个")
+    print(f"数据已保存在: {OUT_DIR}")
+    print(f"训练时把 bamboo.yaml 的 path 改成上面的路径，imgsz={IMG_SIZE}"
+          + ("，并加上 cache='disk'" if CACHE_FORMAT == 'npy' else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,16 @@
 import cv2
 import numpy as np
 import os
+import sys
 import random
-from tqdm import tqdm
+from collections import Counter, OrderedDict
+
+# 让子文件夹里的脚本也能 import 仓库根目录的公共模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from convert_pool import run_tasks
 
 # ================= 配置区域 =================
+# 相对路径按本脚本所在的 making_pictures/ 文件夹算 (不受当前工作目录影响，训练脚本 import 时也能找到)
 # 建议路径结构：
 # make_data/
 #   ├── backgrounds/ (放正常的竹子图)
@@ -26,13 +32,42 @@ CLS_ID_MISSING = 3  # 边壁缺失
 # 虫眼生成的数量范围
 HOLES_PER_IMAGE_MIN = 3
 HOLES_PER_IMAGE_MAX = 8
+
+# 随机种子：同一个种子、同样的素材，生成的图片每次都一模一样 (和进程数无关)；None 表示每次随机
+SEED = 0
+
+# 并行进程数：1 为串行，0 为使用全部 CPU 核
+NUM_WORKERS = 0
+
+# 缓存 (每个进程各一份)：背景图解码结果 / 变换后的素材，超出预算时淘汰最久没用过的
+BG_CACHE_MB = 512
+PATCH_BANK_MB = 256
+# 素材变换的取整步长：角度 (度) 和缩放比例；取整后同样的变体只生成一次。PATCH_ANGLE_STEP = 0 表示不取整、不缓存
+PATCH_ANGLE_STEP = 5
+PATCH_SCALE_STEP = 0.05
+
+# 放置：按 PLACE_CELL 像素一格记录占用，缺陷之间至少隔 PLACE_GAP 像素、互不重叠
+PLACE_CELL = 16
+PLACE_GAP = 4
+# 标签框只包住 alpha 大于这个值的像素 (羽化的半透明边不算)
+LABEL_ALPHA_MIN = 32
 # ===========================================
 
+# 每张图用自己的随机数生成器，种子由 (SEED, 图片序号) 推出来：
+# 不管分给哪个进程、按什么顺序生成，第 i 张图抽到的随机数都一样，所以结果和 NUM_WORKERS 无关
+def image_rng(base_seed, i):
+    return random.Random(f"{base_seed}:{i}")  # 字符串种子走 sha512，不受 PYTHONHASHSEED 影响
+
+def data_path(path):
+    """配置里的相对路径按本脚本所在文件夹解析"""
+    return path if os.path.isabs(path) else os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
 def load_images_from_folder(folder):
     images = []
+    folder = data_path(folder)
     if not os.path.exists(folder):
         return []
-    for filename in os.listdir(folder):
+    for filename in sorted(os.listdir(folder)):  # 排序，保证不同机器上素材顺序一致
         # 读取图片，IMREAD_UNCHANGED 确保读取 Alpha 透明通道
         img = cv2.imread(os.path.join(folder, filename), cv2.IMREAD_UNCHANGED)
         if img is not None:
@@ -62,8 +97,20 @@ def rotate_image(image, angle):
     # 4. 执行旋转 (注意 borderValue=(0,0,0,0) 填充透明色)
     return cv2.warpAffine(image, M, (nW, nH), borderMode=cv2.BORDER_CONSTANT, borderValue=(0,0,0,0))
 
+# overlay_image_alpha 用的缓冲区，按需变大后一直复用，贴图时不再反复分配临时数组
+_blend_buf = np.empty(0, dtype=np.uint8)
+
+def _buffers(h, w):
+    """返回 (颜色 h*w*3, alpha h*w, 三通道 alpha h*w*3) 三块 uint8 视图"""
+    global _blend_buf
+    n = h * w
+    if _blend_buf.size < 7 * n:
+        _blend_buf = np.empty(7 * n, dtype=np.uint8)
+    return (_blend_buf[:3 * n].reshape(h, w, 3), _blend_buf[3 * n:4 * n].reshape(h, w),
+            _blend_buf[4 * n:7 * n].reshape(h, w, 3))
+
 def overlay_image_alpha(img, img_overlay, x, y):
-    """把带透明通道的 patch 贴到背景 img 上"""
+    """把带透明通道的 patch 贴到背景 img (3 通道 BGR) 上，原地修改 img"""
     h, w = img.shape[:2]
     h_ov, w_ov = img_overlay.shape[:2]
 
@@ -83,39 +130,51 @@ def overlay_image_alpha(img, img_overlay, x, y):
     bg_crop = img[y1:y2, x1:x2]
     ov_crop = img_overlay[oy1:oy2, ox1:ox2]
 
-    # 提取 Alpha 通道并归一化到 0-1
-    if ov_crop.shape[2] == 4:
-        alpha = ov_crop[:, :, 3] / 255.0
-        ov_rgb = ov_crop[:, :, :3]
-    else:
-        alpha = np.ones((ov_crop.shape[0], ov_crop.shape[1]))
-        ov_rgb = ov_crop
+    # 没有透明通道：直接覆盖
+    if ov_crop.shape[2] < 4:
+        bg_crop[...] = ov_crop
+        return img
 
-    # 扩展 alpha 维度以匹配 RGB (H, W, 1) -> (H, W, 3)
-    alpha = alpha[:, :, np.newaxis]
+    rgb, alpha, alpha3 = _buffers(y2 - y1, x2 - x1)
+    cv2.cvtColor(ov_crop, cv2.COLOR_BGRA2BGR, dst=rgb)
+    cv2.extractChannel(ov_crop, 3, dst=alpha)
 
-    # 混合运算: Output = Alpha * Overlay + (1 - Alpha) * Background
-    img[y1:y2, x1:x2, :3] = (alpha * ov_rgb + (1 - alpha) * bg_crop[:, :, :3]).astype(np.uint8)
+    # 整块不透明：直接覆盖；整块全透明：什么都不用做
+    lo, hi = cv2.minMaxLoc(alpha)[:2]
+    if lo == 255:
+        bg_crop[...] = rgb
+        return img
+    if hi == 0:
+        return img
+
+    # 混合运算: Output = Alpha/255 * Overlay + (255 - Alpha)/255 * Background
+    # 全部是 OpenCV 的 uint8 运算 (带 SIMD)，两项各自四舍五入后相加，和原来的浮点写法最多差 1
+    cv2.cvtColor(alpha, cv2.COLOR_GRAY2BGR, dst=alpha3)
+    cv2.multiply(rgb, alpha3, dst=rgb, scale=1 / 255)
+    cv2.bitwise_not(alpha3, dst=alpha3)
+    cv2.multiply(bg_crop, alpha3, dst=bg_crop, scale=1 / 255)
+    cv2.add(bg_crop, rgb, dst=bg_crop)
     
     return img
 
-def process_patch(patch):
-    """对单个素材进行随机变换：翻转 -> 旋转 -> 缩放"""
-    # 1. 随机翻转 (Flip)
-    if random.random() > 0.5:
+def draw_patch_params(rng=random):
+    """抽一组随机变换参数 (水平翻转, 垂直翻转, 旋转角度, x 缩放, y 缩放)"""
+    flip_h = rng.random() > 0.5
+    flip_v = rng.random() > 0.5
+    angle = rng.uniform(0, 360)
+    # 让宽高缩放比例不同，圆形虫眼变椭圆，模拟不同视角
+    scale_x = rng.uniform(0.5, 1.2)
+    scale_y = rng.uniform(0.5, 1.2)
+    return flip_h, flip_v, angle, scale_x, scale_y
+
+def flip_rotate(patch, flip_h, flip_v, angle):
+    if flip_h:
         patch = cv2.flip(patch, 1) # 水平翻转
-    if random.random() > 0.5:
+    if flip_v:
         patch = cv2.flip(patch, 0) # 垂直翻转
+    return rotate_image(patch, angle)
 
-    # 2. 随机旋转 (Rotate)
-    angle = random.uniform(0, 360)
-    patch = rotate_image(patch, angle)
-
-    # 3. 随机缩放 + 形变 (Scale & Aspect Ratio)
-    # 让宽高缩放比例不同，圆形虫眼变椭圆，模拟不同视角
-    scale_x = random.uniform(0.5, 1.2)
-    scale_y = random.uniform(0.5, 1.2) 
-    
+def scale_patch(patch, scale_x, scale_y):
     new_h = int(patch.shape[0] * scale_y)
     new_w = int(patch.shape[1] * scale_x)
     
@@ -123,98 +182,285 @@ def process_patch(patch):
     new_h = max(10, new_h)
     new_w = max(10, new_w)
     
-    patch = cv2.resize(patch, (new_w, new_h))
-    return patch
+    return cv2.resize(patch, (new_w, new_h))
+
+def process_patch(patch, rng=random):
+    """对单个素材进行随机变换：翻转 -> 旋转 -> 缩放"""
+    flip_h, flip_v, angle, scale_x, scale_y = draw_patch_params(rng)
+    return scale_patch(flip_rotate(patch, flip_h, flip_v, angle), scale_x, scale_y)
+
+def _nbytes(value):
+    return sum(v.nbytes for v in value if isinstance(v, np.ndarray)) if isinstance(value, tuple) else value.nbytes
+
+class LRUCache:
+    """按字节数限额的缓存 (存 numpy 数组或数组的元组)，超出预算时淘汰最久没用过的"""
+
+    def __init__(self, budget_mb):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.items = OrderedDict()
+        self.bytes = 0
+
+    def get_or_create(self, key, create):
+        """命中直接返回 (调用方不能修改它)；没命中调用 create() 生成并放进缓存"""
+        arr = self.items.get(key)
+        if arr is not None:
+            self.items.move_to_end(key)
+            return arr
+        arr = create()
+        if arr is None or _nbytes(arr) > self.budget:
+            return arr
+        self.items[key] = arr
+        self.bytes += _nbytes(arr)
+        while self.bytes > self.budget:
+            _, old = self.items.popitem(last=False)
+            self.bytes -= _nbytes(old)
+        return arr
+
+class PatchBank:
+    """
+    变换后的素材库：角度按 PATCH_ANGLE_STEP、缩放按 PATCH_SCALE_STEP 取整后作为键，用到哪个变体才生成哪个
+    素材只有几十张时，翻转+旋转 (warpAffine 还要扩画布) 的结果很快就能反复命中，缩放在它的基础上再缓存一层
+    """
+
+    def __init__(self, name, patches, cache):
+        self.name = name
+        self.patches = patches
+        self.cache = cache
+
+    def __len__(self):
+        return len(self.patches)
+
+    def sample(self, idx, rng):
+        """返回 (裁掉透明边的素材, 标签框 (x0, y0, x1, y1)，素材内坐标)"""
+        flip_h, flip_v, angle, scale_x, scale_y = draw_patch_params(rng)
+        patch = self.patches[idx]
+        if not PATCH_ANGLE_STEP:
+            return trim_patch(scale_patch(flip_rotate(patch, flip_h, flip_v, angle), scale_x, scale_y))
+        a = round(angle / PATCH_ANGLE_STEP) % round(360 / PATCH_ANGLE_STEP)
+        sx, sy = round(scale_x / PATCH_SCALE_STEP), round(scale_y / PATCH_SCALE_STEP)
+        key = (self.name, idx, flip_h, flip_v, a)
+        rotated = self.cache.get_or_create(key, lambda: flip_rotate(patch, flip_h, flip_v, a * PATCH_ANGLE_STEP))
+        return self.cache.get_or_create(key + (sx, sy), lambda: trim_patch(
+            scale_patch(rotated, sx * PATCH_SCALE_STEP, sy * PATCH_SCALE_STEP)))
+
+def alpha_extent(alpha, threshold):
+    """alpha > threshold 的外接框 (x0, y0, x1, y1)，右下不含；全透明返回 None"""
+    mask = alpha > threshold
+    cols, rows = mask.any(axis=0), mask.any(axis=1)
+    if not cols.any():
+        return None
+    x0, x1 = int(cols.argmax()), len(cols) - int(cols[::-1].argmax())
+    y0, y1 = int(rows.argmax()), len(rows) - int(rows[::-1].argmax())
+    return x0, y0, x1, y1
+
+def trim_patch(patch):
+    """
+    旋转会把画布扩大，四角全是透明的：先裁到 alpha > 0 的范围 (贴图、占位都按它算)，
+    标签框再按 alpha > LABEL_ALPHA_MIN 取，半透明的羽化边不算进框里
+    """
+    h, w = patch.shape[:2]
+    if patch.ndim < 3 or patch.shape[2] < 4:
+        return patch, np.array([0, 0, w, h])
+    extent = alpha_extent(patch[:, :, 3], 0)
+    if extent is None:
+        return patch, np.array([0, 0, w, h])
+    x0, y0, x1, y1 = extent
+    patch = np.ascontiguousarray(patch[y0:y1, x0:x1])
+    box = alpha_extent(patch[:, :, 3], LABEL_ALPHA_MIN) or (0, 0, x1 - x0, y1 - y0)
+    return patch, np.array(box)
+
+class OccupancyGrid:
+    """
+    一张图的占用位图：每 PLACE_CELL 像素一格，记哪些格子已经贴了缺陷，另存一份积分图 (summed-area table)
+    任意矩形里有没有被占的格子都是 4 次查表 (O(1))，不用和已放的缺陷两两比较；
+    而且一次就能算出所有放得下的位置，直接在里面随机挑，不会反复重试
+    """
+
+    def __init__(self, h, w, cell):
+        self.h, self.w, self.cell = h, w, cell
+        self.grid = np.zeros((-(-h // cell), -(-w // cell)), dtype=bool)
+        self.sat = np.zeros((self.grid.shape[0] + 1, self.grid.shape[1] + 1), dtype=np.int32)
+
+    def place(self, ph, pw, rng):
+        """给 ph x pw 的素材找一个不和已有缺陷重叠的位置，返回 (x, y)；放不下返回 None"""
+        c = self.cell
+        gh, gw = self.grid.shape
+        # 起点在格子里任意偏移时，素材最多跨几格
+        fh, fw = (ph + 2 * c - 2) // c, (pw + 2 * c - 2) // c
+        gy = np.arange(gh)[:, None]
+        gx = np.arange(gw)[None, :]
+        y1, x1 = np.minimum(gy + fh, gh), np.minimum(gx + fw, gw)
+        used = self.sat[y1, x1] - self.sat[gy, x1] - self.sat[y1, gx] + self.sat[gy, gx]
+        free = np.flatnonzero((used == 0) & (gy * c <= self.h - ph) & (gx * c <= self.w - pw))
+        if not len(free):
+            return None
+        gy, gx = divmod(int(free[rng.randrange(len(free))]), gw)
+        y = gy * c + rng.randint(0, min(c - 1, self.h - ph - gy * c))
+        x = gx * c + rng.randint(0, min(c - 1, self.w - pw - gx * c))
+        return x, y
+
+    def occupy(self, x, y, pw, ph, gap=0):
+        c = self.cell
+        self.grid[max(0, y - gap) // c:(min(self.h, y + ph + gap) - 1) // c + 1,
+                  max(0, x - gap) // c:(min(self.w, x + pw + gap) - 1) // c + 1] = True
+        self.sat[1:, 1:] = self.grid.cumsum(axis=0).cumsum(axis=1)
+
+def paste_patch(bg_img, grid, bank, rng, cls_id):
+    """从素材库抽一个变体，找空位贴上去，返回 YOLO 标签 (类别, xc, yc, w, h)；没有空位返回 None"""
+    # 随机选一个素材并进行变换 (从变换库里取，同样的变体只算一次)
+    patch_idx = rng.randrange(len(bank))
+    patch_processed, box = bank.sample(patch_idx, rng)
+    ph, pw = patch_processed.shape[:2]
+
+    pos = grid.place(ph, pw, rng)
+    if pos is None:
+        return None
+    x, y = pos
+    grid.occupy(x, y, pw, ph, PLACE_GAP)
+
+    # 贴上去
+    overlay_image_alpha(bg_img, patch_processed, x, y)
+
+    # 计算 YOLO 标签 (归一化中心坐标)，框只包住看得见的部分
+    h_bg, w_bg = bg_img.shape[:2]
+    bx0, by0, bx1, by1 = box.tolist()
+    xc = (x + (bx0 + bx1) / 2) / w_bg
+    yc = (y + (by0 + by1) / 2) / h_bg
+    nw = (bx1 - bx0) / w_bg
+    nh = (by1 - by0) / h_bg
+    return cls_id, xc, yc, nw, nh
+
+# 子进程里用到的素材和缓存 (由 init_worker 准备，每个进程各一份)
+_bg_files = []
+_bg_cache = None
+_hole_patches = None
+_missing_patches = None
+_base_seed = 0
+
+def init_worker(bg_files, base_seed, bg_cache_mb=BG_CACHE_MB, patch_bank_mb=PATCH_BANK_MB):
+    global _bg_files, _bg_cache, _hole_patches, _missing_patches, _base_seed
+    cv2.setNumThreads(1)  # 并行靠多进程，OpenCV 内部再开线程只会互相抢核
+    _bg_files = bg_files
+    _bg_cache = LRUCache(bg_cache_mb)
+    bank_cache = LRUCache(patch_bank_mb)
+    _hole_patches = PatchBank('hole', load_images_from_folder(PATCH_HOLES_DIR), bank_cache)
+    _missing_patches = PatchBank('missing', load_images_from_folder(PATCH_MISSING_DIR), bank_cache)
+    _base_seed = base_seed
+
+def compose(rng):
+    """
+    用 rng 合成一张图 (需要先 init_worker)，返回 (背景路径, 图片, 标签列表, 想放的缺陷数)
+    标签是 [(类别, xc, yc, w, h), ...] (归一化)；背景读不出来时图片为 None
+    写文件的 generate_one 和训练时在内存里现做的 synthetic_stream 共用这一份
+    """
+    # A. 随机选一张背景
+    bg_path = rng.choice(_bg_files)
+    bg_img = _bg_cache.get_or_create(bg_path, lambda: cv2.imread(bg_path))
+    if bg_img is None:
+        return bg_path, None, [], 0
+    bg_img = bg_img.copy()  # 缓存里的原图不能被贴图改掉
+
+    labels = []
+    grid = OccupancyGrid(*bg_img.shape[:2], PLACE_CELL)
+
+    # B. 随机决定造什么缺陷
+    mode = rng.choice(['hole', 'missing'])
+    if not _hole_patches: mode = 'missing'
+    if not _missing_patches: mode = 'hole'
+
+    if mode == 'hole':
+        # --- 造虫眼 (随机生成多个，互不重叠) ---
+        num_holes = rng.randint(HOLES_PER_IMAGE_MIN, HOLES_PER_IMAGE_MAX)
+        for _ in range(num_holes):
+            label = paste_patch(bg_img, grid, _hole_patches, rng, CLS_ID_HOLE)
+            if label:
+                labels.append(label)
+        requested = num_holes
+
+    else:
+        # --- 造边壁缺失 (通常只造一个大的) ---
+        # 对于边壁缺失，稍微放大一点点范围 (0.8 - 1.5)
+        # process_patch 里默认是 0.5-1.2，这里如果您觉得不够大，可以再乘个系数，或者改上面的参数
+        label = paste_patch(bg_img, grid, _missing_patches, rng, CLS_ID_MISSING)
+        if label:
+            labels.append(label)
+        requested = 1
+
+    return bg_path, bg_img, labels, requested
+
+def generate_one(i):
+    """生成第 i 张合成图和它的标签"""
+    bg_path, bg_img, labels, requested = compose(image_rng(_base_seed, i))
+    if bg_img is None:
+        return {'status': 'bad_bg', 'msg': f"[跳过] 背景图读取失败: {bg_path}"}
+
+    # C. 保存结果
+    out_name = f"aug_adv_{i:04d}"
+    cv2.imwrite(os.path.join(data_path(OUTPUT_DIR), 'images', f"{out_name}.jpg"), bg_img)
+    # 只有当 labels 不为空时才保存 txt (防止生成空标签文件)；上一批同名的旧标签要删掉
+    label_path = os.path.join(data_path(OUTPUT_DIR), 'labels', f"{out_name}.txt")
+    if labels:
+        with open(label_path, 'w') as f:
+            f.write('\n'.join(f"{c} {xc:.6f} {yc:.6f} {w:.6f} {h:.6f}" for c, xc, yc, w, h in labels))
+    elif os.path.exists(label_path):
+        os.remove(label_path)
+
+    return {'status': 'ok', 'requested': requested, 'placed': len(labels)}
+
+
+def list_backgrounds():
+    bg_dir = data_path(BG_DIR)
+    if not os.path.isdir(bg_dir):
+        return []
+    return [os.path.join(bg_dir, f) for f in sorted(os.listdir(bg_dir)) if f.endswith(('.jpg', '.png', '.jpeg'))]
+
+def check_materials(bg_files, hole_patches, missing_patches):
+    """素材齐全返回 None，否则返回错误提示"""
+    if not bg_files:
+        return f"❌ 错误：背景文件夹是空的或不存在 ({data_path(BG_DIR)})！请放入竹子原图。"
+    if not hole_patches and not missing_patches:
+        return (f"❌ 错误：没有找到素材贴纸！请在 {data_path(PATCH_HOLES_DIR)} 或 "
+                f"{data_path(PATCH_MISSING_DIR)} 下放入 png 文件。")
+    return None
 
 def main():
     # 1. 准备目录
-    os.makedirs(os.path.join(OUTPUT_DIR, 'images'), exist_ok=True)
-    os.makedirs(os.path.join(OUTPUT_DIR, 'labels'), exist_ok=True)
+    os.makedirs(os.path.join(data_path(OUTPUT_DIR), 'images'), exist_ok=True)
+    os.makedirs(os.path.join(data_path(OUTPUT_DIR), 'labels'), exist_ok=True)
 
     # 2. 加载素材
-    bg_files = [os.path.join(BG_DIR, f) for f in os.listdir(BG_DIR) if f.endswith(('.jpg', '.png', '.jpeg'))]
+    bg_files = list_backgrounds()
     hole_patches = load_images_from_folder(PATCH_HOLES_DIR)
     missing_patches = load_images_from_folder(PATCH_MISSING_DIR)
 
-    if not bg_files:
-        print("❌ 错误：背景文件夹是空的！请在 make_data/backgrounds 放入竹子原图。")
-        return
-    if not hole_patches and not missing_patches:
-        print("❌ 错误：没有找到素材贴纸！请在 make_data/patches/holes 或 missing 下放入 png 文件。")
+    error = check_materials(bg_files, hole_patches, missing_patches)
+    if error:
+        print(error)
         return
 
     print(f"🚀 开始生成 {NUM_TO_GENERATE} 张“超级增强版”合成数据...")
 
-    for i in tqdm(range(NUM_TO_GENERATE)):
-        # A. 随机选一张背景
-        bg_path = random.choice(bg_files)
-        bg_img = cv2.imread(bg_path)
-        if bg_img is None: continue
-        
-        h_bg, w_bg = bg_img.shape[:2]
-        labels = [] 
-        
-        # B. 随机决定造什么缺陷
-        mode = random.choice(['hole', 'missing'])
-        if not hole_patches: mode = 'missing'
-        if not missing_patches: mode = 'hole'
-
-        if mode == 'hole':
-            # --- 造虫眼 (随机生成多个) ---
-            num_holes = random.randint(HOLES_PER_IMAGE_MIN, HOLES_PER_IMAGE_MAX)
-            for _ in range(num_holes):
-                # 随机选一个素材并进行变换
-                patch = random.choice(hole_patches)
-                patch_processed = process_patch(patch)
-                
-                ph, pw = patch_processed.shape[:2]
-                
-                # 随机位置 (避开最边缘，防止贴出去太多)
-                if w_bg > pw and h_bg > ph:
-                    x = random.randint(0, w_bg - pw)
-                    y = random.randint(0, h_bg - ph)
-                    
-                    # 贴上去
-                    bg_img = overlay_image_alpha(bg_img, patch_processed, x, y)
-                    
-                    # 计算 YOLO 标签 (归一化中心坐标)
-                    xc = (x + pw / 2) / w_bg
-                    yc = (y + ph / 2) / h_bg
-                    nw = pw / w_bg
-                    nh = ph / h_bg
-                    labels.append(f"{CLS_ID_HOLE} {xc:.6f} {yc:.6f} {nw:.6f} {nh:.6f}")
-
-        elif mode == 'missing':
-            # --- 造边壁缺失 (通常只造一个大的) ---
-            patch = random.choice(missing_patches)
-            patch_processed = process_patch(patch)
-            
-            # 对于边壁缺失，稍微放大一点点范围 (0.8 - 1.5)
-            # process_patch 里默认是 0.5-1.2，这里如果您觉得不够大，可以再乘个系数，或者改上面的参数
-            
-            ph, pw = patch_processed.shape[:2]
-            
-            if w_bg > pw and h_bg > ph:
-                x = random.randint(0, w_bg - pw)
-                y = random.randint(0, h_bg - ph)
-                
-                bg_img = overlay_image_alpha(bg_img, patch_processed, x, y)
-                
-                xc = (x + pw / 2) / w_bg
-                yc = (y + ph / 2) / h_bg
-                nw = pw / w_bg
-                nh = ph / h_bg
-                labels.append(f"{CLS_ID_MISSING} {xc:.6f} {yc:.6f} {nw:.6f} {nh:.6f}")
-
-        # C. 保存结果
-        out_name = f"aug_adv_{i:04d}"
-        cv2.imwrite(os.path.join(OUTPUT_DIR, 'images', f"{out_name}.jpg"), bg_img)
-        # 只有当 labels 不为空时才保存 txt (防止生成空标签文件)
-        if labels:
-            with open(os.path.join(OUTPUT_DIR, 'labels', f"{out_name}.txt"), 'w') as f:
-                f.write('\n'.join(labels))
-
-    print(f"✅ 完成！生成数据已保存在: {OUTPUT_DIR}")
+    base_seed = SEED if SEED is not None else random.randrange(2 ** 32)
+    print(f"随机种子: {base_seed} (把 SEED 设成它可以原样复现这一批)")
+
+    placement = Counter()
+
+    def on_result(task, result, stats):
+        placement['requested'] += result.get('requested', 0)
+        placement['placed'] += result.get('placed', 0)
+        if result.get('msg'):
+            print(result['msg'])
+
+    stats = run_tasks(generate_one, range(NUM_TO_GENERATE), NUM_WORKERS, on_result=on_result,
+                      initializer=init_worker, initargs=(bg_files, base_seed))
+    if stats['bad_bg']:
+        print(f"背景图读取失败跳过: {stats['bad_bg']} 张")
+    rate = placement['placed'] / max(placement['requested'], 1)
+    print(f"缺陷放置成功率: {rate:.1%} ({placement['placed']}/{placement['requested']})")
+    if rate < 1:
+        print("💡 放不下的是图上已经没有不重叠的空位，可以调小 PLACE_CELL / PLACE_GAP 或减少每张的虫眼数")
+
+    print(f"✅ 完成！生成数据已保存在: {data_path(OUTPUT_DIR)}")
     print("💡 下一步：请将 output/images 和 output/labels 里的文件复制到您的训练集中。")
 
 if __name__ == "__main__":
@@ -0,0 +1,94 @@
+import os
+import sys
+import time
+import numpy as np
+
+# 贴图混合的小测速：copy_paste_aug.overlay_image_alpha (OpenCV uint8 运算、原地写) 对比原来的浮点写法
+# 同时检查两者输出逐像素最多差 1
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from copy_paste_aug import overlay_image_alpha
+
+# ================= 配置区域 =================
+BG_SIZE = (1080, 1920)           # 背景图 (高, 宽)
+PATCH_SIZES = [40, 120, 400]     # 素材边长 (虫眼小、边壁缺失大)
+REPEAT = 300
+SEED = 0
+# ===========================================
+
+
+def overlay_image_alpha_float(img, img_overlay, x, y):
+    """原来的实现：alpha / 255.0 变成 float64，再整块算混合"""
+    h, w = img.shape[:2]
+    h_ov, w_ov = img_overlay.shape[:2]
+    if x >= w or y >= h or x + w_ov <= 0 or y + h_ov <= 0:
+        return img
+    x1, y1 = max(0, x), max(0, y)
+    x2, y2 = min(w, x + w_ov), min(h, y + h_ov)
+    ox1, oy1 = max(0, -x), max(0, -y)
+    ox2, oy2 = ox1 + (x2 - x1), oy1 + (y2 - y1)
+    bg_crop = img[y1:y2, x1:x2]
+    ov_crop = img_overlay[oy1:oy2, ox1:ox2]
+    if ov_crop.shape[2] == 4:
+        alpha = ov_crop[:, :, 3] / 255.0
+        ov_rgb = ov_crop[:, :, :3]
+    else:
+        alpha = np.ones((ov_crop.shape[0], ov_crop.shape[1]))
+        ov_rgb = ov_crop
+    alpha = alpha[:, :, np.newaxis]
+    img[y1:y2, x1:x2, :3] = (alpha * ov_rgb + (1 - alpha) * bg_crop[:, :, :3]).astype(np.uint8)
+    return img
+
+
+def make_patch(rng, size, kind):
+    """kind: 'soft' 圆形 + 羽化边缘 / 'opaque' 全不透明 / 'rgb' 没有透明通道"""
+    rgb = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+    if kind == 'rgb':
+        return rgb
+    if kind == 'opaque':
+        alpha = np.full((size, size), 255, dtype=np.uint8)
+    else:
+        yy, xx = np.mgrid[:size, :size]
+        r = np.hypot(yy - size / 2, xx - size / 2) / (size / 2)
+        alpha = (np.clip(1.2 - r, 0, 0.4) / 0.4 * 255).astype(np.uint8)
+    return np.dstack([rgb, alpha])
+
+
+def time_it(fn, bg, patch, positions):
+    img = bg.copy()
+    t0 = time.perf_counter()
+    for x, y in positions:
+        fn(img, patch, x, y)
+    return (time.perf_counter() - t0) / len(positions) * 1e6
+
+
+def main():
+    rng = np.random.default_rng(SEED)
+    bg = rng.integers(0, 256, (*BG_SIZE, 3), dtype=np.uint8)
+    worst = 0
+    print(f"{'素材':>14} {'浮点 (us)':>10} {'OpenCV (us)':>11} {'加速':>6} {'最大差':>6}")
+    for size in PATCH_SIZES:
+        for kind in ('soft', 'opaque', 'rgb'):
+            patch = make_patch(rng, size, kind)
+            # 包含一部分贴出画布边缘的位置
+            positions = list(zip(rng.integers(-size // 2, BG_SIZE[1] - size // 2, REPEAT).tolist(),
+                                 rng.integers(-size // 2, BG_SIZE[0] - size // 2, REPEAT).tolist()))
+
+            # 每个位置单独贴一次比较 (连续贴在同一张图上，重叠处的误差会累积)
+            diff = 0
+            for x, y in positions[:20]:
+                a, b = bg.copy(), bg.copy()
+                overlay_image_alpha_float(a, patch, x, y)
+                overlay_image_alpha(b, patch, x, y)
+                diff = max(diff, int(np.abs(a.astype(np.int16) - b.astype(np.int16)).max()))
+            worst = max(worst, diff)
+
+            t_float = time_it(overlay_image_alpha_float, bg, patch, positions)
+            t_cv = time_it(overlay_image_alpha, bg, patch, positions)
+            print(f"{f'{size}x{size} {kind}':>14} {t_float:10.1f} {t_cv:11.1f} {t_float / t_cv:5.1f}x {diff:6d}")
+
+    print(f"\n最大像素差: {worst} ({'通过' if worst <= 1 else '超出 ±1'})")
+
+
+if __name__ == '__main__':
+    main()
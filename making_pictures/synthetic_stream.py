@@ -0,0 +1,159 @@
+import os
+import sys
+import math
+import random
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import copy_paste_aug
+
+try:
+    from ultralytics.data import build
+    from ultralytics.data.dataset import YOLODataset
+except ImportError:  # 只用 SyntheticStream 时不需要 ultralytics
+    YOLODataset = None
+
+# 训练时现做的合成样本 (不落盘)
+# copy_paste_aug.py 先生成一批 JPEG + txt 再手动拷进训练集：多一次 JPEG 编码/解码、占磁盘，
+# 而且每个 epoch 看到的都是同一批合成图。这里直接复用它的合成逻辑 (compose：贴图、放置、标签)，
+# 在 DataLoader 的 worker 进程里每次取样都现做一张，只在内存里，按比例混进真实训练集。
+# 素材路径、缺陷数量、放置参数都沿用 copy_paste_aug.py 的配置区域。
+#
+# 用法 (训练脚本里，model.train 之前)：
+#     from making_pictures.synthetic_stream import use_synthetic_stream
+#     use_synthetic_stream(0.2)    # 每个 epoch 里约 20% 的样本是现做的合成图
+# 或者单独当一个无限的样本流用：
+#     for img, labels in SyntheticStream(): ...
+
+# ================= 配置区域 =================
+# 每个 epoch 里合成样本的占比 (0~1)
+SYNTHETIC_RATIO = 0.2
+
+# 每个 DataLoader worker 进程各有一份缓存，worker 多时调小
+STREAM_BG_CACHE_MB = 128
+STREAM_PATCH_BANK_MB = 64
+# ===========================================
+
+
+class SyntheticStream:
+    """
+    无限的合成样本流，每次产出 (BGR 图片, labels)；labels 是 float32 的 (n, 5)：[类别, xc, yc, w, h] (归一化)
+    DataLoader 的每个 worker 进程第一次取样时各自加载素材，用系统随机源建随机数生成器，
+    fork 出来的进程不会抽到一样的图，每个 epoch 也都是新的
+    """
+
+    def __init__(self, bg_cache_mb=STREAM_BG_CACHE_MB, patch_bank_mb=STREAM_PATCH_BANK_MB):
+        self.bg_cache_mb = bg_cache_mb
+        self.patch_bank_mb = patch_bank_mb
+        self.rng = None
+        self._pid = None
+
+    def _ensure_loaded(self):
+        if self._pid != os.getpid():
+            bg_files = copy_paste_aug.list_backgrounds()
+            copy_paste_aug.init_worker(bg_files, 0, self.bg_cache_mb, self.patch_bank_mb)
+            error = copy_paste_aug.check_materials(bg_files, copy_paste_aug._hole_patches, copy_paste_aug._missing_patches)
+            if error:
+                raise FileNotFoundError(error)
+            self.rng = random.Random()
+            self._pid = os.getpid()
+
+    def sample(self, max_tries=5):
+        """合成一张；背景图连续读不出来时返回 None"""
+        self._ensure_loaded()
+        for _ in range(max_tries):
+            _, img, labels, _ = copy_paste_aug.compose(self.rng)
+            if img is not None:
+                return img, np.array(labels, dtype=np.float32).reshape(-1, 5)
+        return None
+
+    def __iter__(self):
+        while True:
+            sample = self.sample()
+            if sample is not None:
+                yield sample
+
+
+def _to_ultralytics_label(dataset, img, labels, index):
+    """把合成样本整理成和 YOLODataset.get_image_and_label 一样的 label 字典 (长边缩放到 imgsz)"""
+    h0, w0 = img.shape[:2]
+    r = dataset.imgsz / max(h0, w0)
+    if r != 1:
+        w, h = min(math.ceil(w0 * r), dataset.imgsz), min(math.ceil(h0 * r), dataset.imgsz)
+        img = cv2.resize(img, (w, h), interpolation=cv2.INTER_LINEAR)
+    label = {
+        'im_file': f'synthetic_{index}.jpg',
+        'cls': labels[:, :1],
+        'bboxes': labels[:, 1:],
+        'segments': [],
+        'keypoints': None,
+        'normalized': True,
+        'bbox_format': 'xywh',
+        'img': img,
+        'ori_shape': (h0, w0),
+        'resized_shape': img.shape[:2],
+    }
+    label['ratio_pad'] = (label['resized_shape'][0] / h0, label['resized_shape'][1] / w0)
+    return dataset.update_labels_info(label)
+
+
+# 当前进程的合成样本流 (DataLoader worker 里第一次取样时创建)；训练集的合成比例 (use_synthetic_stream 设置)
+_stream = None
+_ratio = 0.0
+
+if YOLODataset is not None:
+    class SyntheticYOLODataset(YOLODataset):
+        """
+        数据集长度按比例加长，多出来的下标每次取样都现合成一张，照常走 mosaic 等增强；验证集 (不做增强) 不受影响
+        定义在模块顶层、比例存在实例上：Windows 下 DataLoader worker 是 spawn 出来的，数据集要能 pickle 过去
+        """
+        synthetic_ratio = 0.0
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.synthetic_ratio = _ratio if self.augment else 0.0
+
+        def __len__(self):
+            n = len(self.labels)
+            return n + round(n * self.synthetic_ratio / (1 - self.synthetic_ratio))
+
+        def get_image_and_label(self, index):
+            global _stream
+            if index >= len(self.labels):
+                if _stream is None:
+                    _stream = SyntheticStream()
+                sample = _stream.sample()
+                if sample is not None:
+                    return _to_ultralytics_label(self, *sample, index)
+                index = random.randrange(len(self.labels))  # 素材出问题时退回一张真实图片
+            return super().get_image_and_label(index)
+
+
+def use_synthetic_stream(ratio=SYNTHETIC_RATIO):
+    """
+    让 ultralytics 的训练集按 ratio 混进现做的合成样本 (可以和 label_cache.use_label_cache() 一起用)
+    素材在这里先检查一遍：缺了直接报错，而不是训练到一半在 DataLoader 的 worker 里才出错
+    """
+    global _ratio
+    if not 0 < ratio < 1:
+        return
+    error = copy_paste_aug.check_materials(copy_paste_aug.list_backgrounds(),
+                                           copy_paste_aug.load_images_from_folder(copy_paste_aug.PATCH_HOLES_DIR),
+                                           copy_paste_aug.load_images_from_folder(copy_paste_aug.PATCH_MISSING_DIR))
+    if error:
+        raise FileNotFoundError(error)
+    _ratio = ratio
+    build.YOLODataset = SyntheticYOLODataset
+
+
+if __name__ == '__main__':
+    # 简单测速：连续合成若干张 (不写盘)
+    import time
+    stream = SyntheticStream()
+    t0 = time.perf_counter()
+    n_boxes = 0
+    for _, (img, labels) in zip(range(200), stream):
+        n_boxes += len(labels)
+    dt = time.perf_counter() - t0
+    print(f"合成 200 张，{n_boxes} 个目标，{200 / dt:.1f} 张/秒 (单进程)")
@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+from collections import Counter
+from materialize import materialize
+
+# 增量重建用的清单 (manifest)
+# 每个源标注记录一条：标注和原图的 (大小, 修改时间, 内容 hash)、划分到哪个 split、生成了哪些输出文件。
+# 重跑时 大小+修改时间 都没变就直接跳过；变了再算 hash 决定要不要重新复制图片；
+# 源文件消失了，它以前生成的图片和标签也一起删掉。
+
+
+def manifest_path(output_dir, name):
+    return os.path.join(output_dir, f'.manifest_{name}.json')
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)['entries']
+    except (OSError, ValueError, KeyError):
+        print(f"[警告] 清单文件损坏，将全量重建: {path}")
+        return {}
+
+
+def save_manifest(path, entries):
+    # 先写临时文件再替换，中途被打断也不会留下半个清单
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': 1, 'entries': entries}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def file_hash(path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def stat_matches(path, fp):
+    """大小和修改时间都和记录一致 (不读文件内容)"""
+    if not fp:
+        return False
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return st.st_size == fp['size'] and st.st_mtime_ns == fp['mtime_ns']
+
+
+def fingerprint(path, old=None):
+    """返回 {'size', 'mtime_ns', 'sha1'}；大小和修改时间没变时直接沿用旧的 hash，不重读文件"""
+    st = os.stat(path)
+    if old and st.st_size == old['size'] and st.st_mtime_ns == old['mtime_ns']:
+        return old
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha1': file_hash(path)}
+
+
+def outputs_exist(output_dir, outputs):
+    return all(os.path.exists(os.path.join(output_dir, p)) for p in outputs)
+
+
+def is_unchanged(record, sources, output_dir):
+    """
+    record: 上次的清单记录；sources: {'ann': 标注路径, 'img': 原图路径}
+    所有源文件的大小/修改时间都没变、输出文件也都还在，才算没变
+    """
+    if not record:
+        return False
+    for field, path in sources.items():
+        if not stat_matches(path, record.get(field)):
+            return False
+    return outputs_exist(output_dir, record['outputs'])
+
+
+def rel_output(output_dir, path):
+    # 清单里统一存相对路径 + 正斜杠，换盘符/换系统也能用
+    return os.path.relpath(path, output_dir).replace(os.sep, '/')
+
+
+def record_image(src, old, record):
+    """把原图路径和指纹记到 record 里，返回是否和上次是同一张原图"""
+    same_image = bool(old) and old.get('image') == src
+    record['image'] = src
+    record['img'] = fingerprint(src, old['img'] if same_image else None)
+    return same_image
+
+
+def sync_image(src, dst, old, record, output_dir, link_mode='copy', transfers=None):
+    """
+    把原图落地到 dst，并把原图指纹和输出路径记到 record 里
+    和上次是同一张原图、内容 hash 没变、目标文件也还在时，跳过复制
+    传了 transfers 列表时不在这里复制，只把 (src, dst) 加进去，由主进程交给 TransferEngine 后台传输
+    """
+    same_image = record_image(src, old, record)
+    rel = rel_output(output_dir, dst)
+    record['outputs'].append(rel)
+    if (same_image and old['img']['sha1'] == record['img']['sha1']
+            and rel in old['outputs'] and os.path.exists(dst)):
+        return False
+    if transfers is not None:
+        transfers.append((src, dst))
+    else:
+        materialize(src, dst, link_mode)
+    return True
+
+
+def remove_stale_outputs(output_dir, old_entries, new_entries):
+    """删除旧清单里有、新清单里不再需要的输出文件，返回删除的文件数"""
+    keep = set()
+    for record in new_entries.values():
+        keep.update(record['outputs'])
+
+    removed = 0
+    for record in old_entries.values():
+        for rel in record['outputs']:
+            if rel in keep:
+                continue
+            path = os.path.join(output_dir, rel)
+            if os.path.lexists(path):
+                os.remove(path)
+                removed += 1
+            keep.add(rel)  # 同一个文件只删一次
+    return removed
+
+
+def print_diff_summary(diff, old_entries, new_entries, removed_files):
+    diff = Counter(diff)
+    gone = sum(1 for key in old_entries if key not in new_entries)
+    print("增量更新:")
+    print(f"  新增: {diff['added']}  修改: {diff['changed']}  未变: {diff['unchanged']}  源文件已删除: {gone}")
+    print(f"  清理过期输出文件: {removed_files} 个")
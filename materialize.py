@@ -0,0 +1,68 @@
+import os
+import errno
+import shutil
+
+# 数据集文件落地方式：复制 / 硬链接 / reflink(写时复制) / 软链接
+# 后三种都不会重写整张图片的字节，重建 data/images 只需要几秒，也不额外占磁盘。
+# 注意：硬链接和原图是同一份数据，直接在 data/ 里修改图片会连原图一起改掉。
+
+LINK_MODES = ('copy', 'hardlink', 'reflink', 'symlink')
+
+# Linux 的 FICLONE ioctl (btrfs / xfs 等支持写时复制的文件系统)
+_FICLONE = 0x40049409
+
+# 每种回退只提示一次，避免刷屏
+_warned = set()
+
+
+def _warn_once(mode, e):
+    if mode not in _warned:
+        _warned.add(mode)
+        print(f"[提示] {mode} 不可用 ({e})，自动改为复制")
+
+
+def _reflink(src, dst):
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError(errno.EOPNOTSUPP, '当前系统不支持 reflink')
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def materialize(src, dst, mode='copy'):
+    """
+    把 src 放到 dst，返回实际使用的方式
+    硬链接跨盘、文件系统不支持 reflink、没有创建软链接的权限时，都会自动回退为复制
+    """
+    if mode not in LINK_MODES:
+        raise ValueError(f"未知的 link_mode: {mode}，可选: {LINK_MODES}")
+
+    if os.path.lexists(dst):
+        # 上次已经是指向同一个文件的硬链接，什么都不用做
+        if mode == 'hardlink' and not os.path.islink(dst) and os.path.samefile(src, dst):
+            return mode
+        # 先删掉旧文件，否则复制会顺着旧的链接把原图覆盖掉
+        os.remove(dst)
+
+    try:
+        if mode == 'hardlink':
+            os.link(src, dst)
+            return mode
+        if mode == 'reflink':
+            _reflink(src, dst)
+            return mode
+        if mode == 'symlink':
+            os.symlink(os.path.abspath(src), dst)
+            return mode
+    except OSError as e:
+        _warn_once(mode, e)
+
+    shutil.copy2(src, dst)
+    return 'copy'
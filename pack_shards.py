@@ -0,0 +1,217 @@
+import os
+import time
+import shutil
+import numpy as np
+from image_header import image_size
+
+# 打包分片格式：把几万张小 JPG 和几万个小 txt 合并成少数几个大文件，训练时不用再逐个 open/stat/read
+#
+# data/packed/<split>/
+#   ├── images_000.bin   原图字节直接首尾相连 (不重新编码)，每个分片不超过 shard_bytes
+#   ├── images_001.bin
+#   ├── labels.npy       所有目标拼在一起的 float32 数组 (N, 5)：cls, x, y, w, h (归一化)，可 mmap
+#   └── index.npz        每张图的文件名、所在分片、字节偏移/长度、标签起止位置、原图宽高
+
+PACKED_DIR = 'packed'
+DEFAULT_SHARD_BYTES = 1 << 30  # 每个分片最大 1 GiB
+
+
+class ShardWriter:
+    def __init__(self, out_dir, shard_bytes=DEFAULT_SHARD_BYTES):
+        self.out_dir = out_dir
+        self.shard_bytes = shard_bytes
+        # 先写到临时目录，全部写完再替换，打包到一半中断也不会破坏旧的分片
+        self.tmp_dir = out_dir + '.tmp'
+        if os.path.exists(self.tmp_dir):
+            shutil.rmtree(self.tmp_dir)
+        os.makedirs(self.tmp_dir)
+
+        self.names = []
+        self.shard_ids = []
+        self.offsets = []
+        self.lengths = []
+        self.sizes = []
+        self.label_counts = []
+        self.label_rows = []
+
+        self._shard_id = -1
+        self._shard = None
+        self._shard_pos = 0
+
+    @property
+    def num_shards(self):
+        return self._shard_id + 1
+
+    def _next_shard(self):
+        if self._shard is not None:
+            self._shard.close()
+        self._shard_id += 1
+        self._shard = open(os.path.join(self.tmp_dir, f'images_{self._shard_id:03d}.bin'), 'wb')
+        self._shard_pos = 0
+
+    def add(self, name, image_path, class_ids, boxes, size):
+        """
+        追加一张图：原图按原样写进当前分片，标签追加到标签数组
+        size 为 None 时 (比如 XML 损坏的背景图) 从图片文件头读，读不出来记 (0, 0)
+        """
+        if size is None:
+            size = image_size(image_path) or (0, 0)
+        length = os.path.getsize(image_path)
+        if self._shard is None or (self._shard_pos and self._shard_pos + length > self.shard_bytes):
+            self._next_shard()
+        with open(image_path, 'rb') as f:
+            shutil.copyfileobj(f, self._shard, 1 << 20)
+
+        self.names.append(name)
+        self.shard_ids.append(self._shard_id)
+        self.offsets.append(self._shard_pos)
+        self.lengths.append(length)
+        self.sizes.append(size)
+        self.label_counts.append(len(class_ids))
+        for c, box in zip(class_ids, boxes):
+            self.label_rows.append([c, *box])
+        self._shard_pos += length
+
+    def close(self):
+        if self._shard is not None:
+            self._shard.close()
+        label_offsets = np.zeros(len(self.names) + 1, dtype=np.int64)
+        np.cumsum(self.label_counts, out=label_offsets[1:])
+        labels = np.asarray(self.label_rows, dtype=np.float32).reshape(-1, 5)
+        np.save(os.path.join(self.tmp_dir, 'labels.npy'), labels)
+        np.savez(os.path.join(self.tmp_dir, 'index.npz'),
+                 names=np.asarray(self.names, dtype=str),
+                 shard=np.asarray(self.shard_ids, dtype=np.int32),
+                 offset=np.asarray(self.offsets, dtype=np.int64),
+                 length=np.asarray(self.lengths, dtype=np.int64),
+                 label_offsets=label_offsets,
+                 sizes=np.asarray(self.sizes, dtype=np.int32).reshape(-1, 2))
+        if os.path.exists(self.out_dir):
+            shutil.rmtree(self.out_dir)
+        os.replace(self.tmp_dir, self.out_dir)
+
+
+def pack_records(output_dir, records, shard_bytes=DEFAULT_SHARD_BYTES):
+    """
+    转换脚本用：按清单记录把每个 split 打包成分片 (只打包落地了图片的记录)
+    records: {key: record}，record 里需要有 image / split / cls / boxes / size
+    """
+    by_split = {}
+    for key in sorted(records):
+        record = records[key]
+        if 'image' in record:
+            by_split.setdefault(record['split'], []).append(record)
+
+    for split, items in by_split.items():
+        writer = ShardWriter(os.path.join(output_dir, PACKED_DIR, split), shard_bytes)
+        for record in items:
+            writer.add(os.path.basename(record['image']), record['image'], record['cls'], record['boxes'], record['size'])
+        writer.close()
+        print(f"已打包 {split}: {len(items)} 张图片 -> {writer.num_shards} 个分片")
+
+
+class PackedDataset:
+    """
+    读取打包分片：分片和标签数组都是 mmap，取样本只是切片，不复制数据
+    可以直接交给 DataLoader 的多进程 worker，每个进程第一次访问时各自打开 mmap
+    """
+
+    def __init__(self, root, split):
+        self.dir = os.path.join(root, PACKED_DIR, split)
+        index = np.load(os.path.join(self.dir, 'index.npz'))
+        self.names = index['names']
+        self.shard = index['shard']
+        self.offset = index['offset']
+        self.length = index['length']
+        self.label_offsets = index['label_offsets']
+        self.sizes = index['sizes']
+        self._labels = None
+        self._shards = {}
+
+    def __getstate__(self):
+        # 传给子进程时不带 mmap，子进程里重新打开
+        state = self.__dict__.copy()
+        state['_labels'] = None
+        state['_shards'] = {}
+        return state
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def labels(self):
+        if self._labels is None:
+            self._labels = np.load(os.path.join(self.dir, 'labels.npy'), mmap_mode='r')
+        return self._labels
+
+    def _shard_map(self, shard_id):
+        m = self._shards.get(shard_id)
+        if m is None:
+            path = os.path.join(self.dir, f'images_{shard_id:03d}.bin')
+            m = self._shards[shard_id] = np.memmap(path, dtype=np.uint8, mode='r')
+        return m
+
+    def encoded(self, i):
+        """第 i 张图的原始编码字节 (uint8 数组，是 mmap 的切片，没有复制)"""
+        start = self.offset[i]
+        return self._shard_map(int(self.shard[i]))[start:start + self.length[i]]
+
+    def targets(self, i):
+        """第 i 张图的标签 (n, 5)：cls, x, y, w, h (同样是 mmap 切片)"""
+        return self.labels[self.label_offsets[i]:self.label_offsets[i + 1]]
+
+    def __getitem__(self, i):
+        return self.encoded(i), self.targets(i)
+
+    def decode(self, i):
+        import cv2
+        return cv2.imdecode(self.encoded(i), cv2.IMREAD_COLOR), self.targets(i)
+
+
+# ================= 对比测试 =================
+# 直接运行本文件：分别从目录结构 (data/images + data/labels) 和打包分片读一遍整个 split，比较一个 epoch 的读取耗时
+
+DATA_DIR = r'D:\Documaents\Adobe\data'
+BENCH_SPLIT = 'train'
+BENCH_DECODE = True  # True 时包含 JPEG 解码，False 只比较读文件
+
+
+def _epoch_dir(data_dir, split, decode):
+    import cv2
+    img_dir = os.path.join(data_dir, 'images', split)
+    label_dir = os.path.join(data_dir, 'labels', split)
+    n = 0
+    for name in os.listdir(img_dir):
+        with open(os.path.join(img_dir, name), 'rb') as f:
+            buf = np.frombuffer(f.read(), dtype=np.uint8)
+        label_path = os.path.join(label_dir, os.path.splitext(name)[0] + '.txt')
+        if os.path.exists(label_path):
+            np.loadtxt(label_path, ndmin=2)
+        if decode:
+            cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        n += 1
+    return n
+
+
+def _epoch_packed(data_dir, split, decode):
+    ds = PackedDataset(data_dir, split)
+    for i in range(len(ds)):
+        if decode:
+            ds.decode(i)
+        else:
+            buf, targets = ds[i]
+            buf.sum(dtype=np.uint64)  # 真正触发读取 (mmap 是按需读的)
+    return len(ds)
+
+
+def benchmark():
+    for name, fn in [('目录结构', _epoch_dir), ('打包分片', _epoch_packed)]:
+        t0 = time.perf_counter()
+        n = fn(DATA_DIR, BENCH_SPLIT, BENCH_DECODE)
+        t = time.perf_counter() - t0
+        print(f"{name}: {n} 张，{t:.2f} s，{n / t:.1f} 张/s")
+    print("提示：第二次运行会命中系统文件缓存，想看冷启动差异请先清缓存或重启")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,76 @@
+import os
+import json
+import sqlite3
+from image_index import DEFAULT_CACHE_DIR
+
+# 分类结果缓存 (auto_sort.py 用)
+# 以 (图片内容 sha1, 模型文件 sha1) 为键保存 top-k 类别和概率：
+#   - 中途被打断、或者只是改了 conf_threshold 重跑，已经推理过的图片直接用缓存重新归类，不再过模型
+#   - 图片被移动/改名不影响 (按内容 hash)；换了模型 (best.pt 变了) 自动全部重新推理
+# 为了不每次都把所有图片读一遍算 hash，另存一张 (文件绝对路径, 大小, 修改时间) -> sha1 的表；
+# 用完整路径而不是文件名：不同子文件夹里同名、同大小、同修改时间的图片 (相机的 IMG_0001.jpg 用 copy2 拷出来的) 不会互相串。
+# 移动/复制到 output_dir 时由 auto_sort 把新路径也记上 (大小、修改时间不变)，下次不用重新算。
+# 用 SQLite 是因为结果要边推理边写，随时被打断也不会丢已经写进去的部分。
+
+DEFAULT_DB = os.path.join(DEFAULT_CACHE_DIR, 'predictions.sqlite')
+
+
+def file_key(path):
+    """files 表的键：规范化的绝对路径 (Windows 上不区分大小写)"""
+    return os.path.normcase(os.path.abspath(path))
+
+
+class PredictionCache:
+    def __init__(self, path=DEFAULT_DB):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                name TEXT, size INTEGER, mtime_ns INTEGER, sha1 TEXT,  -- name: 文件绝对路径 (file_key)
+                PRIMARY KEY (name, size, mtime_ns));
+            CREATE TABLE IF NOT EXISTS models (sha1 TEXT PRIMARY KEY, names TEXT);
+            CREATE TABLE IF NOT EXISTS predictions (
+                image TEXT, model TEXT, top_cls TEXT, top_conf TEXT,
+                PRIMARY KEY (image, model));
+        ''')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def file_sha1(self, path, st):
+        """路径、大小、修改时间都对得上时返回缓存的 sha1，否则 None"""
+        row = self.db.execute('SELECT sha1 FROM files WHERE name=? AND size=? AND mtime_ns=?',
+                              (file_key(path), st.st_size, st.st_mtime_ns)).fetchone()
+        return row[0] if row else None
+
+    def put_file_sha1(self, path, st, sha1):
+        self.db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                        (file_key(path), st.st_size, st.st_mtime_ns, sha1))
+
+    def model_names(self, model_sha1):
+        """模型的类别名 {id: name}，没记录过返回 None (只出报告时不用加载模型)"""
+        row = self.db.execute('SELECT names FROM models WHERE sha1=?', (model_sha1,)).fetchone()
+        return {int(k): v for k, v in json.loads(row[0]).items()} if row else None
+
+    def put_model_names(self, model_sha1, names):
+        self.db.execute('INSERT OR REPLACE INTO models VALUES (?, ?)', (model_sha1, json.dumps(names, ensure_ascii=False)))
+
+    def get(self, image_sha1, model_sha1):
+        """返回 (top-k 类别 ID 列表, 对应概率列表)，没推理过返回 None"""
+        row = self.db.execute('SELECT top_cls, top_conf FROM predictions WHERE image=? AND model=?',
+                              (image_sha1, model_sha1)).fetchone()
+        return (json.loads(row[0]), json.loads(row[1])) if row else None
+
+    def put(self, image_sha1, model_sha1, top_cls, top_conf):
+        self.db.execute('INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)',
+                        (image_sha1, model_sha1, json.dumps(top_cls), json.dumps([round(c, 5) for c in top_conf])))
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
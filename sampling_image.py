@@ -1,63 +1,308 @@
 import os
+import math
 import random
-import shutil
-from pathlib import Path
+import itertools
+import hashlib
+import cv2
+import numpy as np
+from file_transfer import TransferEngine
+from convert_pool import run_tasks
+from image_header import image_size
+from image_index import DEFAULT_CACHE_DIR
 
 # ================= 配置区域 =================
 SOURCE_DIR = r"D:\\Downloads\\Compressed\\bamboo_saw\\labeled\\images"  # 你的40000张图片所在的文件夹路径
 TARGET_DIR = r"D:\\Downloads\\Compressed\\bamboo_saw\\labeled\\Sample"            # 抽取出来的图片存放路径
 SAMPLE_SIZE = 1000                        # 想要抽取的数量
-MODE = "random"                           # 模式: "random" (随机) 或 "interval" (等间距/视频帧)
+MODE = "random"                           # 模式: "random" (随机) / "interval" (等间距/视频帧) / "diverse" (尽量挑长得不一样的)
+LINK_MODE = "copy"                        # 落地方式: "copy" / "hardlink" / "reflink" / "symlink" (不支持时自动复制)
+TRANSFER_THREADS = 8                      # 并发复制线程数 (目标文件夹里已有相同文件的直接跳过)
+SEED = None                               # 随机种子: 设为整数则同一个文件夹每次抽到的都一样, None 表示每次随机
+INTERVAL_ORDER = "scan"                   # 等间距的顺序: "scan" 按目录顺序流式扫描 (边扫边复制, 不占内存) / "name" 按文件名排序 (处处可复现, 费内存, 见 interval_source)
+NUM_WORKERS = 0                           # "diverse" 模式算特征的进程数: 1 为串行, 0 为使用全部 CPU 核
+MEMORY_BUDGET_MB = 256                    # "diverse" 模式挑图时每次参与计算的特征块上限 (特征本身存在磁盘上, 按块读)
 # ===========================================
 
+VALID_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# 文件夹可能有几百万个文件：全程用 os.scandir 流式遍历，不建 Path 列表、不逐个 stat，
+# 内存只和抽取数量有关。选中的图片交给后台线程复制 (等间距模式下扫描和复制同时进行)。
+
+
+def iter_images(source_dir):
+    """流式产出图片文件名 (scandir 自带文件类型，判断 is_file 不需要额外的系统调用)"""
+    with os.scandir(source_dir) as it:
+        for entry in it:
+            if entry.name.lower().endswith(VALID_EXTENSIONS) and entry.is_file():
+                yield entry.name
+
+
+def _open_random(rng):
+    """(0, 1) 之间的随机数 (不含 0，取对数时不会出错)"""
+    u = rng.random()
+    while u == 0.0:
+        u = rng.random()
+    return u
+
+
+def reservoir_sample(items, k, rng):
+    """
+    蓄水池抽样 (Algorithm L)：一次遍历从未知长度的序列里等概率抽 k 个，返回 (抽中的列表, 总数)
+    直接算出下一个要替换的位置，随机数只需要 O(k * log(N / k)) 个
+    """
+    # zip 先从 items 取再从 counter 取，遍历完后 next(counter) 就是总数；跳过的部分由 islice 在 C 里完成
+    counter = itertools.count()
+    it = zip(items, counter)
+    reservoir = [item for item, _ in itertools.islice(it, k)]
+    if len(reservoir) < k:
+        return reservoir, len(reservoir)
+
+    w = math.exp(math.log(_open_random(rng)) / k)
+    while True:
+        skip = math.floor(math.log(_open_random(rng)) / math.log(1 - w))
+        picked = next(itertools.islice(it, skip, None), None)
+        if picked is None:
+            return reservoir, next(counter)
+        reservoir[rng.randrange(k)] = picked[0]
+        w *= math.exp(math.log(_open_random(rng)) / k)
+
+
+def interval_picks(items, total, k):
+    """等间距抽样：已知总数时按位置 j * total // k 依次挑出 k 个，边遍历边产出"""
+    if total <= k:
+        yield from items
+        return
+    j = 0
+    target = 0
+    for i, item in enumerate(items):
+        if i == target:
+            yield item
+            j += 1
+            if j == k:
+                return
+            target = j * total // k
+
+
+
+def interval_source(source_dir, order=INTERVAL_ORDER):
+    """
+    等间距抽样的输入，返回 (文件名迭代器, 图片总数)
+    "scan" (默认)：按目录顺序扫两遍，第一遍只数个数，第二遍边扫边产出，选中的马上交给复制线程，
+        内存和文件数无关；但只有 Windows NTFS 上目录顺序就是文件名顺序，其他文件系统上拷贝、换机器后重跑挑到的图可能不同
+    "name"：先把全部文件名读进内存排好序，在哪里重跑挑到的都一样；代价是整份文件名列表常驻内存
+        (每百万个文件约 100 MB)，而且要等整个目录扫完才开始复制
+    """
+    if order == "name":
+        names = sorted(iter_images(source_dir))
+        return iter(names), len(names)
+    # 目录项在第一遍之后已经在系统缓存里，第二遍很快
+    total = sum(1 for _ in iter_images(source_dir))
+    return iter_images(source_dir), total
+
+# ---------- "diverse" 模式 ----------
+# 每张图算一个很便宜的特征：8x8 彩色缩略图 (整体构图/颜色分布) + HSV 色调/饱和度直方图，
+# 再用 k-center 贪心：每次挑离已选集合最远的那张，挑出来的图片彼此差别最大，不会全是普通竹子。
+# 特征按 (文件名, 大小, 修改时间) 缓存在磁盘上，下次只算新增/改过的图片。
+
+THUMB_SIZE = 8
+HIST_BINS = (16, 4)  # 色调, 饱和度
+DESC_DIM = THUMB_SIZE * THUMB_SIZE * 3 + HIST_BINS[0] * HIST_BINS[1]
+
+
+def describe_image(path):
+    """返回 float32 特征向量 (DESC_DIM,)，图片无法解码返回 None"""
+    size = image_size(path)
+    flag = cv2.IMREAD_COLOR
+    if size is not None:
+        # 只需要很小的缩略图，大图直接按 1/8 解码
+        for factor, reduced in [(8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                (2, cv2.IMREAD_REDUCED_COLOR_2)]:
+            if min(size) >= factor * 64:
+                flag = reduced
+                break
+    img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), flag)
+    if img is None:
+        return None
+    thumb = cv2.resize(img, (THUMB_SIZE, THUMB_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32) / 255
+    hsv = cv2.cvtColor(cv2.resize(img, (64, 64), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, list(HIST_BINS), [0, 180, 0, 256]).ravel()
+    hist = np.sqrt(hist / hist.sum())  # 开方后欧氏距离接近 Hellinger 距离，和缩略图部分量级也相当
+    return np.concatenate([thumb.ravel(), hist]).astype(np.float32)
+
+
+def describe_one(task):
+    desc = describe_image(task)
+    if desc is None:
+        return {'status': 'bad_image', 'msg': f"[跳过] 图片无法解码: {task}"}
+    return {'status': 'ok', 'desc': desc}
+
+
+def _descriptor_cache(source_dir):
+    digest = hashlib.sha1(os.path.abspath(source_dir).encode('utf-8')).hexdigest()[:16]
+    base = os.path.join(DEFAULT_CACHE_DIR, f'diverse_{digest}')
+    return base + '.npy', base + '.npz'
+
+
+def load_descriptors(source_dir):
+    """
+    返回 (文件名列表, 特征 memmap (N, DESC_DIM) float16)
+    特征存成 .npy 用 mmap 打开，再多的图片也不会一次读进内存
+    """
+    desc_file, meta_file = _descriptor_cache(source_dir)
+    cached = {}
+    old_desc = None
+    if os.path.exists(meta_file) and os.path.exists(desc_file):
+        with np.load(meta_file) as m:
+            for i, (name, size, mtime) in enumerate(zip(m['names'].tolist(), m['size'].tolist(), m['mtime_ns'].tolist())):
+                cached[name] = (size, mtime, i)
+        old_desc = np.load(desc_file, mmap_mode='r')
+        if old_desc.shape[1:] != (DESC_DIM,):
+            cached, old_desc = {}, None
+
+    names, sizes, mtimes, rows, todo = [], [], [], [], []
+    with os.scandir(source_dir) as it:
+        for entry in it:
+            if not (entry.name.lower().endswith(VALID_EXTENSIONS) and entry.is_file()):
+                continue
+            st = entry.stat()
+            hit = cached.get(entry.name)
+            names.append(entry.name)
+            sizes.append(st.st_size)
+            mtimes.append(st.st_mtime_ns)
+            if hit and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+                rows.append(hit[2])
+            else:
+                rows.append(-1)
+                todo.append(len(names) - 1)
+    print(f"图片总数: {len(names)} 张，特征缓存命中 {len(names) - len(todo)} 张，需要计算 {len(todo)} 张")
+    if not todo and old_desc is not None and rows == list(range(len(old_desc))):
+        return names, old_desc
+
+    # 新的特征文件：命中缓存的行直接拷过去，其余的用进程池算
+    os.makedirs(DEFAULT_CACHE_DIR, exist_ok=True)
+    tmp_file = desc_file + '.tmp.npy'
+    desc = np.lib.format.open_memmap(tmp_file, mode='w+', dtype=np.float16, shape=(len(names), DESC_DIM))
+    for i, row in enumerate(rows):
+        if row >= 0:
+            desc[i] = old_desc[row]
+    valid = np.ones(len(names), dtype=bool)
+
+    def on_result(task, result, stats):
+        i = todo_index[task]
+        if result['status'] == 'ok':
+            desc[i] = result['desc']
+        else:
+            valid[i] = False
+            print(result['msg'])
+
+    paths = [os.path.join(source_dir, names[i]) for i in todo]
+    todo_index = dict(zip(paths, todo))
+    run_tasks(describe_one, paths, NUM_WORKERS, on_result=on_result)
+
+    # 无法解码的图片不参与挑选，也不写进缓存 (下次还会重试)
+    keep = np.flatnonzero(valid)
+    if len(keep) < len(names):
+        compact = np.lib.format.open_memmap(tmp_file + '.npy', mode='w+', dtype=np.float16, shape=(len(keep), DESC_DIM))
+        for start in range(0, len(keep), 65536):
+            compact[start:start + 65536] = desc[keep[start:start + 65536]]
+        # Windows 上还被 memmap 映射着的文件不能改名，先关掉所有映射再 os.replace
+        compact.flush()
+        del compact, desc
+        os.replace(tmp_file + '.npy', tmp_file)
+        names = [names[i] for i in keep]
+        sizes = [sizes[i] for i in keep]
+        mtimes = [mtimes[i] for i in keep]
+    else:
+        desc.flush()
+        del desc
+    del old_desc
+    os.replace(tmp_file, desc_file)
+    np.savez(meta_file, names=np.asarray(names, dtype=str),
+             size=np.asarray(sizes, dtype=np.int64), mtime_ns=np.asarray(mtimes, dtype=np.int64))
+    return names, np.load(desc_file, mmap_mode='r')
+
+
+def k_center_greedy(desc, k, rng, memory_budget_mb=MEMORY_BUDGET_MB):
+    """
+    k-center 贪心：第一张随机挑，之后每次挑离已选集合最近距离最大的那张
+    每一轮只需要用新选中的那张更新 "到已选集合的最近距离" 数组；特征按块读，每块不超过内存预算
+    """
+    n = len(desc)
+    if k >= n:
+        return list(range(n))
+    chunk = max(1, int(memory_budget_mb * 1024 * 1024 // (desc.shape[1] * 4 * 2)))
+    chunks = [(s, min(n, s + chunk)) for s in range(0, n, chunk)]
+
+    # 块能整个放进预算时预先转成 float32 (省掉每轮的类型转换)
+    resident = np.asarray(desc, dtype=np.float32) if len(chunks) == 1 else None
+    sq_norm = np.empty(n, dtype=np.float32)
+    for s, e in chunks:
+        block = resident if resident is not None else np.asarray(desc[s:e], dtype=np.float32)
+        sq_norm[s:e] = np.einsum('ij,ij->i', block, block)
+
+    min_dist = np.full(n, np.inf, dtype=np.float32)
+    picks = [rng.randrange(n)]
+    for _ in range(k - 1):
+        center = np.asarray(desc[picks[-1]], dtype=np.float32)
+        c_norm = center @ center
+        for s, e in chunks:
+            block = resident if resident is not None else np.asarray(desc[s:e], dtype=np.float32)
+            # |x - c|^2 = |x|^2 - 2 x.c + |c|^2，一次矩阵向量乘法算完整块
+            d = sq_norm[s:e] - 2 * (block @ center) + c_norm
+            np.minimum(min_dist[s:e], d, out=min_dist[s:e])
+        min_dist[picks[-1]] = -1  # 已选中的不再参与
+        picks.append(int(np.argmax(min_dist)))
+    return picks
+
+
 def sample_images():
     # 1. 准备路径
-    source_path = Path(SOURCE_DIR)
-    target_path = Path(TARGET_DIR)
-    
-    if not source_path.exists():
+    if not os.path.isdir(SOURCE_DIR):
         print(f"错误：源文件夹 {SOURCE_DIR} 不存在")
         return
 
     # 创建目标文件夹
-    target_path.mkdir(parents=True, exist_ok=True)
-
-    # 2. 获取所有图片文件
-    valid_extensions = {'.jpg', '.jpeg', '.png', '.bmp'}
-    all_images = [f for f in source_path.iterdir() if f.suffix.lower() in valid_extensions and f.is_file()]
-    
-    total_images = len(all_images)
-    print(f"图片总数: {total_images} 张")
-
-    if total_images < SAMPLE_SIZE:
-        print("图片总数少于目标抽取数，将复制所有图片...")
-        selected_images = all_images
+    os.makedirs(TARGET_DIR, exist_ok=True)
+    rng = random.Random(SEED)
+    engine = TransferEngine(LINK_MODE, num_threads=TRANSFER_THREADS)
+
+    # 2. 根据模式抽取
+    if MODE == "random":
+        # 蓄水池里的图片随时可能被替换，扫描完才是最终结果，所以复制从扫描结束后开始
+        print("正在进行随机抽样...")
+        selected, total_images = reservoir_sample(iter_images(SOURCE_DIR), SAMPLE_SIZE, rng)
+        print(f"图片总数: {total_images} 张")
+        if total_images < SAMPLE_SIZE:
+            print("图片总数少于目标抽取数，将复制所有图片...")
+        print(f"复制 {len(selected)} 张图片到 {TARGET_DIR} ...")
+        for name in selected:
+            engine.submit(os.path.join(SOURCE_DIR, name), os.path.join(TARGET_DIR, name))
+    elif MODE == "interval":
+        print("正在进行等间距抽样..")
+        names, total_images = interval_source(SOURCE_DIR)
+        print(f"图片总数: {total_images} 张")
+        if total_images < SAMPLE_SIZE:
+            print("图片总数少于目标抽取数，将复制所有图片...")
+        print(f"复制 {min(SAMPLE_SIZE, total_images)} 张图片到 {TARGET_DIR} ...")
+        for name in interval_picks(names, total_images, SAMPLE_SIZE):
+            engine.submit(os.path.join(SOURCE_DIR, name), os.path.join(TARGET_DIR, name))
+    elif MODE == "diverse":
+        print("正在计算图片特征...")
+        names, desc = load_descriptors(SOURCE_DIR)
+        if len(names) < SAMPLE_SIZE:
+            print("图片总数少于目标抽取数，将复制所有图片...")
+        print("正在挑选差异最大的图片...")
+        picks = k_center_greedy(desc, SAMPLE_SIZE, rng)
+        print(f"复制 {len(picks)} 张图片到 {TARGET_DIR} ...")
+        for i in picks:
+            engine.submit(os.path.join(SOURCE_DIR, names[i]), os.path.join(TARGET_DIR, names[i]))
     else:
-        # 3. 根据模式抽取
-        if MODE == "random":
-            print("正在进行随机抽样...")
-            selected_images = random.sample(all_images, SAMPLE_SIZE)
-        elif MODE == "interval":
-            print("正在进行等间距抽样..")
-            # 按文件名排序，保证顺序
-            all_images.sort(key=lambda x: x.name)
-            step = total_images // SAMPLE_SIZE
-            selected_images = [all_images[i] for i in range(0, total_images, step)][:SAMPLE_SIZE]
-
-    # 4. 复制文件
-    print(f"复制 {len(selected_images)} 张图片到 {TARGET_DIR} ...")
-    
-    count = 0
-    for img in selected_images:
-        try:
-            shutil.copy2(img, target_path / img.name)
-            count += 1
-            if count % 100 == 0:
-                print(f"已复制 {count} 张...")
-        except Exception as e:
-            print(f"复制 {img.name} 失败: {e}")
-
-    print(f"成功抽取 {count} 张图片到 '{TARGET_DIR}' 文件夹...")
+        print(f"错误：未知的模式 {MODE}")
+
+    # 3. 等复制线程做完
+    stats = engine.close()
+    done = stats['copied'] + stats['linked'] + stats['skipped']
+    print(f"成功抽取 {done} 张图片到 '{TARGET_DIR}' 文件夹...")
 
 if __name__ == "__main__":
-    sample_images()
\ No newline at end of file
+    sample_images()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 仓库里的脚本都是根目录下的平铺模块，测试直接 import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
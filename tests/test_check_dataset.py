@@ -0,0 +1,20 @@
+from check_dataset import check_label
+
+
+def test_check_label(tmp_path):
+    good = tmp_path / 'good.txt'
+    good.write_text('0 0.5 0.5 0.2 0.2\n', encoding='utf-8')
+    assert check_label(str(good)) == []
+
+    bad = tmp_path / 'bad.txt'
+    bad.write_text('0 0.5 0.5 0.2\n9 0.5 0.5 0.2 0.2\n', encoding='utf-8')
+    assert [kind for kind, _ in check_label(str(bad))] == ['bad_line', 'bad_class']
+
+
+def test_undecodable_label_is_reported(tmp_path):
+    """不是 UTF-8 的标签文件记成一条问题，而不是让整个检查抛异常"""
+    path = tmp_path / 'gbk.txt'
+    path.write_bytes('0 0.5 0.5 0.2 0.2 # 虫眼\n'.encode('gbk'))
+    problems = check_label(str(path))
+    assert [kind for kind, _ in problems] == ['bad_label_file']
+    assert [kind for kind, _ in check_label(str(tmp_path / 'missing.txt'))] == ['bad_label_file']
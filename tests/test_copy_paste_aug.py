@@ -0,0 +1,62 @@
+import random
+
+import numpy as np
+import pytest
+
+from making_pictures.copy_paste_aug import OccupancyGrid, alpha_extent, trim_patch, LABEL_ALPHA_MIN
+
+
+def overlaps(a, b, gap):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    return ax < bx + bw + gap and bx < ax + aw + gap and ay < by + bh + gap and by < ay + ah + gap
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('cell,gap', [(16, 4), (8, 0), (32, 10)])
+def test_placements_never_overlap(seed, cell, gap):
+    rng = random.Random(seed)
+    h, w = 300, 400
+    grid = OccupancyGrid(h, w, cell)
+    placed = []
+    for _ in range(200):
+        ph, pw = rng.randint(5, 90), rng.randint(5, 90)
+        pos = grid.place(ph, pw, rng)
+        if pos is None:
+            continue
+        x, y = pos
+        assert 0 <= x <= w - pw and 0 <= y <= h - ph
+        box = (x, y, pw, ph)
+        assert not any(overlaps(box, other, gap) for other in placed)
+        grid.occupy(x, y, pw, ph, gap)
+        placed.append(box)
+    assert len(placed) > 5
+
+
+def test_place_returns_none_when_full_or_too_big():
+    rng = random.Random(0)
+    grid = OccupancyGrid(100, 100, 16)
+    assert grid.place(101, 10, rng) is None
+    x, y = grid.place(100, 100, rng)
+    assert (x, y) == (0, 0)
+    grid.occupy(x, y, 100, 100)
+    assert grid.place(1, 1, rng) is None
+
+
+def test_alpha_extent_and_trim():
+    alpha = np.zeros((20, 30), dtype=np.uint8)
+    assert alpha_extent(alpha, 0) is None
+    alpha[5:10, 7:20] = 10                  # 半透明的羽化边
+    alpha[6:9, 9:15] = 255
+    assert alpha_extent(alpha, 0) == (7, 5, 20, 10)
+
+    patch = np.dstack([np.full((20, 30, 3), 100, np.uint8), alpha])
+    trimmed, box = trim_patch(patch)
+    assert trimmed.shape == (5, 13, 4)
+    # 标签框只包住 alpha > LABEL_ALPHA_MIN 的部分，坐标相对裁剪后的素材
+    assert LABEL_ALPHA_MIN >= 10
+    assert box.tolist() == [2, 1, 8, 4]
+
+    rgb = np.zeros((4, 6, 3), np.uint8)
+    same, box = trim_patch(rgb)
+    assert same is rgb and box.tolist() == [0, 0, 6, 4]
@@ -0,0 +1,53 @@
+import pytest
+
+from dataset_split import hash_fraction, assign_split, primary_class, SplitReport
+
+NAMES = [f'IMG_{i:05d}.jpg' for i in range(5000)]
+
+
+def test_hash_fraction_is_stable():
+    # 固定值：换进程、换机器、换 Python 版本都不能变，否则已有图片会换边
+    assert hash_fraction('IMG_00001.jpg') == 0.5978785131432004
+    assert 0 <= hash_fraction('a') < 1
+    assert hash_fraction('a') != hash_fraction('a', salt='x')
+
+
+def test_ratio_is_respected():
+    train = sum(assign_split(n, 0.8) == 'train' for n in NAMES)
+    assert abs(train / len(NAMES) - 0.8) < 0.03
+
+
+def test_adding_images_does_not_move_existing_ones():
+    before = {n: assign_split(n, 0.8) for n in NAMES[:3000]}
+    after = {n: assign_split(n, 0.8) for n in NAMES}
+    assert all(after[n] == s for n, s in before.items())
+
+
+def test_class_ratios():
+    ratios = {0: 0.5, 1: 0.95}
+    for stratum, target in ratios.items():
+        train = sum(assign_split(n, 0.8, stratum, ratios) == 'train' for n in NAMES)
+        assert abs(train / len(NAMES) - target) < 0.03
+    # 没配比例的类别和没有目标的图用总体比例
+    assert [assign_split(n, 0.8, 7, ratios) for n in NAMES[:200]] == [assign_split(n, 0.8) for n in NAMES[:200]]
+
+
+def test_primary_class():
+    assert primary_class([]) is None
+    assert primary_class([2, 1, 2, 1, 3]) == 1  # 数量相同取 ID 小的
+    assert primary_class([3, 3, 0]) == 3
+
+
+def test_report_counts_groups_separately():
+    """近似重复组按总体比例划分，不能算进各类别的偏差"""
+    report = SplitReport(0.8, class_ratios={0: 0.5}, class_names={0: '虫眼'})
+    report.add('train', 0)
+    report.add('val', 0)
+    for split in ['train', 'train', 'train', 'val']:
+        report.add(split, 0, grouped=True)
+    rows = {name: (dict(c), target) for name, c, target in report.rows()}
+    assert rows['虫眼'] == ({'train': 1, 'val': 1}, 0.5)
+    assert rows['近似重复组'] == ({'train': 3, 'val': 1}, 0.8)
+    assert rows['全部'][0] == {'train': 4, 'val': 2}
+    assert rows['全部'][1] == pytest.approx((0.5 * 2 + 0.8 * 4) / 6)
+    assert SplitReport(0.8).rows() == []
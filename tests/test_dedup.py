@@ -0,0 +1,116 @@
+import json
+
+import numpy as np
+import pytest
+
+from dedup import near_duplicate_pairs, union_groups, popcount64
+from dataset_split import assign_split, load_dedup_groups, pick_representatives
+
+
+def brute_force_pairs(hashes, threshold):
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1)
+    dist = (bits[:, None, :] != bits[None, :, :]).sum(axis=2)
+    i, j = np.nonzero(np.triu(dist <= threshold, k=1))
+    return set(zip(i.tolist(), j.tolist()))
+
+
+def clustered_hashes(rng, n_clusters=40, per_cluster=6, max_flips=10):
+    """每组一个随机哈希，再随机翻几位生成组员，保证有各种距离的近似重复"""
+    out = []
+    for _ in range(n_clusters):
+        base = int(rng.integers(0, 2 ** 63)) | (int(rng.integers(0, 2)) << 63)
+        for _ in range(per_cluster):
+            h = base
+            for b in rng.choice(64, size=rng.integers(0, max_flips + 1), replace=False):
+                h ^= 1 << int(b)
+            out.append(h)
+    return np.array(out, dtype=np.uint64)
+
+
+def test_popcount64():
+    x = np.array([0, 1, 2 ** 64 - 1, 0x8000000000000001], dtype=np.uint64)
+    assert popcount64(x).tolist() == [0, 1, 64, 2]
+
+
+@pytest.mark.parametrize('threshold', [1, 6])
+def test_popcount64_fallback(monkeypatch, threshold):
+    """numpy < 2 没有 bitwise_count，退回按字节数的实现，二维输入也要保持形状"""
+    monkeypatch.delattr(np, 'bitwise_count', raising=False)
+    x = np.array([[0, 1], [2 ** 64 - 1, 0x8000000000000001]], dtype=np.uint64)
+    assert popcount64(x).tolist() == [[0, 1], [64, 2]]
+    hashes = clustered_hashes(np.random.default_rng(0))
+    assert set(map(tuple, near_duplicate_pairs(hashes, threshold).tolist())) == brute_force_pairs(hashes, threshold)
+
+
+@pytest.mark.parametrize('threshold', [0, 1, 4, 6, 10])
+@pytest.mark.parametrize('seed', range(3))
+def test_pairs_match_brute_force(threshold, seed):
+    hashes = clustered_hashes(np.random.default_rng(seed))
+    pairs = near_duplicate_pairs(hashes, threshold)
+    assert pairs.dtype.kind == 'i' and pairs.shape[1] == 2
+    found = set(map(tuple, pairs.tolist()))
+    assert len(found) == len(pairs)  # 多个段里都命中的对已经去重
+    assert found == brute_force_pairs(hashes, threshold)
+
+
+def test_no_pairs():
+    assert near_duplicate_pairs(np.array([0, 2 ** 64 - 1], dtype=np.uint64), 6).shape == (0, 2)
+
+
+def test_union_groups():
+    pairs = np.array([[0, 3], [3, 5], [1, 2]])
+    assert sorted(union_groups(7, pairs)) == [[0, 3, 5], [1, 2]]
+
+
+def test_group_members_share_a_split(tmp_path):
+    """组员主要类别不同、各类比例也不同时，整组仍然落在同一边"""
+    groups = [[f'g{g}_{i}.jpg' for i in range(4)] for g in range(300)]
+    path = tmp_path / 'groups.json'
+    path.write_text(json.dumps({'groups': groups}), encoding='utf-8')
+    rep = load_dedup_groups(str(path))
+    assert rep['g0_2.jpg'] == 'g0_0.jpg'
+    ratios = {0: 0.1, 1: 0.9, 2: 0.5}
+    for group in groups:
+        splits = {assign_split(name, 0.8, stratum, ratios, group=rep[name]) for stratum, name in enumerate(group)}
+        assert len(splits) == 1
+    assert load_dedup_groups(None) == {}
+    assert load_dedup_groups(str(tmp_path / 'missing.json')) == {}
+
+
+def test_keep_first_labeled_member():
+    """组里文件名最小的那张没有标注时，保留有标注的成员，不能整组都丢掉"""
+    groups = {name: 'a.jpg' for name in ['a.jpg', 'b.jpg', 'c.jpg']}
+    groups.update({name: 'x.jpg' for name in ['x.jpg', 'y.jpg']})
+    keep = pick_representatives(groups, labeled={'c.jpg', 'b.jpg'})
+    assert keep == {'a.jpg': 'b.jpg', 'b.jpg': 'b.jpg', 'c.jpg': 'b.jpg'}  # x/y 整组都没标注，一张都不去掉
+
+
+VOC_XML = """<annotation><size><width>32</width><height>32</height></size>
+<object><name>虫眼</name><bndbox><xmin>4</xmin><ymin>4</ymin><xmax>20</xmax><ymax>20</ymax></bndbox></object>
+</annotation>"""
+
+
+def test_xmltoyolo_drops_only_after_labeled_member(tmp_path, monkeypatch):
+    cv2 = pytest.importorskip('cv2')
+    import xmltoyolo
+
+    images, xmls, out = tmp_path / 'images', tmp_path / 'xml', tmp_path / 'data'
+    images.mkdir()
+    xmls.mkdir()
+    for name in ['a', 'b', 'c']:
+        cv2.imwrite(str(images / f'{name}.jpg'), np.zeros((32, 32, 3), np.uint8))
+    # a.jpg 是组里文件名最小的，但没有标注
+    (xmls / 'b.xml').write_text(VOC_XML, encoding='utf-8')
+    (xmls / 'c.xml').write_text(VOC_XML, encoding='utf-8')
+    groups_file = tmp_path / 'groups.json'
+    groups_file.write_text(json.dumps({'groups': [['a.jpg', 'b.jpg', 'c.jpg']]}), encoding='utf-8')
+
+    for key, value in {'input_dir': str(xmls), 'input_images_dir': str(images), 'output_dir': str(out),
+                       'dedup_groups_file': str(groups_file), 'drop_duplicates': True,
+                       'num_workers': 1, 'transfer_threads': 0}.items():
+        monkeypatch.setattr(xmltoyolo, key, value)
+    xmltoyolo.main()
+
+    labels = sorted(p.name for p in out.glob('labels/*/*.txt'))
+    kept = sorted(p.name for p in out.glob('images/*/*.jpg'))
+    assert labels == ['b.txt'] and kept == ['b.jpg']
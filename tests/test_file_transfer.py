@@ -0,0 +1,107 @@
+import os
+import threading
+
+import pytest
+
+import file_transfer
+from file_transfer import TransferEngine, is_identical
+
+
+def make_files(tmp_path, n):
+    src = tmp_path / 'src'
+    src.mkdir()
+    for i in range(n):
+        (src / f'{i}.jpg').write_bytes(os.urandom(100 + i))
+    (tmp_path / 'dst').mkdir()
+    return src, tmp_path / 'dst'
+
+
+def run_with_timeout(fn, timeout=20):
+    """engine 卡死时测试失败而不是一直挂着"""
+    result = {}
+    t = threading.Thread(target=lambda: result.setdefault('value', fn()), daemon=True)
+    t.start()
+    t.join(timeout)
+    assert not t.is_alive(), 'TransferEngine 卡住了'
+    return result['value']
+
+
+def test_copy_move_and_skip(tmp_path):
+    src, dst = make_files(tmp_path, 10)
+    with TransferEngine(num_threads=3, verbose=False) as engine:
+        for i in range(10):
+            engine.submit(str(src / f'{i}.jpg'), str(dst / f'{i}.jpg'))
+    assert engine.stats['copied'] == 10
+    assert all((dst / f'{i}.jpg').read_bytes() == (src / f'{i}.jpg').read_bytes() for i in range(10))
+    assert is_identical(str(src / '0.jpg'), str(dst / '0.jpg'))
+
+    with TransferEngine(num_threads=3, verbose=False) as engine:
+        for i in range(10):
+            engine.submit(str(src / f'{i}.jpg'), str(dst / f'{i}.jpg'))
+        engine.submit(str(src / '0.jpg'), str(tmp_path / 'moved.jpg'), move=True)
+    assert engine.stats['skipped'] == 10 and engine.stats['moved'] == 1
+    assert not (src / '0.jpg').exists() and (tmp_path / 'moved.jpg').exists()
+
+
+def test_skip_identical_off_recopies(tmp_path):
+    src, dst = make_files(tmp_path, 1)
+    with TransferEngine(verbose=False) as engine:
+        engine.submit(str(src / '0.jpg'), str(dst / '0.jpg'))
+    with TransferEngine(verbose=False, skip_identical=False) as engine:
+        engine.submit(str(src / '0.jpg'), str(dst / '0.jpg'))
+    assert engine.stats['copied'] == 1
+
+
+def test_missing_source_is_not_retried(tmp_path):
+    engine = TransferEngine(num_threads=2, retries=3, retry_delay=10, verbose=False)
+    engine.submit(str(tmp_path / 'nope.jpg'), str(tmp_path / 'out.jpg'))
+    stats = run_with_timeout(engine.close, timeout=5)
+    assert stats['failed'] == 1 and stats['retried'] == 0
+    assert isinstance(engine.errors[0][2], FileNotFoundError)
+
+
+def test_transient_errors_are_retried(tmp_path, monkeypatch):
+    src, dst = make_files(tmp_path, 1)
+    real = file_transfer.materialize
+    calls = []
+
+    def flaky(s, d, mode):
+        calls.append(s)
+        if len(calls) < 3:
+            raise PermissionError('文件被占用')
+        return real(s, d, mode)
+
+    monkeypatch.setattr(file_transfer, 'materialize', flaky)
+    with TransferEngine(num_threads=1, retries=3, retry_delay=0.001, verbose=False) as engine:
+        engine.submit(str(src / '0.jpg'), str(dst / '0.jpg'))
+    assert engine.stats['copied'] == 1 and engine.stats['retried'] == 2 and not engine.errors
+
+
+def test_unexpected_errors_do_not_kill_workers(tmp_path):
+    """link_mode 写错 (ValueError)、路径类型不对 (TypeError)：记为失败，线程继续，submit/close 不会卡住"""
+    src, dst = make_files(tmp_path, 1)
+    engine = TransferEngine('bogus', num_threads=2, queue_size=2, verbose=False)
+
+    def submit_all():
+        for i in range(20):
+            engine.submit(str(src / '0.jpg'), str(dst / f'{i}.jpg'))
+        engine.submit(123, None)
+        return engine.close()
+
+    stats = run_with_timeout(submit_all)
+    assert stats['failed'] == 21 and len(engine.errors) == 21
+    assert all(isinstance(e, ValueError) for _, _, e in engine.errors)
+
+    engine = TransferEngine(num_threads=1, verbose=False)
+    engine.submit(None, None)
+    engine.submit(str(src / '0.jpg'), str(dst / 'ok.jpg'))  # 同一个线程之后的任务照常完成
+    stats = run_with_timeout(engine.close)
+    assert stats['failed'] == 1 and stats['copied'] == 1
+    assert isinstance(engine.errors[0][2], TypeError)
+
+
+def test_submit_after_close_raises(tmp_path):
+    engine = TransferEngine(verbose=False)
+    engine.close()
+    with pytest.raises(RuntimeError):
+        engine.submit('a', 'b')
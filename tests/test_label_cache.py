@@ -0,0 +1,61 @@
+import os
+import shutil
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from label_cache import write_label_cache, load_label_cache, label_cache_path, use_label_cache
+
+
+def make_root(root, cls):
+    """一个转换输出目录：images/train/a.jpg + 清单记录 (不同的 root 用不同的类别区分)"""
+    img = root / 'images' / 'train' / 'a.jpg'
+    img.parent.mkdir(parents=True)
+    (root / 'labels' / 'train').mkdir(parents=True)
+    img.write_bytes(b'\xff\xd8fake')
+    (root / 'labels' / 'train' / 'a.txt').write_text(f'{cls} 0.5 0.5 0.2 0.2\n', encoding='utf-8')
+    record = {'image': str(img), 'img': {'sha1': 'x' * 40}, 'split': 'train', 'cls': [cls],
+              'boxes': [[0.5, 0.5, 0.2, 0.2]], 'size': [64, 48], 'outputs': ['images/train/a.jpg']}
+    write_label_cache(str(root), {'a': record})
+    return str(img)
+
+
+def test_two_label_roots(tmp_path):
+    make_root(tmp_path / 'A', 1)
+    make_root(tmp_path / 'B', 2)
+    path_a = label_cache_path(str(tmp_path / 'A'), 'train')
+    path_b = label_cache_path(str(tmp_path / 'B'), 'train')
+    assert path_a != path_b
+    assert os.path.basename(path_a) != os.path.basename(path_b)  # 文件名里带标签目录的 hash
+    assert load_label_cache(str(tmp_path / 'A'), 'train')['cls'].tolist() == [1]
+    assert load_label_cache(str(tmp_path / 'B'), 'train')['cls'].tolist() == [2]
+    assert load_label_cache(str(tmp_path / 'C'), 'train') is None
+
+    # 整个 A 拷一份：缓存里记的是 A 的标签目录，不能拿来当 copy 的缓存
+    shutil.copytree(tmp_path / 'A', tmp_path / 'copy')
+    moved = os.path.join(str(tmp_path / 'copy' / 'labels'), os.path.basename(path_a))
+    os.replace(moved, label_cache_path(str(tmp_path / 'copy'), 'train'))
+    assert load_label_cache(str(tmp_path / 'copy'), 'train') is None
+
+
+def test_loader_reads_cache_of_its_label_dir(tmp_path, monkeypatch):
+    dataset = pytest.importorskip('ultralytics.data.dataset')
+    monkeypatch.setattr(dataset.YOLODataset, 'get_labels', lambda self: 'scanned')
+    use_label_cache()
+    get_labels = dataset.YOLODataset.get_labels
+
+    for root, cls in [('A', 1), ('B', 2)]:
+        im_file = make_root(tmp_path / root, cls)
+        ds = SimpleNamespace(use_segments=False, use_keypoints=False, im_files=[im_file], prefix='')
+        labels = get_labels(ds)
+        assert labels[0]['cls'].ravel().tolist() == [cls]
+        assert labels[0]['shape'] == (48, 64)
+        assert ds.label_files == [str(tmp_path / root / 'labels' / 'train' / 'a.txt')]
+
+    # 没有缓存的目录回退到逐个扫描
+    other = tmp_path / 'other' / 'images' / 'train' / 'a.jpg'
+    other.parent.mkdir(parents=True)
+    other.write_bytes(b'')
+    ds = SimpleNamespace(use_segments=False, use_keypoints=False, im_files=[str(other)], prefix='')
+    assert get_labels(ds) == 'scanned'
@@ -0,0 +1,73 @@
+import json
+import base64
+import random
+
+import pytest
+
+from labelme_reader import read_labelme, LABELME_KEYS
+
+
+def random_value(rng, depth=0):
+    kind = rng.choice(['int', 'float', 'str', 'bool', 'null'] + (['list', 'dict'] if depth < 3 else []))
+    if kind == 'int':
+        return rng.randint(-10 ** 6, 10 ** 6)
+    if kind == 'float':
+        return rng.uniform(-1e4, 1e4)
+    if kind == 'str':
+        # 引号、反斜杠、括号、中文，专门考验字符串和容器的边界处理
+        return ''.join(rng.choice('ab"\\{}[],: 竹虫眼\n\t') for _ in range(rng.randint(0, 12)))
+    if kind == 'bool':
+        return rng.random() < 0.5
+    if kind == 'null':
+        return None
+    if kind == 'list':
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    return {f'k{i}"\\': random_value(rng, depth + 1) for i in range(rng.randint(0, 4))}
+
+
+def random_labelme(rng):
+    data = {
+        'version': '5.2.1',
+        'flags': random_value(rng),
+        'shapes': [{'label': rng.choice(['霉变', '虫眼', 'a"b']),
+                    'points': [[rng.uniform(0, 4000), rng.uniform(0, 3000)] for _ in range(rng.randint(2, 6))],
+                    'group_id': None, 'shape_type': 'polygon', 'flags': random_value(rng)}
+                   for _ in range(rng.randint(0, 4))],
+        'imagePath': '..\\images\\竹子 "1".jpg',
+        'imageData': base64.b64encode(rng.randbytes(rng.randint(0, 5000))).decode('ascii'),
+        'imageHeight': rng.randint(1, 5000),
+        'imageWidth': rng.randint(1, 5000),
+        'extra': random_value(rng),
+    }
+    keys = list(data)
+    rng.shuffle(keys)
+    return {k: data[k] for k in keys}
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_matches_json_load(tmp_path, seed):
+    rng = random.Random(seed)
+    data = random_labelme(rng)
+    path = tmp_path / 'a.json'
+    path.write_text(json.dumps(data, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 2])),
+                    encoding='utf-8')
+    expected = {k: data[k] for k in LABELME_KEYS}
+    # 很小的块让字段、字符串、转义都跨块
+    for chunk_size in (1, 7, 64, 1 << 20):
+        assert read_labelme(path, chunk_size=chunk_size) == expected
+
+
+def test_bom_missing_keys_and_empty(tmp_path):
+    path = tmp_path / 'a.json'
+    path.write_bytes(b'\xef\xbb\xbf' + json.dumps({'imageWidth': 3, 'shapes': []}).encode('utf-8'))
+    assert read_labelme(path) == {'imageWidth': 3, 'shapes': []}
+    path.write_text(' { } ', encoding='utf-8')
+    assert read_labelme(path) == {}
+
+
+@pytest.mark.parametrize('text', ['{"imageWidth": 3 "shapes": []}', '{"imageWidth": 3,', '[1, 2]'])
+def test_malformed_raises(tmp_path, text):
+    path = tmp_path / 'a.json'
+    path.write_text(text, encoding='utf-8')
+    with pytest.raises(ValueError):
+        read_labelme(path, chunk_size=4)
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+import letterbox_cache
+from letterbox_cache import letterbox, output_stem
+
+
+def test_letterbox_geometry():
+    img, geom = letterbox(np.zeros((30, 60, 3), np.uint8), 64)
+    assert img.shape == (64, 64, 3)
+    assert geom == [64, 32, 0, 16]
+
+
+def test_output_stem():
+    assert output_stem('a.jpg') == 'a'
+    assert output_stem('a.png') == 'a.png'
+    assert output_stem('a.JPG') == 'a.JPG'
+
+
+def test_same_stem_different_ext(tmp_path, monkeypatch):
+    """a.jpg 和 a.png 放在同一个 split 里，缩放后的输出不能互相覆盖"""
+    data, out = tmp_path / 'data', tmp_path / 'out'
+    (data / 'images' / 'train').mkdir(parents=True)
+    (data / 'labels' / 'train').mkdir(parents=True)
+    cv2.imwrite(str(data / 'images' / 'train' / 'a.jpg'), np.full((20, 40, 3), 10, np.uint8))
+    cv2.imwrite(str(data / 'images' / 'train' / 'a.png'), np.full((40, 20, 3), 200, np.uint8))
+    (data / 'labels' / 'train' / 'a.txt').write_text('0 0.5 0.5 0.5 0.5\n', encoding='utf-8')
+    for key, value in {'DATA_DIR': str(data), 'OUT_DIR': str(out), 'IMG_SIZE': 32, 'NUM_WORKERS': 1}.items():
+        monkeypatch.setattr(letterbox_cache, key, value)
+    letterbox_cache.main()
+
+    images = out / 'images' / 'train'
+    assert sorted(p.name for p in images.iterdir()) == ['a.jpg', 'a.png.jpg']
+    assert sorted(p.name for p in (out / 'labels' / 'train').glob('*.txt')) == ['a.png.txt', 'a.txt']
+    # 两张图内容不同，各是各的
+    assert cv2.imread(str(images / 'a.jpg'))[16, 16, 0] < 50
+    assert cv2.imread(str(images / 'a.png.jpg'))[16, 16, 0] > 150
@@ -0,0 +1,64 @@
+import os
+
+from manifest import (fingerprint, is_unchanged, sync_image, remove_stale_outputs, save_manifest, load_manifest,
+                      file_hash)
+
+
+def touch(path, data, mtime_ns=None):
+    path.write_bytes(data)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return str(path)
+
+
+def test_fingerprint_reuses_hash_only_when_stat_matches(tmp_path):
+    src = touch(tmp_path / 'a.jpg', b'one', 10 ** 18)
+    fp = fingerprint(src)
+    assert fp['sha1'] == file_hash(src)
+    assert fingerprint(src, fp) is fp
+    touch(tmp_path / 'a.jpg', b'two', 10 ** 18 + 5)
+    assert fingerprint(src, fp)['sha1'] == file_hash(src) != fp['sha1']
+
+
+def test_sync_image_copies_once_and_recopies_on_change(tmp_path):
+    out = tmp_path / 'out'
+    out.mkdir()
+    src = touch(tmp_path / 'a.jpg', b'one')
+    dst = str(out / 'a.jpg')
+
+    first = {'outputs': []}
+    assert sync_image(src, dst, None, first, str(out))
+    assert open(dst, 'rb').read() == b'one' and first['outputs'] == ['a.jpg']
+
+    second = {'outputs': []}
+    assert not sync_image(src, dst, first, second, str(out))  # 没变，不复制
+    assert is_unchanged(second, {'img': src}, str(out))
+
+    # 同样大小的新内容：哈希变了就要重新复制 (交给 transfers 时只排队)
+    touch(tmp_path / 'a.jpg', b'ONE', 10 ** 18)
+    third, transfers = {'outputs': []}, []
+    assert sync_image(src, dst, second, third, str(out), transfers=transfers)
+    assert transfers == [(src, dst)]
+    assert not is_unchanged(second, {'img': src}, str(out))
+
+    # 输出被删掉也会重新复制
+    os.remove(dst)
+    assert sync_image(src, dst, third, {'outputs': []}, str(out))
+    assert os.path.exists(dst)
+
+
+def test_remove_stale_outputs(tmp_path):
+    for name in ('a.jpg', 'a.txt', 'b.jpg'):
+        (tmp_path / name).write_bytes(b'x')
+    old = {'a': {'outputs': ['a.jpg', 'a.txt']}, 'b': {'outputs': ['b.jpg']}}
+    new = {'a': {'outputs': ['a.jpg']}}
+    assert remove_stale_outputs(str(tmp_path), old, new) == 2
+    assert sorted(os.listdir(tmp_path)) == ['a.jpg']
+
+
+def test_manifest_round_trip(tmp_path):
+    path = str(tmp_path / '.manifest_x.json')
+    assert load_manifest(path) == {}
+    entries = {'竹子/1.json': {'split': 'train', 'outputs': ['images/train/1.jpg']}}
+    save_manifest(path, entries)
+    assert load_manifest(path) == entries
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from pack_shards import pack_records, PackedDataset
+
+
+def test_pack_records_without_size(tmp_path):
+    """xmltoyolo 里 XML 损坏的背景图记录没有 size，打包时从图片本身读尺寸"""
+    cv2 = pytest.importorskip('cv2')
+    records = {}
+    for i, (w, h) in enumerate([(40, 30), (24, 16)]):
+        path = tmp_path / f'{i}.jpg'
+        cv2.imwrite(str(path), np.zeros((h, w, 3), np.uint8))
+        records[path.name] = {'image': str(path), 'split': 'train', 'cls': [], 'boxes': [], 'size': None}
+    records['0.jpg'].update(cls=[1], boxes=[[0.5, 0.5, 0.2, 0.2]], size=[40, 30])
+
+    pack_records(str(tmp_path), records)
+    ds = PackedDataset(str(tmp_path), 'train')
+    assert ds.sizes.tolist() == [[40, 30], [24, 16]]
+    assert ds.targets(0).tolist() == [[1, 0.5, 0.5, pytest.approx(0.2), pytest.approx(0.2)]]
+    assert len(ds.targets(1)) == 0
+    assert ds.decode(1)[0].shape == (16, 24, 3)
@@ -0,0 +1,77 @@
+import random
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from sampling_image import reservoir_sample, interval_picks, interval_source, k_center_greedy
+
+
+def test_reservoir_short_input():
+    rng = random.Random(0)
+    assert reservoir_sample(iter(range(3)), 5, rng) == ([0, 1, 2], 3)
+    assert reservoir_sample(iter([]), 5, rng) == ([], 0)
+
+
+def test_reservoir_counts_and_distinct():
+    rng = random.Random(1)
+    picked, total = reservoir_sample(iter(range(10000)), 50, rng)
+    assert total == 10000
+    assert len(set(picked)) == 50
+
+
+def test_reservoir_is_uniform():
+    rng = random.Random(2)
+    n, k, trials = 20, 5, 20000
+    counts = Counter()
+    for _ in range(trials):
+        counts.update(reservoir_sample(iter(range(n)), k, rng)[0])
+    expected = trials * k / n
+    # 每个位置被抽中的次数都在期望的 ±5% 以内 (标准差约 1.1%)
+    assert all(abs(counts[i] - expected) < 0.05 * expected for i in range(n))
+
+
+@pytest.mark.parametrize('total,k', [(100, 7), (10, 10), (5, 10), (1000, 1), (999, 998)])
+def test_interval_picks(total, k):
+    items = [f'{i:04d}.jpg' for i in range(total)]
+    picked = list(interval_picks(iter(items), total, k))
+    if total <= k:
+        assert picked == items
+    else:
+        assert picked == [items[j * total // k] for j in range(k)]
+
+
+def test_interval_source(tmp_path):
+    names = [f'{i:03d}.jpg' for i in range(7)]
+    for name in names + ['notes.txt']:
+        (tmp_path / name).write_bytes(b'')
+    it, total = interval_source(str(tmp_path))
+    assert total == 7 and sorted(it) == names
+    it, total = interval_source(str(tmp_path), order='name')
+    assert total == 7 and list(it) == names
+    # 默认按目录顺序流式扫描，返回的是生成器而不是整份列表
+    assert not isinstance(interval_source(str(tmp_path))[0], list)
+
+
+def brute_force_k_center(desc, k, first):
+    x = desc.astype(np.float64)
+    picks = [first]
+    min_dist = np.full(len(x), np.inf)
+    for _ in range(k - 1):
+        min_dist = np.minimum(min_dist, ((x - x[picks[-1]]) ** 2).sum(axis=1))
+        picks.append(int(np.argmax(min_dist)))
+    return picks
+
+
+@pytest.mark.parametrize('budget_mb', [256, 0.01])  # 0.01 MB 强制按块计算
+def test_k_center_matches_brute_force(budget_mb):
+    desc = np.random.default_rng(0).random((500, 32)).astype(np.float16)
+    picks = k_center_greedy(desc, 20, random.Random(3), memory_budget_mb=budget_mb)
+    first = random.Random(3).randrange(len(desc))
+    assert picks == brute_force_k_center(desc, 20, first)
+    assert len(set(picks)) == 20
+
+
+def test_k_center_small_input():
+    desc = np.zeros((4, 8), dtype=np.float16)
+    assert k_center_greedy(desc, 10, random.Random(0)) == [0, 1, 2, 3]
@@ -0,0 +1,62 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from yolo_exp import YOLOv8_Model, guess_scale, autopad, SCALES  # noqa: E402
+
+
+def test_autopad():
+    assert autopad(3) == 1
+    assert autopad(3, d=2) == 2
+    assert autopad((3, 5)) == [1, 2]
+    assert autopad(3, p=0) == 0
+
+
+@pytest.mark.parametrize('scale', ['n', 's'])
+def test_fuse_matches_unfused(scale):
+    torch.manual_seed(0)
+    model = YOLOv8_Model(num_classes=4, scale=scale)
+    # 随机的 BN 统计量，否则融合相当于什么都没做
+    for m in model.modules():
+        if isinstance(m, torch.nn.BatchNorm2d):
+            m.running_mean.uniform_(-0.5, 0.5)
+            m.running_var.uniform_(0.5, 2.0)
+            m.weight.data.uniform_(0.5, 1.5)
+            m.bias.data.uniform_(-0.2, 0.2)
+    model.eval()
+    x = torch.rand(1, 3, 128, 160)
+    with torch.inference_mode():
+        ref, feats = model(x)
+        assert ref.shape == (1, 4 + 4, sum((128 // s) * (160 // s) for s in (8, 16, 32)))
+        fused = model.fuse()
+        out = fused(x)
+    assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in fused.modules())
+    assert isinstance(out, torch.Tensor)  # 融合后只返回解码结果
+    torch.testing.assert_close(out, ref, rtol=1e-4, atol=1e-3)
+
+
+@pytest.mark.parametrize('scale', list(SCALES))
+def test_guess_scale_from_stem(scale):
+    model = YOLOv8_Model(num_classes=4, scale=scale)
+    stem = {'model.0.conv.weight': model.backbone[0].conv.weight}
+    assert guess_scale({}, stem) == scale
+    assert guess_scale({'yaml_file': f'yolov8{scale}.yaml'}, {}) == scale
+    assert guess_scale({'scale': scale}, {}) == scale
+
+
+def test_guess_scale_unknown_raises():
+    with pytest.raises(ValueError):
+        guess_scale({'yaml_file': 'custom.yaml'}, {'model.0.conv.weight': torch.zeros(24, 3, 3, 3)})
+
+
+def test_loads_ultralytics_state_dict():
+    """参数名映射 (model.<层号> -> backbone/neck/detect_head) 对得上，输出和 ultralytics 的网络一致"""
+    tasks = pytest.importorskip('ultralytics.nn.tasks')
+    torch.manual_seed(0)
+    ref = tasks.DetectionModel('yolov8n.yaml', nc=4, verbose=False).eval()
+    model = YOLOv8_Model(num_classes=4, scale='n').load_ultralytics_state_dict(ref.state_dict()).eval()
+    x = torch.rand(1, 3, 160, 160)
+    with torch.inference_mode():
+        expected = ref(x)
+        expected = expected[0] if isinstance(expected, (list, tuple)) else expected
+        torch.testing.assert_close(model(x)[0], expected, rtol=1e-4, atol=1e-3)
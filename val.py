@@ -1,4 +1,8 @@
 from ultralytics import YOLO
+from label_cache import use_label_cache
+
+# 转换脚本写了标签缓存时直接读取，不再逐个扫描 labels/*.txt
+use_label_cache()
 
 # 加载模型
 model = YOLO('D:\\Documaents\\Adobe\\runs\\detect\\bamboo_exp7\\weights\\best.pt')
@@ -1,10 +1,18 @@
 import xml.etree.ElementTree as ET
 import os
-import shutil
 import random
-from tqdm import tqdm
+from collections import Counter
+from convert_pool import run_tasks
+from pack_shards import pack_records
+from label_cache import write_label_cache
+from file_transfer import TransferEngine
+from image_index import ImageIndex
+from dataset_split import assign_split, primary_class, load_dedup_groups, pick_representatives, SplitReport
+from manifest import (manifest_path, load_manifest, save_manifest, fingerprint, is_unchanged,
+                      record_image, sync_image, rel_output, remove_stale_outputs, print_diff_summary)
 
 classes = ['霉变', '严重开裂', '虫眼', '边壁缺失'] 
+class_ids = {name: i for i, name in enumerate(classes)}  # 类别名 -> ID，查找是 O(1)
 
 input_dir = 'D:\\Downloads\\Compressed\\bamboo_saw\\labeled\\annotations'  # XML文件夹
 input_images_dir = 'D:\\Downloads\\Compressed\\bamboo_saw\\labeled\\images'  # 图片文件夹
@@ -12,6 +20,42 @@ output_dir = 'D:\\Documents\\Adobe\\data'  # 输出路径
 
 split_ratios = 0.8
 
+# 划分方式：'hash' 按图片文件名的稳定哈希划分 (新增图片不会让已有图片换边)
+#          'random' 按 random_seed 打乱后按位置切分 (旧方式，新增文件会让大量图片换边)
+split_mode = 'hash'
+
+# 按类别分层的 train 比例 (可选，仅 'hash' 模式)，例如 {'虫眼': 0.7}
+# 每张图归到它目标数最多的类别；没列出的类别用 split_ratios
+class_split_ratio = {}
+
+# 随机种子 ('random' 模式用；设为整数则每次划分结果一致，None 表示每次随机)
+random_seed = None
+
+# 并行进程数：1 为串行，0 为使用全部 CPU 核
+num_workers = 1
+
+# 图片落地方式：'copy' 复制 / 'hardlink' 硬链接 / 'reflink' 写时复制 / 'symlink' 软链接
+# (不支持时自动回退为复制；硬链接下不要直接修改 data/ 里的图片，会连原图一起改)
+link_mode = 'copy'
+
+# 图片传输线程数：子进程只转换标签，图片交给主进程的线程池在后台并发复制 (见 file_transfer.py)，
+# 网络盘/机械硬盘上比逐张串行复制快得多；0 表示在子进程里逐张直接复制
+transfer_threads = 8
+
+# 增量重建：只转换/复制有变化的 XML 和图片，源文件删掉的输出也会被清理
+# (设为 False 则全部重新生成)
+incremental = True
+
+# 输出方式：'dir' 目录结构 (images/ + labels/) / 'packed' 打包分片 (data/packed/<split>/，见 pack_shards.py)
+output_format = 'dir'
+
+# 近似重复分组文件 (dedup.py 生成，可选，None 表示不用)：
+# 'hash' 模式下同一组的图片整组落在 train 或 val 一边
+dedup_groups_file = None
+
+# 每组近似重复只保留一张 (组里有标签的成员中文件名最小的一张)，其余不转换；整组都没有标签时一张都不去掉
+drop_duplicates = False
+
 def xml2yolo(size, box):
     """ 将 VOC 坐标转换为 YOLO 坐标 """
     dw = 1./size[0]
@@ -26,47 +70,75 @@ def xml2yolo(size, box):
     h = h*dh
     return (x, y, w, h)
 
+def iter_voc(xml_file):
+    """
+    用 iterparse 流式读取 VOC XML，逐个产出 ('size', (w, h)) 和 ('object', (cls_id, box))
+    每处理完一个 object 就清掉已解析的元素，多目标的大 XML 也只占常数内存
+    """
+    # encoding='utf-8' (和以前一样按 utf-8 文本读取，with 保证出错时也会关闭文件)
+    with open(xml_file, encoding='utf-8') as in_file:
+        root = None
+        for event, elem in ET.iterparse(in_file, events=('start', 'end')):
+            if root is None:
+                root = elem
+            if event != 'end':
+                continue
+
+            if elem.tag == 'size':
+                yield 'size', (int(elem.find('width').text), int(elem.find('height').text))
+                root.clear()
+            elif elem.tag == 'object':
+                difficult = elem.find('difficult')
+                difficult = int(difficult.text) if difficult is not None else 0
+
+                # 去除可能存在的首尾空格
+                cls_id = class_ids.get(elem.find('name').text.strip())
+                if cls_id is not None and difficult != 1:
+                    xmlbox = elem.find('bndbox')
+                    b = (float(xmlbox.find('xmin').text), float(xmlbox.find('xmax').text),
+                         float(xmlbox.find('ymin').text), float(xmlbox.find('ymax').text))
+                    yield 'object', (cls_id, b)
+                root.clear()
+
 def conv_annotation(xml_file, output_txt_path):
-    """ 读取 XML 并转换 """
-    # encoding='utf-8'
-    in_file = open(xml_file, encoding='utf-8')
+    """
+    流式读取 XML 并转换，返回 ([(类别ID, 归一化框), ...], 图片尺寸) (列表为空表示没有有效目标)
+    没有有效目标时不创建标签文件；XML 损坏时返回 None (不留下写了一半的文件)
+    output_txt_path 为 None 时只转换不写文件 (打包模式)
+    """
+    out_file = None
+    size = None
+    pending = []  # 极少数 XML 把 <size> 写在 <object> 后面，先暂存
+    found_box = []
     try:
-        tree = ET.parse(in_file)
+        for kind, value in iter_voc(xml_file):
+            if kind == 'size':
+                size = value
+            else:
+                pending.append(value)
+            if size is None or not pending:
+                continue
+            if out_file is None and output_txt_path is not None:
+                # 有第一个有效目标时才创建文件
+                out_file = open(output_txt_path, 'w', encoding='utf-8', buffering=1 << 16)
+            for cls_id, b in pending:
+                bb = xml2yolo(size, b)
+                if out_file is not None:
+                    out_file.write(str(cls_id) + " " + " ".join([str(a) for a in bb]) + '\n')
+                found_box.append((cls_id, bb))
+            pending.clear()
     except ET.ParseError:
-        print(f"\n文件可能损坏..?: {xml_file}")
-        in_file.close()
-        return False
-        
-    root = tree.getroot()
-    size = root.find('size')
-    w = int(size.find('width').text)
-    h = int(size.find('height').text)
-
-    out_file = open(output_txt_path, 'w', encoding='utf-8')
-
-    found_box = False
-    for obj in root.iter('object'):
-        difficult = obj.find('difficult')
-        difficult = int(difficult.text) if difficult is not None else 0
-        
-        cls = obj.find('name').text
-        # 去除可能存在的首尾空格
-        cls = cls.strip()
-        
-        if cls not in classes or difficult == 1:
-            continue
-            
-        cls_id = classes.index(cls)
-        xmlbox = obj.find('bndbox')
-        b = (float(xmlbox.find('xmin').text), float(xmlbox.find('xmax').text),
-             float(xmlbox.find('ymin').text), float(xmlbox.find('ymax').text))
-        bb = xml2yolo((w, h), b)
-        out_file.write(str(cls_id) + " " + " ".join([str(a) for a in bb]) + '\n')
-        found_box = True
-        
-    in_file.close()
-    out_file.close()
-    return found_box
+        if out_file is not None:
+            out_file.close()
+            os.remove(output_txt_path)
+        return None
+
+    if out_file is not None:
+        out_file.close()
+    if pending:
+        # 整个文件都没有 <size>，没法归一化
+        return None
+    return found_box, size
 
 def make_dir():
     # 如果文件夹存在，先删除再创建，保持环境干净（可选，这里我保留了创建逻辑）
@@ -76,56 +148,202 @@ def make_dir():
             if not os.path.exists(path):
                 os.makedirs(path)
 
+# 子进程里用到的 XML 索引和近似重复分组 (由 init_worker 注入)
+_xml_index = None
+_dedup_groups = {}
+_representatives = {}
+
+def init_worker(xml_index, dedup_groups, representatives=None):
+    global _xml_index, _dedup_groups, _representatives
+    _xml_index = xml_index
+    _dedup_groups = dedup_groups
+    _representatives = representatives or {}
+
+def is_redundant(image_file):
+    """在近似重复组里、又不是去重时保留的那张 (组里有标签的成员中文件名最小的一张) 的图片"""
+    return _representatives.get(image_file, image_file) != image_file
+
+def hash_split(image_file, stratum):
+    """按图片文件名的哈希决定 train/val (stratum 为分层用的类别 ID)；近似重复组整组按组代表、总体比例划分"""
+    class_ratios = {class_ids[name]: ratio for name, ratio in class_split_ratio.items()}
+    return assign_split(image_file, split_ratios, stratum, class_ratios, group=_dedup_groups.get(image_file))
+
+def voc_primary_class(xml_file):
+    """分层时要先知道这张图的主要类别才能决定划分，多扫一遍 XML (同样是流式的)"""
+    try:
+        return primary_class([value[0] for kind, value in iter_voc(xml_file) if kind == 'object'])
+    except ET.ParseError:
+        return None
+
+def scan_labeled(image_file):
+    """去重前的预扫描：这张图有 XML、而且转换后会有标签时返回 {'status': 'labeled', 'image': 图片文件名}"""
+    xml_file = _xml_index.find(os.path.splitext(image_file)[0], ['.xml'])
+    converted = conv_annotation(xml_file, None) if xml_file else None
+    if not converted or not converted[0]:
+        return {'status': 'skip'}
+    return {'status': 'labeled', 'image': image_file}
+
+def convert_one(task):
+    """处理单张图片：找 XML -> 复制图片 -> 转换标签"""
+    image_file, split, old = task
+    # 处理类似 123.456.jpg
+    file_name = os.path.splitext(image_file)[0]
+    src_img = os.path.join(input_images_dir, image_file)
+
+    # 近似重复里的非代表图片：去重模式下直接跳过 (清单里记一笔，之前生成的输出会被清理)
+    if drop_duplicates and is_redundant(image_file):
+        diff = 'unchanged' if old and 'dropped' in old else ('changed' if old else 'added')
+        return {'status': 'duplicate', 'diff': diff, 'record': {'dropped': image_file, 'outputs': []}}
+    if old and 'dropped' in old:
+        old = None
+
+    # 增量模式：XML 和图片都没动过、输出也都在 (输出方式没换，哈希模式下划分也没变)，直接沿用上次的结果
+    if (old and old.get('layout', 'dir') == output_format and 'size' in old
+            and is_unchanged(old, {'ann': old['xml'], 'img': src_img}, output_dir)
+            and (split_mode != 'hash' or hash_split(image_file, old.get('stratum')) == old['split'])):
+        return {'status': old['split'], 'diff': 'unchanged', 'record': old}
+
+    #xml.XML (索引里后缀不区分大小写，一次查找就够了)
+    xml_file = _xml_index.find(file_name, ['.xml'])
+
+    if not xml_file:
+        return {'status': 'missing', 'msg': f"找不到对应的xml文档，跳过了: {file_name}.jpg..."}
+
+    # 3. 划分数据集：哈希模式在这里按图片文件名决定，和处理顺序、进程数都无关
+    stratum = None
+    if split is None:
+        if class_split_ratio:
+            stratum = voc_primary_class(xml_file)
+        split = hash_split(image_file, stratum)
+
+    old_ann = old['ann'] if old and old['xml'] == xml_file else None
+    record = {'split': split, 'xml': xml_file, 'layout': output_format, 'ann': fingerprint(xml_file, old_ann), 'outputs': []}
+    result = {'status': split, 'diff': 'changed' if old else 'added', 'record': record}
+
+    # 4. 复制图片 (或按 link_mode 建链接)；图片内容没变、目标也还在时就不再复制
+    #    打包模式不落地单个文件，只记下原图指纹，最后统一打包
+    if output_format == 'packed':
+        record_image(src_img, old, record)
+        dst_label = None
+    else:
+        dst_img = os.path.join(output_dir, 'images', split, image_file)
+        result['transfers'] = [] if transfer_threads else None
+        sync_image(src_img, dst_img, old, record, output_dir, link_mode, result['transfers'])
+        dst_label = os.path.join(output_dir, 'labels', split, file_name + '.txt')
+
+    # 5. 转换标签 (这是之前报错的地方，已经修复)
+    # 没有有效目标时不会生成标签文件 (YOLO 会把这张图当作背景图)
+    converted = conv_annotation(xml_file, dst_label)
+    if converted is None:
+        result['msg'] = f"\n文件可能损坏..?: {xml_file}"
+        found_box, size = [], None
+    else:
+        found_box, size = converted
+        if found_box and dst_label is not None:
+            record['outputs'].append(rel_output(output_dir, dst_label))
+    record['cls'] = [cls_id for cls_id, bb in found_box]
+    record['boxes'] = [list(bb) for cls_id, bb in found_box]
+    record['size'] = list(size) if size else None
+    record['stratum'] = primary_class(record['cls']) if stratum is None else stratum
+    return result
+
 def main():
     make_dir()
     
-    # 过滤出图片文件
-    image_files = [f for f in os.listdir(input_images_dir) if f.lower().endswith(('.jpg', '.png', '.jpeg', '.bmp'))]
-    random.shuffle(image_files)
-
-    train_count = 0
-    val_count = 0
-    missing_xml_count = 0
+    # 过滤出图片文件 (先排序再打乱，保证同一个种子得到相同的划分)
+    image_index = ImageIndex.load_or_build(input_images_dir)
+    image_files = [f for f in image_index.names if f.lower().endswith(('.jpg', '.png', '.jpeg', '.bmp'))]
+    if split_mode == 'random':
+        random.Random(random_seed).shuffle(image_files)
+        if dedup_groups_file:
+            print("[警告] split_mode='random' 按打乱后的位置划分，近似重复组不会放在同一边 (分组只用于 drop_duplicates)；需要防止泄漏请改用 'hash'")
 
     print(f"找到 {len(image_files)} 张图片，开始处理...")
 
-    for i, image_file in tqdm(enumerate(image_files), total=len(image_files)):
-        # 处理类似 123.456.jpg
-        file_name = os.path.splitext(image_file)[0]
-        
-        #xml.XML
-        xml_file = os.path.join(input_dir, file_name + '.xml')
-        if not os.path.exists(xml_file):
-             xml_file = os.path.join(input_dir, file_name + '.XML')
-        
-        if not os.path.exists(xml_file):
+    # 读取上次的清单 (键是图片文件名)
+    manifest_file = manifest_path(output_dir, 'xmltoyolo')
+    old_entries = load_manifest(manifest_file)
+
+    # 3. 'random' 模式在主进程按打乱后的位置划分 (串行/并行结果一致)，已有的图片保持上次的划分
+    #    'hash' 模式交给子进程按文件名哈希决定，这里传 None
+    tasks = []
+    for i, image_file in enumerate(image_files):
+        old = old_entries.get(image_file) if incremental else None
+        split = None
+        if split_mode == 'random':
+            split = 'train' if i < len(image_files) * split_ratios else 'val'
+            if old:
+                split = old.get('split', split)  # 去重跳过的记录没有 split
+        tasks.append((image_file, split, old))
+
+    new_entries = {}
+    diff = Counter()
+    dedup_groups = load_dedup_groups(dedup_groups_file)
+    report = SplitReport(split_ratios, {class_ids[k]: v for k, v in class_split_ratio.items()},
+                         dict(enumerate(classes)))
+
+    # 图片复制在后台线程里进行，主进程继续收子进程的结果
+    # 要不要重新复制已经由 manifest 按内容 hash 判断过了，这里不再按大小/修改时间跳过
+    engine = TransferEngine(link_mode, num_threads=transfer_threads, skip_identical=False) if transfer_threads else None
+
+    def on_result(task, result, stats):
+        for src, dst in result.get('transfers') or ():
+            engine.submit(src, dst)
+        if 'record' in result:
+            record = result['record']
+            new_entries[task[0]] = record
+            diff[result['diff']] += 1
+            if 'dropped' not in record:
+                # 哈希模式下近似重复组按总体比例划分，单独统计，不算进各类别
+                grouped = split_mode == 'hash' and task[0] in dedup_groups
+                report.add(record['split'], record.get('stratum'), grouped)
+        if result['status'] == 'missing':
             # 调试信息：只打印前 3 个找不到的，防止刷屏
-            if missing_xml_count < 3:
-                print(f"找不到对应的xml文档，跳过了: {file_name}.jpg...")
-            missing_xml_count += 1
-            continue
-
-        # 3. 划分数据集
-        if i < len(image_files) * split_ratios:
-            split = 'train'
-            train_count += 1
-        else:
-            split = 'val'
-            val_count += 1
-
-        # 4. 复制图片
-        src_img = os.path.join(input_images_dir, image_file)
-        dst_img = os.path.join(output_dir, 'images', split, image_file)
-        shutil.copyfile(src_img, dst_img)
+            if stats['missing'] <= 3:
+                print(result['msg'])
+        elif result.get('msg'):
+            print(result['msg'])
 
-        # 5. 转换标签 (这是之前报错的地方，已经修复)
-        dst_label = os.path.join(output_dir, 'labels', split, file_name + '.txt')
-        conv_annotation(xml_file, dst_label)
+    # XML 文件夹同样一次扫描建索引
+    xml_index = ImageIndex.load_or_build(input_dir)
+
+    # 去重模式：先找出近似重复组里转换后确实有标签的图片，每组只保留其中文件名最小的一张，
+    # 组代表没有标注时不会把组里有标注的图片也一起丢掉
+    representatives = {}
+    if drop_duplicates and dedup_groups:
+        labeled = set()
+
+        def on_scan(task, result, stats):
+            if result['status'] == 'labeled':
+                labeled.add(result['image'])
+
+        run_tasks(scan_labeled, [f for f in image_files if f in dedup_groups], num_workers, on_result=on_scan,
+                  initializer=init_worker, initargs=(xml_index, dedup_groups), desc='去重预扫描')
+        representatives = pick_representatives(dedup_groups, labeled)
+
+    stats = run_tasks(convert_one, tasks, num_workers, on_result=on_result,
+                      initializer=init_worker, initargs=(xml_index, dedup_groups, representatives))
+    if engine:
+        engine.close()  # 等图片全部落地，再清理旧输出、写标签缓存
+
+    # 清理源文件已消失 (或换了划分) 的旧输出，再写回清单
+    removed_files = remove_stale_outputs(output_dir, old_entries, new_entries)
+    save_manifest(manifest_file, new_entries)
+
+    if output_format == 'packed':
+        pack_records(output_dir, new_entries)
+    else:
+        # 每个 split 的全部标签合并成一个缓存文件，训练/验证启动时不用再逐个扫描
+        write_label_cache(output_dir, new_entries, 'bbox')
 
     print(f"\n处理完毕！Summary:")
-    print(f"  训练集: {train_count}")
-    print(f"  验证集: {val_count}")
-    print(f"  未找到XML跳过: {missing_xml_count}")
+    print_diff_summary(diff, old_entries, new_entries, removed_files)
+    print(f"  训练集: {stats['train']}")
+    print(f"  验证集: {stats['val']}")
+    print(f"  未找到XML跳过: {stats['missing']}")
+    if stats['duplicate']:
+        print(f"  近似重复去掉: {stats['duplicate']}")
+    report.print()
     print(f"数据已保存在: {output_dir}")
 
 if __name__ == '__main__':
@@ -1,12 +1,76 @@
+import os
+import re
+import glob
+import math
+import time
+import statistics
 import torch
 import torch.nn as nn
+
+# 自己搭的 YOLOv8 检测网络 (和 ultralytics 的层结构、参数名一一对应)
+# 可以直接加载训练出来的 runs/detect/bamboo_exp*/weights/best.pt，
+# fuse() 后是推理专用模式：BatchNorm 折进卷积、检测头只输出解码后的框。
+# 直接运行本文件：在 CPU 上对比 未融合 / 融合 / ultralytics 原版 三者的推理延迟，并检查输出是否一致。
+
+# ================= 配置区域 =================
+# 权重：None 表示自动找 runs/detect/bamboo_exp*/weights/best.pt 里最新的一个；都没有时用随机初始化的网络测速
+WEIGHTS = None
+WEIGHTS_GLOB = os.path.join('runs', 'detect', 'bamboo_exp*', 'weights', 'best.pt')
+# 没有权重时随机初始化的网络规模 (n/s/m/l/x) 和类别数
+SCALE = 'm'
+NUM_CLASSES = 4
+
+IMG_SIZE = 640
+BATCH_SIZE = 1
+WARMUP = 3
+RUNS = 20
+# PyTorch 的 CPU 线程数，0 表示用默认值
+TORCH_THREADS = 0
+# 是否顺便打印 ultralytics 模型的层结构
+PRINT_STRUCTURE = False
+# ===========================================
+
+# YOLOv8 的规模系数：[depth, width, max_channels] (和 ultralytics 的 yolov8.yaml 一致)
+SCALES = {
+    'n': (0.33, 0.25, 1024),
+    's': (0.33, 0.50, 1024),
+    'm': (0.67, 0.75, 768),
+    'l': (1.00, 1.00, 512),
+    'x': (1.00, 1.25, 512),
+}
+
+
+def guess_scale(yaml, state_dict):
+    """
+    checkpoint 对应的网络规模 (n/s/m/l/x)：先看 yaml 里的 scale，再看 yaml 文件名 (yolov8s.yaml 这种)，
+    最后按第一层卷积的输出通道数 (每个规模都不一样) 判断；都判断不出来时报错，不要默认成 n 再在加载参数时对不上
+    """
+    scale = yaml.get('scale')
+    if scale in SCALES:
+        return scale
+    m = re.search(r'yolo[v]?\d+([nslmx])', os.path.splitext(os.path.basename(str(yaml.get('yaml_file', ''))))[0])
+    if m:
+        return m.group(1)
+    stem = state_dict.get('model.0.conv.weight')
+    if stem is not None:
+        by_stem = {math.ceil(min(64, mc) * w / 8) * 8: s for s, (_, w, mc) in SCALES.items()}
+        if stem.shape[0] in by_stem:
+            return by_stem[stem.shape[0]]
+    raise ValueError(f"无法判断 checkpoint 的网络规模 (yaml scale={scale!r}, yaml_file={yaml.get('yaml_file')!r}, "
+                     f"第一层输出通道 {None if stem is None else stem.shape[0]})，不是标准的 YOLOv8 n/s/m/l/x？")
+
+
 # 1. 基础卷积模块 (Conv Module)
 # YOLO用Conv+BatchNorm+SiLU的组合
-def autopad(k, p=None):
-    #计算padding，确保输出尺寸与输入相同
+def autopad(k, p=None, d=1):
+    #计算padding，确保输出尺寸与输入相同 (d>1 时按膨胀后的实际卷积核大小算)
+    if d > 1:
+        k = d * (k - 1) + 1 if isinstance(k, int) else [d * (x - 1) + 1 for x in k]
     if p is None:
-        p=k//2 if isinstance(k,int) else [x//2 for x in k]
-        return p
+        p = k // 2 if isinstance(k, int) else [x // 2 for x in k]
+    return p
+
+
 class Conv(nn.Module):
     #Conv:Conv2d+BatchNorm+SiLU
     def __init__(self, c1, c2, k=1, s=1, p=None, g=1, d=1, act=True):
@@ -31,10 +95,29 @@ class Conv(nn.Module):
         self.bn = nn.BatchNorm2d(c2)
         # Sigmoid Linear Unit，平滑的激活函数，相比ReLu更适合深层网络
         self.act = nn.SiLU() if act is True else (act if isinstance(act, nn.Module) else nn.Identity())#nn.Identity()表示不使用激活函数
-        #前向传播，返回激活后的输出
-        def forward(self, x):
-            #bn = batch normalization
-            return self.act(self.bn(self.conv(x)))
+
+    def forward(self, x):
+        #前向传播，返回激活后的输出；bn = batch normalization
+        return self.act(self.bn(self.conv(x)))
+
+    def forward_fuse(self, x):
+        # BN 已经折进卷积 (见 fuse_conv_and_bn)，少一次逐元素的归一化
+        return self.act(self.conv(x))
+
+
+def fuse_conv_and_bn(conv, bn):
+    # 推理时 BN 只是每个输出通道一个固定的缩放和偏移：y = (conv(x) - mean) / std * gamma + beta
+    # 把缩放乘进卷积核、偏移变成卷积的 bias，得到一个等价的带 bias 的卷积
+    fused = nn.Conv2d(conv.in_channels, conv.out_channels, conv.kernel_size, conv.stride, conv.padding,
+                      dilation=conv.dilation, groups=conv.groups, bias=True).requires_grad_(False)
+    with torch.no_grad():
+        scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+        fused.weight.copy_(conv.weight * scale.view(-1, 1, 1, 1))
+        bias = conv.bias if conv.bias is not None else torch.zeros_like(bn.running_mean)
+        fused.bias.copy_((bias - bn.running_mean) * scale + bn.bias)
+    return fused.to(conv.weight.device)
+
+
 # 2. 核心特征提取模块 (C2f Module)
 class Bottleneck(nn.Module):
     # 标准瓶颈层：ResNet 结构 (x + f(x))
@@ -49,8 +132,11 @@ class Bottleneck(nn.Module):
         self.cv1 = Conv(c1, c_, k[0], 1)
         self.cv2 = Conv(c_, c2, k[1], 1, g=g)
         self.add = shortcut and c1 == c2
+
     def forward(self, x):
         return x + self.cv2(self.cv1(x)) if self.add else self.cv2(self.cv1(x))
+
+
 class C2f(nn.Module):
     # CSP Bottleneck with 2 convolutions
     def __init__(self, c1, c2, n=1, shortcut=False, g=1, e=0.5):
@@ -59,11 +145,14 @@ class C2f(nn.Module):
         self.cv1 = Conv(c1, 2 * self.c, 1, 1) # 输入分路
         self.cv2 = Conv((2 + n) * self.c, c2, 1) # 输出汇合
         self.m = nn.ModuleList(Bottleneck(self.c, self.c, shortcut, g, k=((3, 3), (3, 3)), e=1.0) for _ in range(n))
+
     def forward(self, x):
         # 这里的 split 和 extend 就是 C2f 丰富的梯度流来源
         y = list(self.cv1(x).chunk(2, 1))
         y.extend(m(y[-1]) for m in self.m)
         return self.cv2(torch.cat(y, 1))
+
+
 # 3. 空间金字塔池化 (SPPF Module)
 class SPPF(nn.Module):
     # Spatial Pyramid Pooling - Fast (SPPF) layer
@@ -79,39 +168,285 @@ class SPPF(nn.Module):
         y1 = self.m(x)
         y2 = self.m(y1)
         return self.cv2(torch.cat((x, y1, y2, self.m(y2)), 1))
-# 4. 完整的网络定义 (YOLOv8 Class)
-#是伪代码,主要由主干\颈部和检测组成。forward 函数定义了数据在网络中的前向传播路径。
+
+
+class Concat(nn.Module):
+    # 沿通道拼接 (单独做成模块，方便挂 hook 统计)
+    def __init__(self, dimension=1):
+        super().__init__()
+        self.d = dimension
+
+    def forward(self, x):
+        return torch.cat(x, self.d)
+
+
+# 4. 检测头 (Detect Module)
+class DFL(nn.Module):
+    # Distribution Focal Loss 的积分：每条边预测 reg_max 个区间的分布，取期望得到距离
+    def __init__(self, c1=16):
+        super().__init__()
+        self.conv = nn.Conv2d(c1, 1, 1, bias=False).requires_grad_(False)
+        self.conv.weight.data[:] = torch.arange(c1, dtype=torch.float).view(1, c1, 1, 1)
+        self.c1 = c1
+
+    def forward(self, x):
+        b, _, a = x.shape  # batch, channels, anchors
+        return self.conv(x.view(b, 4, self.c1, a).transpose(2, 1).softmax(1)).view(b, 4, a)
+
+
+def make_anchors(feats, strides, grid_cell_offset=0.5):
+    # 每个特征图格子中心的坐标 (以格子为单位) 和对应的步长
+    anchor_points, stride_tensor = [], []
+    for f, stride in zip(feats, strides):
+        h, w = f.shape[2:]
+        sx = torch.arange(w, dtype=f.dtype, device=f.device) + grid_cell_offset
+        sy = torch.arange(h, dtype=f.dtype, device=f.device) + grid_cell_offset
+        sy, sx = torch.meshgrid(sy, sx, indexing='ij')
+        anchor_points.append(torch.stack((sx, sy), -1).view(-1, 2))
+        stride_tensor.append(torch.full((h * w, 1), float(stride), dtype=f.dtype, device=f.device))
+    return torch.cat(anchor_points), torch.cat(stride_tensor)
+
+
+class Detect(nn.Module):
+    # YOLOv8 解耦头：每个尺度一路回归框 (cv2，输出 4*reg_max 个分布)、一路分类 (cv3)，无 anchor
+    def __init__(self, nc=80, ch=(), reg_max=16, stride=(8, 16, 32)):
+        super().__init__()
+        self.nc = nc  # number of classes
+        self.nl = len(ch)  # number of detection layers
+        self.reg_max = reg_max  # DFL channels
+        self.no = nc + reg_max * 4  # number of outputs per anchor
+        self.stride = torch.tensor(stride, dtype=torch.float)
+        c2, c3 = max((16, ch[0] // 4, reg_max * 4)), max(ch[0], min(nc, 100))  # channels
+        self.cv2 = nn.ModuleList(
+            nn.Sequential(Conv(x, c2, 3), Conv(c2, c2, 3), nn.Conv2d(c2, 4 * reg_max, 1)) for x in ch)
+        self.cv3 = nn.ModuleList(
+            nn.Sequential(Conv(x, c3, 3), Conv(c3, c3, 3), nn.Conv2d(c3, nc, 1)) for x in ch)
+        self.dfl = DFL(reg_max) if reg_max > 1 else nn.Identity()
+        # fuse() 之后只返回解码结果，不再带训练算 loss 用的原始特征图
+        self.inference_only = False
+        self.shape = None
+        self.anchors = torch.empty(0)
+        self.strides = torch.empty(0)
+
+    def forward(self, x):
+        x = [torch.cat((self.cv2[i](x[i]), self.cv3[i](x[i])), 1) for i in range(self.nl)]
+        if self.training:
+            return x
+        y = self.decode(x)
+        return y if self.inference_only else (y, x)
+
+    def decode(self, x):
+        # 返回 (batch, 4 + nc, anchors)：前 4 个是输入图像素坐标下的 xywh，后面是各类别概率
+        shape = x[0].shape
+        if self.shape != shape:  # 输入尺寸不变时 anchor 只算一次
+            self.anchors, self.strides = (a.transpose(0, 1) for a in make_anchors(x, self.stride))
+            self.shape = shape
+        x_cat = torch.cat([xi.view(shape[0], self.no, -1) for xi in x], 2)
+        box, cls = x_cat.split((self.reg_max * 4, self.nc), 1)
+        lt, rb = self.dfl(box).chunk(2, 1)
+        anchors = self.anchors.unsqueeze(0)
+        x1y1, x2y2 = anchors - lt, anchors + rb
+        dbox = torch.cat(((x1y1 + x2y2) / 2, x2y2 - x1y1), 1) * self.strides
+        return torch.cat((dbox, cls.sigmoid()), 1)
+
+
+# 5. 完整的网络定义 (YOLOv8 Class)
+# 主干\颈部和检测头组成。层的顺序和 ultralytics 的 yolov8.yaml 一致 (backbone 0-9、neck 10-21、Detect 22)，
+# 所以 best.pt 里的参数只要换个前缀就能直接加载。
 class YOLOv8_Model(nn.Module):
-    def __init__(self, num_classes=4):
+    def __init__(self, num_classes=4, scale='n'):
         super().__init__()
-        
-        # 1. Backbone (主干网络): 负责提取特征
+        depth, width, max_channels = SCALES[scale]
+        ch = lambda c: math.ceil(min(c, max_channels) * width / 8) * 8  # 通道数按宽度系数缩放并取 8 的倍数
+        rep = lambda n: max(round(n * depth), 1) if n > 1 else n         # C2f 里 Bottleneck 的个数按深度系数缩放
+        self.num_classes = num_classes
+        self.scale = scale
+        self.names = {i: str(i) for i in range(num_classes)}
+
+        # 1. Backbone (主干网络): 负责提取特征，输出 P3(1/8)、P4(1/16)、P5(1/32) 三个尺度
         self.backbone = nn.Sequential(
-            Conv(3, 16, 3, 2),      # Layer 0
-            Conv(16, 32, 3, 2),     # Layer 1
-            C2f(32, 32, 1, True),   # Layer 2
-            Conv(32, 64, 3, 2),     # Layer 3
-            C2f(64, 64, 2, True),   # Layer 4
-            Conv(64, 128, 3, 2),    # Layer 5
-            C2f(128, 128, 2, True), # Layer 6
-            Conv(128, 256, 3, 2),   # Layer 7
-            C2f(256, 256, 1, True), # Layer 8
-            SPPF(256, 256, 5)       # Layer 9
+            Conv(3, ch(64), 3, 2),                  # Layer 0  P1/2
+            Conv(ch(64), ch(128), 3, 2),            # Layer 1  P2/4
+            C2f(ch(128), ch(128), rep(3), True),    # Layer 2
+            Conv(ch(128), ch(256), 3, 2),           # Layer 3  P3/8
+            C2f(ch(256), ch(256), rep(6), True),    # Layer 4
+            Conv(ch(256), ch(512), 3, 2),           # Layer 5  P4/16
+            C2f(ch(512), ch(512), rep(6), True),    # Layer 6
+            Conv(ch(512), ch(1024), 3, 2),          # Layer 7  P5/32
+            C2f(ch(1024), ch(1024), rep(3), True),  # Layer 8
+            SPPF(ch(1024), ch(1024), 5)             # Layer 9
         )
-        
-        # 2. Head (检测头): 负责输出类别和坐标
+
+        # 2. Neck (颈部): 上采样再下采样，把三个尺度的特征互相融合 (PAN-FPN)
+        self.neck = nn.ModuleList([
+            nn.Upsample(None, 2, 'nearest'),                # Layer 10
+            Concat(1),                                      # Layer 11  拼 P4
+            C2f(ch(1024) + ch(512), ch(512), rep(3)),       # Layer 12
+            nn.Upsample(None, 2, 'nearest'),                # Layer 13
+            Concat(1),                                      # Layer 14  拼 P3
+            C2f(ch(512) + ch(256), ch(256), rep(3)),        # Layer 15  (P3/8-small)
+            Conv(ch(256), ch(256), 3, 2),                   # Layer 16
+            Concat(1),                                      # Layer 17  拼 Layer 12
+            C2f(ch(256) + ch(512), ch(512), rep(3)),        # Layer 18  (P4/16-medium)
+            Conv(ch(512), ch(512), 3, 2),                   # Layer 19
+            Concat(1),                                      # Layer 20  拼 P5
+            C2f(ch(512) + ch(1024), ch(1024), rep(3)),      # Layer 21  (P5/32-large)
+        ])
+
+        # 3. Head (检测头): 负责输出类别和坐标
         # YOLOv8 使用解耦头 (Decoupled Head)
-        self.detect_head = Detect(nc=num_classes) 
+        self.detect_head = Detect(nc=num_classes, ch=(ch(256), ch(512), ch(1024)))  # Layer 22
 
     def forward(self, x):
         # 提取不同尺度的特征
-        features = self.backbone(x)
+        for i, m in enumerate(self.backbone):
+            x = m(x)
+            if i == 4:
+                p3 = x
+            elif i == 6:
+                p4 = x
+        p5 = x
+        n = self.neck
+        h12 = n[2](n[1]([n[0](p5), p4]))
+        h15 = n[5](n[4]([n[3](h12), p3]))
+        h18 = n[8](n[7]([n[6](h15), h12]))
+        h21 = n[11](n[10]([n[9](h18), p5]))
         # 输入检测头得到结果
-        return self.detect_head(features)
-    
-from ultralytics import YOLO
-
-# 加载模型
-model = YOLO('yolov8n.pt')
-# 这一行会把底层的 nn.Module 结构全部打印出来
-print(model.model)
\ No newline at end of file
+        return self.detect_head([h15, h18, h21])
+
+    def load_ultralytics_state_dict(self, state_dict):
+        """加载 ultralytics DetectionModel 的参数 (键名 model.<层号>.xxx)"""
+        mapped = {}
+        for k, v in state_dict.items():
+            _, i, rest = k.split('.', 2)
+            i = int(i)
+            if i < 10:
+                mapped[f'backbone.{i}.{rest}'] = v
+            elif i < 22:
+                mapped[f'neck.{i - 10}.{rest}'] = v
+            else:
+                mapped[f'detect_head.{rest}'] = v
+        self.load_state_dict(mapped)
+        return self
+
+    @classmethod
+    def from_checkpoint(cls, path):
+        """从 ultralytics 训练出来的 .pt 建网络 (规模、类别数、类别名都从 checkpoint 里读)"""
+        # checkpoint 里存的是 pickle 的模型对象，读取需要能 import ultralytics
+        ckpt = torch.load(path, map_location='cpu', weights_only=False)
+        src = (ckpt.get('ema') or ckpt['model']).float()
+        state_dict = src.state_dict()
+        model = cls(num_classes=src.yaml['nc'], scale=guess_scale(src.yaml, state_dict))
+        model.load_ultralytics_state_dict(state_dict)
+        model.detect_head.stride = src.stride.clone().float()
+        model.names = dict(src.names) if isinstance(src.names, dict) else dict(enumerate(src.names))
+        return model.eval()
+
+    def fuse(self):
+        """推理模式：BN 折进卷积，检测头只输出解码后的框；之后不能再训练"""
+        for m in self.modules():
+            if isinstance(m, Conv) and hasattr(m, 'bn'):
+                m.conv = fuse_conv_and_bn(m.conv, m.bn)
+                delattr(m, 'bn')
+                m.forward = m.forward_fuse
+        self.detect_head.inference_only = True
+        return self.eval().requires_grad_(False)
+
+
+def non_max_suppression(pred, conf_thres=0.25, iou_thres=0.45, max_det=300):
+    """
+    pred: 网络输出 (batch, 4 + nc, anchors)
+    返回每张图一个 (n, 6) 的张量：x1, y1, x2, y2, 置信度, 类别
+    """
+    import torchvision  # 装 ultralytics 时一起装的；只有后处理需要
+
+    if isinstance(pred, (list, tuple)):
+        pred = pred[0]
+    out = []
+    for p in pred.transpose(1, 2):
+        conf, cls = p[:, 4:].max(1)
+        keep = conf > conf_thres
+        box, conf, cls = p[keep, :4], conf[keep], cls[keep]
+        box = torch.cat((box[:, :2] - box[:, 2:] / 2, box[:, :2] + box[:, 2:] / 2), 1)  # xywh -> xyxy
+        i = torchvision.ops.batched_nms(box, conf, cls, iou_thres)[:max_det]
+        out.append(torch.cat((box[i], conf[i, None], cls[i, None].float()), 1))
+    return out
+
+
+def preprocess(img, size=IMG_SIZE):
+    """BGR 图片 -> letterbox 后的 (1, 3, size, size) 张量；返回 (张量, [new_w, new_h, left, top])"""
+    from letterbox_cache import letterbox
+    img, geom = letterbox(img, size)
+    x = torch.from_numpy(img[:, :, ::-1].transpose(2, 0, 1).copy()).float().div_(255)
+    return x.unsqueeze(0), geom
+
+
+def find_weights():
+    if WEIGHTS:
+        return WEIGHTS
+    found = sorted(glob.glob(WEIGHTS_GLOB), key=os.path.getmtime)
+    return found[-1] if found else None
+
+
+def benchmark(fn, x, warmup=WARMUP, runs=RUNS):
+    """返回 (中位数, p90) 延迟，单位毫秒"""
+    with torch.inference_mode():
+        for _ in range(warmup):
+            fn(x)
+        times = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            fn(x)
+            times.append((time.perf_counter() - t0) * 1000)
+    times.sort()
+    return statistics.median(times), times[min(len(times) - 1, int(len(times) * 0.9))]
+
+
+def main():
+    if TORCH_THREADS > 0:
+        torch.set_num_threads(TORCH_THREADS)
+    weights = find_weights()
+    if weights:
+        print(f"权重: {weights}")
+        model = YOLOv8_Model.from_checkpoint(weights)
+    else:
+        print(f"没找到 {WEIGHTS_GLOB}，用随机初始化的 yolov8{SCALE} 测速")
+        model = YOLOv8_Model(NUM_CLASSES, SCALE).eval()
+    n_params = sum(p.numel() for p in model.parameters())
+    print(f"规模: yolov8{model.scale}，类别数 {model.num_classes}，参数量 {n_params / 1e6:.2f}M，"
+          f"CPU 线程 {torch.get_num_threads()}")
+
+    x = torch.rand(BATCH_SIZE, 3, IMG_SIZE, IMG_SIZE)
+    with torch.inference_mode():
+        ref = model(x)[0]
+    results = [('未融合', benchmark(model, x))]
+
+    fused = model.fuse()  # 原地融合，之后 model 也是融合后的
+    with torch.inference_mode():
+        diff = (fused(x) - ref).abs().max().item()
+    results.append(('融合 Conv+BN', benchmark(fused, x)))
+    print(f"融合前后输出最大差: {diff:.2e}")
+
+    if weights:
+        from ultralytics import YOLO
+        yolo = YOLO(weights)
+        if PRINT_STRUCTURE:
+            # 这一行会把底层的 nn.Module 结构全部打印出来
+            print(yolo.model)
+        net = yolo.model.float().fuse(verbose=False).eval()
+        with torch.inference_mode():
+            out = net(x)
+        out = out[0] if isinstance(out, (list, tuple)) else out
+        if out.shape == ref.shape:
+            print(f"和 ultralytics 输出最大差: {(out - ref).abs().max().item():.2e}")
+        results.append(('ultralytics (fused)', benchmark(net, x)))
+
+    base = results[0][1][0]
+    print(f"\n输入 {BATCH_SIZE}x3x{IMG_SIZE}x{IMG_SIZE}，预热 {WARMUP} 次，计时 {RUNS} 次")
+    print(f"{'模型':<20} {'中位数 (ms)':>11} {'p90 (ms)':>9} {'加速':>6}")
+    for name, (med, p90) in results:
+        print(f"{name:<20} {med:11.1f} {p90:9.1f} {base / med:5.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+from itertools import chain
+import numpy as np
+
+# 多边形 -> YOLO 标签的批量转换 (json2yolo / json2yolo_isat 共用)
+# 一个文件 (或一批文件) 的所有多边形拼成一个 (P, 2) 的点数组，再用 offsets 记录每个多边形的起止位置，
+# 这样最小/最大值、归一化都只需要一次 NumPy 运算，不用每个 shape 建一次数组。
+
+LABEL_FORMATS = ('bbox', 'seg')
+
+
+def pack_polygons(polygons):
+    """
+    [[[x, y], ...], ...] -> (points (P, 2) float64, offsets (M + 1,) int64)
+    第 i 个多边形是 points[offsets[i]:offsets[i + 1]]，调用方需保证每个多边形至少一个点
+    """
+    lengths = np.fromiter((len(p) for p in polygons), dtype=np.int64, count=len(polygons))
+    offsets = np.zeros(len(polygons) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    points = np.array(list(chain.from_iterable(polygons)), dtype=np.float64).reshape(-1, 2)
+    return points, offsets
+
+
+def rect_to_polygon(points):
+    """两点矩形 (LabelMe rectangle / ISAT bbox) 展开成四个角点，分割标签至少要三个点"""
+    if len(points) != 2:
+        return points
+    (x1, y1), (x2, y2) = points
+    return [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
+
+
+def polygons_to_bbox(points, offsets, img_w, img_h):
+    """
+    每个多边形取外接矩形，转成归一化的 (x_center, y_center, w, h)，返回 (M, 4)
+    img_w / img_h 可以是标量，也可以是每个多边形各自的 (M,) 数组 (一批不同尺寸的文件一起算)
+    """
+    starts = offsets[:-1]
+    x_min = np.minimum.reduceat(points[:, 0], starts)
+    x_max = np.maximum.reduceat(points[:, 0], starts)
+    y_min = np.minimum.reduceat(points[:, 1], starts)
+    y_max = np.maximum.reduceat(points[:, 1], starts)
+
+    # 限制坐标在图片范围内 (防止画出界)
+    img_w = np.asarray(img_w, dtype=np.float64)
+    img_h = np.asarray(img_h, dtype=np.float64)
+    x_min = np.maximum(x_min, 0)
+    y_min = np.maximum(y_min, 0)
+    x_max = np.minimum(x_max, img_w)
+    y_max = np.minimum(y_max, img_h)
+
+    # 和原来逐个计算的公式、运算顺序完全一致，输出的数字逐位相同
+    dw = 1. / img_w
+    dh = 1. / img_h
+    boxes = np.empty((len(starts), 4), dtype=np.float64)
+    boxes[:, 0] = (x_min + x_max) / 2.0 * dw
+    boxes[:, 1] = (y_min + y_max) / 2.0 * dh
+    boxes[:, 2] = (x_max - x_min) * dw
+    boxes[:, 3] = (y_max - y_min) * dh
+    return boxes
+
+
+def polygons_to_seg(points, offsets, img_w, img_h):
+    """多边形顶点归一化到 0~1 (超出图片的部分截断)，返回 (P, 2)，仍按 offsets 切分"""
+    sizes = np.stack([np.broadcast_to(np.asarray(img_w, dtype=np.float64), len(offsets) - 1),
+                      np.broadcast_to(np.asarray(img_h, dtype=np.float64), len(offsets) - 1)], axis=1)
+    per_point = np.repeat(sizes, np.diff(offsets), axis=0)
+    return np.clip(points / per_point, 0.0, 1.0)
+
+
+def format_bbox_lines(class_ids, boxes):
+    return ''.join(f"{c} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n" for c, (x, y, w, h) in zip(class_ids, boxes.tolist()))
+
+
+def format_seg_lines(class_ids, seg_points, offsets):
+    lines = []
+    for c, start, end in zip(class_ids, offsets[:-1].tolist(), offsets[1:].tolist()):
+        coords = seg_points[start:end].ravel().tolist()
+        lines.append(f"{c} {' '.join(f'{v:.6f}' for v in coords)}\n")
+    return ''.join(lines)
+
+
+def make_label_text(class_ids, polygons, img_w, img_h, label_format='bbox'):
+    """
+    一张图的全部目标一次性转成 YOLO 标签文本；'bbox' 为检测框，'seg' 为 YOLO-seg 多边形
+    返回 (文本, 归一化检测框 (M, 4))，检测框两种格式都会算，供打包分片/标签缓存使用
+    """
+    if label_format not in LABEL_FORMATS:
+        raise ValueError(f"未知的 label_format: {label_format}，可选: {LABEL_FORMATS}")
+    points, offsets = pack_polygons(polygons)
+    boxes = polygons_to_bbox(points, offsets, img_w, img_h)
+    if label_format == 'bbox':
+        return format_bbox_lines(class_ids, boxes), boxes
+    points, offsets = pack_polygons([rect_to_polygon(p) for p in polygons])
+    return format_seg_lines(class_ids, polygons_to_seg(points, offsets, img_w, img_h), offsets), boxes